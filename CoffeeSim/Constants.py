@@ -16,6 +16,7 @@ class Unlocalized(object):
     ABS_ZERO = -273
     WATER_FREEZE_PT = 0
     WATER_EVAPORATE_PT = 100
+    WATER_HEAT_CAPACITY = 4.186 # J/(g*K); close enough to J/(mL*K) for our purposes
     
     VOLUME = 'volume'
     VOLUME_UNIT = 'mL'
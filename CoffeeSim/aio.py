@@ -0,0 +1,126 @@
+"""asyncio support - coffeemakers brewing as coroutines, so that many orders can interleave on a single event loop.
+
+Each installed component type is guarded by an awaitable, capacity-limited ComponentResource; abrew() awaits
+the resource of every stage before running it, so orders only wait for the parts of the machine they actually need;
+within a resource, each order claims the least loaded grinder or heater (see scheduling.UnitScheduler).
+The stages themselves run in the loop's default executor, so blocking calls (e.g. the sound effects) do not stall the loop.
+
+Requires Python 3.5+.
+"""
+
+import asyncio
+import functools
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim.models.generic import GenericCoffeemaker
+
+
+class ComponentResource(object):
+    """An awaitable, capacity-limited resource guarding a group of components.
+
+    Use as `async with resource as components:`; waits until one of the resource's units is free.
+    """
+
+    def __init__(self, components=None, capacity=None, *args, **kwargs):
+        self.components = components or []
+        self.capacity = capacity or max(1, len(self.components))
+        self.in_use = 0
+        self._semaphore = self._loop = None # created lazily, so that it belongs to the loop actually using it
+
+    @property
+    def semaphore(self):
+        loop = asyncio.get_event_loop()
+        if self._loop is not loop: self._semaphore, self._loop = asyncio.Semaphore(self.capacity), loop
+        return self._semaphore
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        self.in_use += 1
+        return self.components
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        self.in_use -= 1
+        self.semaphore.release()
+
+
+class AsyncCoffeemakerMixin(object):
+    """Adds the asynchronous abrew() counterpart of brew() to a coffeemaker model."""
+
+    # Wall-clock seconds awaited per second of a stage's modelled duration (see the components' duration models);
+    # with the default of 0, stages merely yield to the loop.
+    time_scale = 0
+
+    # Water sources are drained in place, so only one order may draw water at a time; other parts are shared by capacity.
+    resource_capacities = {const.COMP_WATER: 1}
+
+    @property
+    def resources(self):
+        resources = getattr(self, '_resources', None)
+        if resources is None:
+            resources = self._resources = {
+                comptype: ComponentResource(components=components, capacity=self.resource_capacities.get(comptype))
+                for (comptype, components) in self.installed_components.items()
+            }
+        return resources
+
+    async def abrew(self, preset=None, coffee_volume=None, timeout=None, *args, **kwargs):
+        """Asynchronous brewing simulation; see brew().
+
+        The supplies are reserved up front as in brew(). Cancelling the returned coroutine (or exceeding the timeout),
+        like any failure, releases the resources held by the order and hands back whatever it has not drawn yet,
+        but does not return any water or beans it has already used up.
+
+        :param timeout: optional; seconds after which the order is abandoned with an asyncio.TimeoutError.
+        """
+        if timeout is not None: return await asyncio.wait_for(self.abrew(preset=preset, coffee_volume=coffee_volume, **kwargs), timeout)
+        if not self.powered: return None
+
+        plan = self.plan(preset)
+        coffee_volume = coffee_volume or plan.volume
+
+        with self.reserve(volume=coffee_volume, amount=plan.dose, **kwargs) as reservation:
+            async with self.resources[const.COMP_WATER] as sources:
+                water = await self._run_stage(self.get_water, volume=coffee_volume, reservation=reservation, **kwargs)
+                await self._pause(next(iter(sources)).draw_duration(coffee_volume))
+
+            async with self.resources[const.COMP_GRINDER] as grinders:
+                grinder = self.unit_scheduler.claim(self.pick_grinder(grinders=grinders))
+                try:
+                    grounds = await self._run_stage(self.get_grounds, strength=plan.strength, amount=plan.dose, grinder=grinder,
+                                                    reservation=reservation, **kwargs)
+                    grind_time = grinder.grind_duration(items={grounds: grounds.amount}) if grounds else 0
+                    self.unit_scheduler.book(grinder, grind_time)
+                    await self._pause(grind_time)
+                finally: self.unit_scheduler.release(grinder)
+
+            async with self.resources[const.COMP_HEATER] as heaters:
+                heater = self.unit_scheduler.claim(self.pick_heater(heaters=heaters))
+                try:
+                    heat_time = heater.heat_duration(items=[water], target_temp=self.brew_temperature)
+                    self.unit_scheduler.book(heater, heat_time)
+                    extract, spent_grounds = await self._run_stage(self.get_extract, grounds=grounds, medium=water, brew_name=plan.brew_name,
+                                                                   pressure=plan.pressure, contact_time=plan.contact_time, heater=heater, **kwargs)
+                    await self._pause(heat_time + self.pressure2time.get(plan.pressure, self.default_time))
+                finally: self.unit_scheduler.release(heater)
+
+            self.dispose_grounds(grounds=spent_grounds, reservation=reservation, **kwargs)
+
+        coffee = await self._run_stage(self.handle_extras, brew=extract, extras=plan.extras, plan=plan, **kwargs)
+        await self._pause(len(plan.extras or ()) * self.extra_time)
+
+        return coffee
+
+    async def _run_stage(self, stage, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, functools.partial(stage, *args, **kwargs))
+
+    async def _pause(self, duration):
+        await asyncio.sleep(duration * self.time_scale)
+
+
+class AsyncGenericCoffeemaker(AsyncCoffeemakerMixin, GenericCoffeemaker):
+    """A GenericCoffeemaker supporting abrew()."""
+
+AsyncCoffeemaker = AsyncGenericCoffeemaker # alias
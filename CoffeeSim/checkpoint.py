@@ -0,0 +1,261 @@
+"""Snapshots of the physical state of coffeemakers - for checkpointing long simulations and forking what-if runs off a warm machine.
+
+A snapshot holds what a machine physically is and holds: its class, machine_id, power state and configuration,
+and for each installed component its class, configuration (instance-level capacity, rates and power) and contents -
+tank liquids with their volumes, temperatures and (for coffee) caffeine content and extras, container bean lots with their dates, the grounds in the grounds bins
+and the volume filtered since the filters' last descaling. It does NOT hold the event sink,
+the metrics instrumentation or the water source index; those are re-attached or rebuilt on restore.
+
+Snapshots are a compact, versioned binary format: the MAGIC header and FORMAT_VERSION, a table of the class paths
+and names used, then fixed-size struct records referring to the table. Restoring builds the machine and its components
+without running their constructors, then calls the machine's connect() to re-create its interface.
+
+Site-wide supplies (see the shared_supply module) live outside of the machines, so machines using them cannot be snapshotted.
+"""
+
+import datetime
+import importlib
+import struct
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim import extraction
+
+from CoffeeSim.components import water_supply, bean_supply, shared_supply
+
+MAGIC = b'CSSN'
+FORMAT_VERSION = 3
+
+NO_STRING = 0xFFFF # string table index standing for None
+
+# Instance-level overrides of these numeric attributes are kept as the components' configuration:
+CONFIG_FIELDS = ('capacity', 'pour_rate', 'grind_rate', 'grind_size', 'grind_spread', 'power', 'loss_coefficient', 'ambient_temp')
+# ...and so are these, the levels of the components holding plain amounts rather than contents:
+LEVEL_FIELDS = ('grounds', 'filtered')
+
+# Component kinds, by how their contents are stored:
+KIND_PLAIN, KIND_TANK, KIND_COMPACT_TANK, KIND_CONTAINER = range(4)
+
+_HEADER = struct.Struct('<4sBH') # magic, format version, string count
+_STRING = struct.Struct('<H') # length, followed by the UTF-8 bytes
+_MACHINE = struct.Struct('<HHq?HH') # machine type, materials module, machine id, powered, water policy, component type count
+_SLOT = struct.Struct('<HI') # component type, component count
+_COMPONENT = struct.Struct('<HBBI') # component type, kind, config field count, content count
+_CONFIG = struct.Struct('<Hd') # field name, value
+_LIQUID = struct.Struct('<HdddHH') # liquid type, volume, temperature, caffeine content, display name override, extra count
+_EXTRA = struct.Struct('<H') # an extra of a liquid, as a string; the extras follow their liquid
+_LOTS = struct.Struct('<H') # consumption order
+_LOT = struct.Struct('<HddII') # bean type, amount, caffeine density, roast date, expiry date (as ordinals; 0 for None)
+
+
+def _path(obj):
+    return "{module}:{name}".format(module=obj.__module__, name=getattr(obj, '__qualname__', obj.__name__))
+
+_resolved = {}
+
+def _resolve(path):
+    """Imports the class (or, for paths without a colon, the module) a string table entry names."""
+    resolved = _resolved.get(path)
+    if resolved is None:
+        module, _, name = path.partition(':')
+        resolved = importlib.import_module(module)
+        for attr in (name.split('.') if name else ()): resolved = getattr(resolved, attr)
+        _resolved[path] = resolved
+    return resolved
+
+
+class _StringTable(object):
+    def __init__(self):
+        self.strings = []
+        self.indices = {}
+
+    def __call__(self, string):
+        if string is None: return NO_STRING
+        idx = self.indices.get(string)
+        if idx is None:
+            idx = self.indices[string] = len(self.strings)
+            self.strings.append(string)
+        return idx
+
+
+def _kind(component):
+    if isinstance(component, (shared_supply.SharedWaterLine, shared_supply.SharedBeanStore)):
+        raise TypeError("Site-wide supplies cannot be snapshotted; {comp} is not part of the machine.".format(comp=type(component).__name__))
+    if isinstance(component, water_supply.CompactTank): return KIND_COMPACT_TANK
+    if isinstance(component, water_supply.Tank): return KIND_TANK
+    if isinstance(component, bean_supply.Container): return KIND_CONTAINER
+    return KIND_PLAIN
+
+
+def _liquid_record(strings, liquid_type, volume, temperature, liquid=None):
+    extras = getattr(liquid, 'extras', None) or ()
+    if not all(isinstance(extra, str) for extra in extras):
+        raise TypeError("Only text extras can be snapshotted; {liquid} has others.".format(liquid=liquid_type.__name__))
+    name = vars(liquid).get('display_name') if liquid is not None else None
+    record = _LIQUID.pack(strings(_path(liquid_type)), volume, temperature, getattr(liquid, 'caffeine_content', 0), strings(name), len(extras))
+    return record + b''.join(_EXTRA.pack(strings(extra)) for extra in extras)
+
+
+def _restore_liquids(data, offset, strings, count):
+    liquids = []
+    for _ in range(count):
+        liquid_idx, volume, temp, caffeine, name_idx, extra_count = _LIQUID.unpack_from(data, offset)
+        offset += _LIQUID.size
+        extras = [strings[extra_idx] for (extra_idx,) in _EXTRA.iter_unpack(data[offset:offset + extra_count * _EXTRA.size])]
+        offset += extra_count * _EXTRA.size
+        liquids.append((_resolve(strings[liquid_idx]), volume, temp, caffeine, None if name_idx == NO_STRING else strings[name_idx], extras))
+    return liquids, offset
+
+
+def _ordinal(date): return date.toordinal() if date else 0
+
+def _date(ordinal): return datetime.date.fromordinal(ordinal) if ordinal else None
+
+
+def snapshot(coffeemaker, *args, **kwargs):
+    """Captures the physical state of the coffeemaker.
+
+    :returns: the snapshot, as bytes; see restore().
+    """
+    strings = _StringTable()
+    machine_type = type(coffeemaker)
+    policy = coffeemaker.water_policy
+
+    slots = [(comptype, components) for (comptype, components) in sorted(coffeemaker.installed_components.items())
+             if components is not None]
+    records = [_MACHINE.pack(strings(_path(machine_type)), strings(coffeemaker.materials.__name__), coffeemaker.machine_id,
+                             bool(coffeemaker.powered), strings(policy if policy is None or isinstance(policy, str) else _path(type(policy))), len(slots))]
+
+    for (comptype, components) in slots:
+        records.append(_SLOT.pack(strings(comptype), len(components)))
+        for component in components: records.extend(_component_records(component, strings))
+
+    header = [_HEADER.pack(MAGIC, FORMAT_VERSION, len(strings.strings))]
+    for string in strings.strings:
+        encoded = string.encode('utf-8')
+        header.append(_STRING.pack(len(encoded)) + encoded)
+    return b''.join(header + records)
+
+
+def _component_records(component, strings):
+    kind = _kind(component)
+    config = [(name, extraction.GRIND_SIZES.get(value, value)) for (name, value) in vars(component).items() if name in CONFIG_FIELDS or name in LEVEL_FIELDS] # named grind sizes by their sizes
+    config = [(name, value) for (name, value) in config if isinstance(value, (int, float)) and not isinstance(value, bool)]
+
+    if kind == KIND_TANK:
+        contents = [_liquid_record(strings, type(liquid), liquid.volume, liquid.temperature, liquid=liquid) for liquid in component.contents]
+    elif kind == KIND_COMPACT_TANK:
+        columns = component.contents
+        contents = [_liquid_record(strings, liquid_type, volume, temp)
+                    for (liquid_type, volume, temp) in zip(columns.types, columns.volumes, columns.temperatures) if volume > 0]
+    elif kind == KIND_CONTAINER:
+        lots = component.contents
+        contents = [_LOTS.pack(strings(lots.order))]
+        contents += [_LOT.pack(strings(_path(lot.bean_type)), lot.amount, lot.caffeine_density, _ordinal(lot.roast_date), _ordinal(lot.expires))
+                     for lot in lots if lot.amount > 0]
+    else: contents = []
+
+    count = len(contents) - (1 if kind == KIND_CONTAINER else 0)
+    records = [_COMPONENT.pack(strings(_path(type(component))), kind, len(config), count)]
+    records += [_CONFIG.pack(strings(name), value) for (name, value) in config]
+    return records + contents
+
+
+def restore(data, event_sink=None, *args, **kwargs):
+    """Rebuilds a working coffeemaker from a snapshot; each call returns a separate, independent machine.
+
+    :param data: a snapshot, as returned by snapshot().
+    :param event_sink: optional; helpers.EventSink to send the restored machine's events to.
+    :returns: the restored coffeemaker.
+    """
+    data = memoryview(data)
+    magic, version, string_count = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC: raise ValueError("Not a coffeemaker snapshot!")
+    if version != FORMAT_VERSION: raise ValueError("Unsupported snapshot format version: {version}.".format(version=version))
+
+    offset = _HEADER.size
+    strings = []
+    for _ in range(string_count):
+        (length,) = _STRING.unpack_from(data, offset)
+        offset += _STRING.size
+        strings.append(bytes(data[offset:offset + length]).decode('utf-8'))
+        offset += length
+
+    machine_idx, materials_idx, machine_id, powered, policy_idx, slot_count = _MACHINE.unpack_from(data, offset)
+    offset += _MACHINE.size
+
+    machine_type = _resolve(strings[machine_idx])
+    coffeemaker = machine_type.__new__(machine_type)
+
+    materials = _resolve(strings[materials_idx])
+    if materials is not machine_type.materials: coffeemaker.materials = materials
+    if machine_id != machine_type.machine_id: coffeemaker.machine_id = machine_id
+    policy = None if policy_idx == NO_STRING else strings[policy_idx]
+    if policy is not None and ':' in policy: policy = _resolve(policy)() # a policy instance, rather than a WATER_POLICIES key
+    if policy != machine_type.water_policy: coffeemaker.water_policy = policy
+
+    installed = dict.fromkeys(machine_type.component_slots)
+    for _ in range(slot_count):
+        comptype_idx, count = _SLOT.unpack_from(data, offset)
+        offset += _SLOT.size
+        components = installed[strings[comptype_idx]] = []
+        for _ in range(count):
+            component, offset = _restore_component(data, offset, strings)
+            components.append(component)
+    coffeemaker.installed_components = installed
+
+    if event_sink is not None: coffeemaker.event_sink = event_sink
+    coffeemaker.connect()
+    coffeemaker.powered = powered
+    return coffeemaker
+
+
+def _restore_component(data, offset, strings):
+    type_idx, kind, config_count, count = _COMPONENT.unpack_from(data, offset)
+    offset += _COMPONENT.size
+    component_type = _resolve(strings[type_idx])
+    component = component_type.__new__(component_type)
+
+    for _ in range(config_count):
+        name_idx, value = _CONFIG.unpack_from(data, offset)
+        offset += _CONFIG.size
+        setattr(component, strings[name_idx], value)
+
+    if kind in (KIND_TANK, KIND_COMPACT_TANK):
+        liquids, offset = _restore_liquids(data, offset, strings, count)
+        if kind == KIND_TANK:
+            component.contents = set()
+            for (liquid_type, volume, temp, caffeine, name, extras) in liquids:
+                liquid = liquid_type(volume=volume, temperature=temp)
+                if caffeine: liquid.caffeine_content = caffeine
+                if extras: liquid.extras = extras
+                if name is not None: liquid.display_name = name
+                component.contents.add(liquid)
+        else:
+            columns = water_supply.LiquidColumns()
+            for (liquid_type, volume, temp, _, _, _) in liquids: columns.add(liquid_type, volume, temperature=temp)
+            component.contents = columns
+
+    elif kind == KIND_CONTAINER:
+        (order_idx,) = _LOTS.unpack_from(data, offset)
+        offset += _LOTS.size
+        lots = bean_supply.LotQueue(order=strings[order_idx])
+        lots.extend(bean_supply.BeanLot(amount=amount, bean_type=_resolve(strings[bean_idx]), caffeine_density=density,
+                                        roast_date=_date(roasted), expires=_date(expires))
+                    for (bean_idx, amount, density, roasted, expires) in _LOT.iter_unpack(data[offset:offset + count * _LOT.size]))
+        offset += count * _LOT.size
+        component.contents = lots
+
+    return component, offset
+
+
+def save(coffeemaker, path, *args, **kwargs):
+    """Writes a snapshot of the coffeemaker to a local file; see snapshot()."""
+    with open(path, 'wb') as snapshot_file: snapshot_file.write(snapshot(coffeemaker))
+    return path
+
+
+def load(path, event_sink=None, *args, **kwargs):
+    """Restores a coffeemaker from a snapshot file; see restore()."""
+    with open(path, 'rb') as snapshot_file: return restore(snapshot_file.read(), event_sink=event_sink)
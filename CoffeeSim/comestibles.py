@@ -1,26 +1,107 @@
 # -*- coding: utf-8 -*-
 """Holds definitions of unprocessed materials and the delicious brews made with them."""
 
+import bisect
+
 import CoffeeSim.Constants as Constants
 const = Constants.Unlocalized
 
+from CoffeeSim import extraction
+
+class ThresholdIndex(object):
+    """Maps numeric values to descriptors by a list of thresholds, precomputed for lookups by bisection.
+    
+    A value gets the descriptor of the last threshold, in list order, that it exceeds - or the default, if none.
+    The thresholds need not be sorted; the index resolves them into sorted bands once, up front.
+    """
+    
+    def __init__(self, thresholds, default, *args, **kwargs):
+        """
+        :param thresholds: Iterable of (threshold value, descriptor) pairs.
+        :param default: descriptor of values not exceeding any of the thresholds.
+        """
+        thresholds = list(thresholds)
+        self.bounds = sorted(set(value for (value, _) in thresholds))
+        
+        # band N holds the values exceeding exactly the N lowest bounds:
+        self.labels = [default]
+        for upper_bound in self.bounds:
+            exceeded = [desc for (value, desc) in thresholds if value <= upper_bound]
+            self.labels.append(exceeded[-1])
+        
+    def band(self, value):
+        """Returns the index of the band the value falls in."""
+        return bisect.bisect_left(self.bounds, value)
+        
+    def describe(self, value):
+        return self.labels[self.band(value)]
+        
+        
+_warmth_indices = {}
+        
+def warmth_index(freezing_point=const.WATER_FREEZE_PT, evaporation_point=const.WATER_EVAPORATE_PT):
+    """Returns the (shared) ThresholdIndex of warmth descriptors for the given phase transition points."""
+    index = _warmth_indices.get((freezing_point, evaporation_point))
+    if index is None: index = _warmth_indices[(freezing_point, evaporation_point)] = ThresholdIndex(
+        [
+            (freezing_point, const.WARMTH_ICY), 
+            (((const.ROOMTEMP - freezing_point) / 2), const.WARMTH_COLD), 
+            ((const.ROOMTEMP - 5), const.WARMTH_MED), 
+            ((const.ROOMTEMP + 15), const.WARMTH_WARM), 
+            (((evaporation_point - const.ROOMTEMP) / 2), const.WARMTH_HOT), 
+            (evaporation_point, const.WARMTH_BOILING)
+        ],
+        default=const.WARMTH_FROZEN,
+    )
+    return index
+    
+STRENGTH_INDEX = ThresholdIndex(
+    [
+        (5, const.STRENGTH_LOW), 
+        (50, const.STRENGTH_MEDIUM), 
+        (150, const.STRENGTH_HIGH),
+    ],
+    default=const.STRENGTH_DECAF,
+)
+
+def describe_warmth(temperature, freezing_point=const.WATER_FREEZE_PT, evaporation_point=const.WATER_EVAPORATE_PT):
+    """Returns the warmth descriptor for a liquid of the given temperature and phase transition points."""
+    return warmth_index(freezing_point, evaporation_point).describe(temperature)
+    
+def describe_strength(caffeine_content):
+    """Returns the strength descriptor for a brew of the given caffeine content."""
+    return STRENGTH_INDEX.describe(caffeine_content)
+    
+    
+# Volume-independent parts of the string representations of liquids, by class, name, state bands and extras:
+_renderings = {}
+    
+
 class CaffeineSource(object):
-    extract_efficiency = 10
+    extract_efficiency = 10 # percent; used unless the extraction can be modelled, see extract()
+    particle_sizes = None # an extraction.ParticleSizes, for grounds ground by a grinder
     
-    def __init__(self, amount=1, caffeine_density=1, *args, **kwargs):
+    def __init__(self, amount=1, caffeine_density=1, particle_sizes=None, *args, **kwargs):
         if amount < 0: raise ValueError(
             "Amount should be a positive value! Value received: {val}.".format(val=amount)
         )
         if caffeine_density < 0: caffeine_density = 0 # clip to a more sensible value
         self.amount = amount
         self.caffeine_density = caffeine_density
+        if particle_sizes is not None: self.particle_sizes = particle_sizes
         
-    def extract(self, extract_efficiency=NotImplemented, *args, **kwargs):
+    def extract(self, extract_efficiency=NotImplemented, temperature=None, pressure=None, contact_time=None, *args, **kwargs):
         """Handles caffeine extraction.
         
-        :param extract_efficiency: optional override; how much of the total caffeine is extracted.
+        For sources with a particle-size distribution, extracted with the water temperature given, 
+        the efficiency follows from the extraction model (see the extraction module); otherwise, it is the fixed extract_efficiency.
+        
+        :param extract_efficiency: optional override; how much of the total caffeine is extracted, in percent.
+        :param temperature: optional; temperature of the water.
+        :param pressure: optional; a preset pressure level, or a numeric pressure in bars.
+        :param contact_time: optional; contact time of the water with the source, in seconds.
         """
-        extract_efficiency = self.extract_efficiency if extract_efficiency is NotImplemented else extract_efficiency
+        extract_efficiency = self.extraction_efficiency(temperature, pressure, contact_time) if extract_efficiency is NotImplemented else extract_efficiency
         
         curr_caffeine = self.amount * self.caffeine_density
         extracted_caffeine = curr_caffeine * 0.01 * extract_efficiency
@@ -30,6 +111,13 @@ class CaffeineSource(object):
         
         return extracted_caffeine
         
+    def extraction_efficiency(self, temperature=None, pressure=None, contact_time=None, *args, **kwargs):
+        """How much of the caffeine, in percent, an extraction under the given conditions takes; see extract()."""
+        if self.particle_sizes is None or temperature is None: return self.extract_efficiency
+        return 100 * extraction.extraction_yield(self.particle_sizes, temperature, 
+                                                 pressure=const.PRESSURE_MEDIUM if pressure is None else pressure, 
+                                                 contact_time=extraction.REFERENCE_CONTACT_TIME if contact_time is None else contact_time)
+        
     def __str__(self): return ("{name} (Amount: {amt}) <Caffeine: {caf} units>"
                                 .format(
                                         name=type(self).__name__, 
@@ -41,19 +129,20 @@ class CaffeineSource(object):
 class CoffeeBeans(CaffeineSource):
     """Like coffee grounds, except whole. Also, can be ground."""
     
-    def grind(self, amount=0, *args, **kwargs):
+    def grind(self, amount=0, particle_sizes=None, *args, **kwargs):
         """Handles grinding a specified amount of beans into grounds.
         
         :param amount: amount of beans to grind. 
             If not specified, won't grind any. 
             If provided value is greater than the available amount, grinds down all available beans.
+        :param particle_sizes: optional; the extraction.ParticleSizes of the grounds, as set up on the grinder.
             
         :returns: a dict of objects existing after grinding the beans (i.e. remaining beans and/or created grounds) under string constant keys
         """
         available_amt = self.amount
         ground_amt = min(amount, available_amt)
         
-        grounds = CoffeeGrounds(amount=ground_amt, caffeine_density=self.caffeine_density) if ground_amt else None
+        grounds = CoffeeGrounds(amount=ground_amt, caffeine_density=self.caffeine_density, particle_sizes=particle_sizes) if ground_amt else None
         
         after_ground = {}
         
@@ -81,7 +170,17 @@ class Liquid(object):
     evaporation_point = const.WATER_EVAPORATE_PT
     
     @property
-    def description(self): return ("{} ".format(" ".join(map(str, sorted(self.descriptors))))) if self.descriptors else ""
+    def description(self): 
+        descriptors = self.update_state()
+        return ("{} ".format(" ".join(map(str, sorted(descriptors))))) if descriptors else ""
+    
+    @property
+    def temperature(self): return self._temperature
+    
+    @temperature.setter
+    def temperature(self, value):
+        self._temperature = value
+        self._bands = None # the descriptors are recomputed on the next update_state()
     
     def __init__(self, volume=Constants.DEFAULT_VOLUME, temperature=const.ROOMTEMP, *args, **kwargs):
         if volume <= 0: raise ValueError(
@@ -102,35 +201,37 @@ class Liquid(object):
         self.descriptors = set()
         
     def update_state(self):
-        descriptors = set()
-        
-        warmth = self.temperature
-        warmth_desc = const.WARMTH_FROZEN
-        temp_thresholds = [
-                    (self.freezing_point, const.WARMTH_ICY), 
-                    (((const.ROOMTEMP - self.freezing_point) / 2), const.WARMTH_COLD), 
-                    ((const.ROOMTEMP - 5), const.WARMTH_MED), 
-                    ((const.ROOMTEMP + 15), const.WARMTH_WARM), 
-                    (((self.evaporation_point - const.ROOMTEMP) / 2), const.WARMTH_HOT), 
-                    (self.evaporation_point, const.WARMTH_BOILING)
-                    ]
-        
-        for threshold in temp_thresholds:
-            if self.temperature > threshold[0]: warmth_desc = threshold[1]
-            
-        descriptors |= {warmth_desc}
+        """Updates the descriptors, if the state changed since the last update."""
+        if self._bands is not None: return self.descriptors
         
-        self.descriptors = descriptors # only update the whole description all at once, to ensure data integrity
-        return descriptors
+        index = warmth_index(self.freezing_point, self.evaporation_point)
+        warmth_band = index.band(self.temperature)
+        
+        self._bands = (warmth_band,)
+        self.descriptors = {index.labels[warmth_band]} # only update the whole description all at once, to ensure data integrity
+        return self.descriptors
+        
+    def rendering(self):
+        """Returns the parts of the string representation before and after the volume; cached, as they only depend
+        on the class, the name, the state bands and the extras.
+        """
+        self.update_state()
+        key = (type(self), self.display_name, self._bands, self._extras_key())
+        rendering = _renderings.get(key)
+        if rendering is None: rendering = _renderings[key] = self._render()
+        return rendering
+        
+    def _extras_key(self): return ()
+        
+    def _render(self):
+        return (
+            "{desc}{name} (".format(desc=(", ".join(sorted(self.descriptors)) + (" " if self.descriptors else "")), name=self.display_name),
+            "{unit})".format(unit=const.VOLUME_UNIT),
+        )
     
     def __str__(self): 
-        self.update_state()
-        return "{desc}{name} ({volume}{unit})".format(
-                                                    desc=(", ".join(sorted(self.descriptors)) + (" " if self.descriptors else "")), 
-                                                    name=self.display_name, 
-                                                    volume=self.volume, 
-                                                    unit=const.VOLUME_UNIT,
-                                            )
+        head, tail = self.rendering()
+        return "{head}{volume}{tail}".format(head=head, volume=self.volume, tail=tail)
     
 class Water(Liquid):
     display_name = const.LOC_WATER
@@ -138,6 +239,14 @@ class Water(Liquid):
 class Coffee(Liquid):
     display_name = const.LOC_COFFEE
     
+    @property
+    def caffeine_content(self): return self._caffeine_content
+    
+    @caffeine_content.setter
+    def caffeine_content(self, value):
+        self._caffeine_content = value
+        self._bands = None
+    
     def __init__(self, 
                  volume=Constants.DEFAULT_VOLUME, 
                  temperature=const.ROOMTEMP, 
@@ -151,30 +260,27 @@ class Coffee(Liquid):
         if name_override is not NotImplemented: self.display_name = name_override
         self.extras = extras or []
         
+    def add_extra(self, extra, *args, **kwargs):
+        """Records an extra added to the brew, e.g. crema."""
+        self.extras.append(extra)
+        
     def update_state(self):
+        if self._bands is not None: return self.descriptors
         descriptors = super(Coffee, self).update_state()
         
-        strength = self.caffeine_content
-        strength_desc = const.STRENGTH_DECAF
-        
-        strength_thresholds = [
-                              (5, const.STRENGTH_LOW), 
-                              (50, const.STRENGTH_MEDIUM), 
-                              (150, const.STRENGTH_HIGH),
-                              ]
+        strength_band = STRENGTH_INDEX.band(self.caffeine_content)
         
-        for threshold in strength_thresholds:
-            if strength > threshold[0]: strength_desc = threshold[1]
+        self._bands += (strength_band,)
+        descriptors |= {STRENGTH_INDEX.labels[strength_band]}
+        return descriptors
         
-        descriptors |= {strength_desc}
+    def _extras_key(self): return tuple(self.extras)
         
-    def __str__(self):
-        base_representation = super(Coffee, self).__str__()
+    def _render(self):
+        head, tail = super(Coffee, self)._render()
         extras_desc = []
         if self.extras: extras_desc = [str(extra) for extra in self.extras]
         
         extras_desc = " with {}".format(", ".join(extras_desc)) if extras_desc else ""
         
-        return base_representation + extras_desc
-        
-    
\ No newline at end of file
+        return head, tail + extras_desc
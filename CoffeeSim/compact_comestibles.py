@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""Memory-lean variants of the comestibles module classes.
+
+Same class names, public attributes and string representations, but slotted (i.e. no per-instance __dict__),
+with the descriptor sets and extras shared between all instances describing the same thing (flyweights).
+Meant as a drop-in replacement wherever millions of drinks are held in memory, e.g. as a coffeemaker's materials.
+
+Note that the shared values are immutable: descriptors are frozensets and extras are tuples,
+so extras have to be added through Coffee.add_extra() rather than appended in place.
+"""
+
+import sys
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim.comestibles import describe_warmth, describe_strength
+
+from CoffeeSim import extraction
+
+try: intern = sys.intern
+except AttributeError: pass # Python 2 - a builtin
+
+
+_descriptor_sets = {}
+_extras_tuples = {}
+_renderings = {} # see comestibles.Liquid.rendering()
+
+def descriptor_set(*descriptors):
+    """Returns the shared frozenset of the given descriptors, with the descriptor strings interned."""
+    shared = _descriptor_sets.get(descriptors)
+    if shared is None: shared = _descriptor_sets[descriptors] = frozenset(intern(str(desc)) for desc in descriptors)
+    return shared
+
+def extras_tuple(extras=None):
+    """Returns the shared tuple holding the given extras."""
+    extras = tuple(extras or ())
+    return _extras_tuples.setdefault(extras, extras)
+
+
+class CaffeineSource(object):
+    __slots__ = ('amount', 'caffeine_density', 'particle_sizes')
+    extract_efficiency = 10
+
+    def __init__(self, amount=1, caffeine_density=1, particle_sizes=None, *args, **kwargs):
+        if amount < 0: raise ValueError(
+            "Amount should be a positive value! Value received: {val}.".format(val=amount)
+        )
+        if caffeine_density < 0: caffeine_density = 0 # clip to a more sensible value
+        self.amount = amount
+        self.caffeine_density = caffeine_density
+        self.particle_sizes = particle_sizes
+
+    def extract(self, extract_efficiency=NotImplemented, temperature=None, pressure=None, contact_time=None, *args, **kwargs):
+        """Handles caffeine extraction; see comestibles.CaffeineSource.extract()."""
+        extract_efficiency = self.extraction_efficiency(temperature, pressure, contact_time) if extract_efficiency is NotImplemented else extract_efficiency
+
+        curr_caffeine = self.amount * self.caffeine_density
+        extracted_caffeine = curr_caffeine * 0.01 * extract_efficiency
+        self.caffeine_density = (curr_caffeine - extracted_caffeine) / self.amount
+
+        return extracted_caffeine
+
+    def extraction_efficiency(self, temperature=None, pressure=None, contact_time=None, *args, **kwargs):
+        """See comestibles.CaffeineSource.extraction_efficiency()."""
+        if self.particle_sizes is None or temperature is None: return self.extract_efficiency
+        return 100 * extraction.extraction_yield(self.particle_sizes, temperature,
+                                                 pressure=const.PRESSURE_MEDIUM if pressure is None else pressure,
+                                                 contact_time=extraction.REFERENCE_CONTACT_TIME if contact_time is None else contact_time)
+
+    def __str__(self): return ("{name} (Amount: {amt}) <Caffeine: {caf} units>"
+                                .format(
+                                        name=type(self).__name__,
+                                        amt=self.amount,
+                                        caf=self.caffeine_density * self.amount,
+                                        ))
+
+
+class CoffeeBeans(CaffeineSource):
+    """Like coffee grounds, except whole. Also, can be ground."""
+    __slots__ = ()
+
+    def grind(self, amount=0, particle_sizes=None, *args, **kwargs):
+        """Handles grinding a specified amount of beans into grounds; see comestibles.CoffeeBeans.grind()."""
+        available_amt = self.amount
+        ground_amt = min(amount, available_amt)
+
+        after_ground = {}
+        if ground_amt: after_ground[const.MAT_GROUNDS] = CoffeeGrounds(amount=ground_amt, caffeine_density=self.caffeine_density, particle_sizes=particle_sizes)
+        if ground_amt < available_amt: after_ground[const.MAT_BEANS] = self
+
+        self.amount = available_amt - ground_amt
+        return after_ground
+
+
+class CoffeeGrounds(CoffeeBeans):
+    """Like coffee beans, except ground."""
+    __slots__ = ()
+    extract_efficiency = 90
+
+
+class Liquid(object):
+    __slots__ = ('volume', 'temperature')
+    display_name = const.LOC_LIQUID
+
+    freezing_point = const.WATER_FREEZE_PT
+    evaporation_point = const.WATER_EVAPORATE_PT
+
+    @property
+    def description(self): return ("{} ".format(" ".join(map(str, sorted(self.descriptors))))) if self.descriptors else ""
+
+    @property
+    def descriptors(self): return self.update_state()
+
+    def __init__(self, volume=Constants.DEFAULT_VOLUME, temperature=const.ROOMTEMP, *args, **kwargs):
+        if volume <= 0: raise ValueError(
+            "Liquids must have a positive, nonzero volume! Value received: {val}.".format(val=volume)
+        )
+
+        if temperature < const.ABS_ZERO: raise ValueError(
+            "Temperature must exceed 0K! Value received: {val} {unit}.".format(val=volume, unit=const.TEMP_UNIT)
+        )
+
+        if temperature > self.evaporation_point or temperature < self.freezing_point: raise RuntimeWarning(
+            "The material would not be liquid at the provided temperature. Value received: {val} {unit}.".format(val=temperature, unit=const.TEMP_UNIT)
+        )
+
+        self.volume = volume
+        self.temperature = temperature
+
+    def update_state(self):
+        return descriptor_set(self._warmth())
+
+    def _warmth(self):
+        return describe_warmth(self.temperature, freezing_point=self.freezing_point, evaporation_point=self.evaporation_point)
+
+    def rendering(self):
+        """Returns the parts of the string representation before and after the volume; see comestibles.Liquid.rendering()."""
+        descriptors = self.update_state()
+        key = (type(self), self.display_name, descriptors, self._extras_key())
+        rendering = _renderings.get(key)
+        if rendering is None: rendering = _renderings[key] = self._render(descriptors)
+        return rendering
+
+    def _extras_key(self): return ()
+
+    def _render(self, descriptors):
+        return (
+            "{desc}{name} (".format(desc=(", ".join(sorted(descriptors)) + (" " if descriptors else "")), name=self.display_name),
+            "{unit})".format(unit=const.VOLUME_UNIT),
+        )
+
+    def __str__(self):
+        head, tail = self.rendering()
+        return "{head}{volume}{tail}".format(head=head, volume=self.volume, tail=tail)
+
+class Water(Liquid):
+    __slots__ = ()
+    display_name = const.LOC_WATER
+
+class Coffee(Liquid):
+    # display_name is a slot rather than a class attribute here, as it may be overridden per instance:
+    __slots__ = ('caffeine_content', 'extras', 'display_name')
+
+    def __init__(self,
+                 volume=Constants.DEFAULT_VOLUME,
+                 temperature=const.ROOMTEMP,
+                 caffeine_content=0,
+                 name_override=NotImplemented,
+                 extras=None,
+                 *args, **kwargs):
+
+        super(Coffee, self).__init__(volume=volume, temperature=temperature, *args, **kwargs)
+        self.caffeine_content = max(0, caffeine_content)
+        self.display_name = const.LOC_COFFEE if name_override is NotImplemented else name_override
+        self.extras = extras_tuple(extras)
+
+    def add_extra(self, extra, *args, **kwargs):
+        """Records an extra added to the brew, e.g. crema."""
+        self.extras = extras_tuple(self.extras + (extra,))
+
+    def update_state(self):
+        return descriptor_set(self._warmth(), describe_strength(self.caffeine_content))
+
+    def _extras_key(self): return self.extras
+
+    def _render(self, descriptors):
+        head, tail = super(Coffee, self)._render(descriptors)
+        extras_desc = " with {}".format(", ".join(map(str, self.extras))) if self.extras else ""
+        return head, tail + extras_desc
@@ -1,22 +1,202 @@
 # -*- coding: utf-8 -*-
 """DDD."""
 
+import datetime
+import heapq
+import itertools
+
 import CoffeeSim.Constants as Constants
 const = Constants.Unlocalized
 
-class Container(object):
-    
-    def __init__(self, contents=None, *args, **kwargs):
-        self.contents = set()
-        after_fill = self.fill(container=self.contents, fill_contents=contents)
-        self.contents.update(after_fill)
-        
-    def fill(self, fill_contents=None, container=None, *args, **kwargs):
-        """Adds specified contents to the target container. 
-        
-        :param container: optional; a Set-like, holding tank contents
-        :param fill_contents: optional; a Mapping of types to volumes
-        """
-        filled = set()
-        filled.update(fill_contents or {})
-        return filled
\ No newline at end of file
+import CoffeeSim.comestibles as comestibles
+
+from CoffeeSim.components.reservations import Reservable
+
+
+class BeanLot(object):
+    """A batch of beans roasted together, e.g. a single bag."""
+    __slots__ = ('bean_type', 'amount', 'caffeine_density', 'roast_date', 'expires')
+
+    def __init__(self, amount, bean_type=comestibles.CoffeeBeans, caffeine_density=1, roast_date=None, expires=None, *args, **kwargs):
+        """
+        :param bean_type: optional; the CaffeineSource class the lot's beans are drawn as.
+        :param roast_date: optional; a datetime.date; defaults to today.
+        :param expires: optional; a datetime.date; defaults to the roast date plus the shelf life of the container it's put in.
+        """
+        if amount < 0: raise ValueError(
+            "Amount should be a positive value! Value received: {val}.".format(val=amount)
+        )
+        self.bean_type = bean_type
+        self.amount = amount
+        self.caffeine_density = caffeine_density
+        self.roast_date = roast_date or datetime.date.today()
+        self.expires = expires
+
+    def __str__(self): return ("{name} (Amount: {amt}, roasted: {roasted}, expires: {expires})"
+                                .format(name=self.bean_type.__name__, amt=self.amount, roasted=self.roast_date, expires=self.expires))
+
+
+class LotQueue(object):
+    """Bean lots in the order they are to be used up, with the total stock as a running sum.
+
+    'fifo' order uses the lots in the order they were added; 'fefo' (first expired, first out) by their expiry dates,
+    with the lots without an expiry date last.
+    """
+    orders = ('fifo', 'fefo')
+
+    def __init__(self, order='fifo', *args, **kwargs):
+        if order not in self.orders: raise ValueError("Unsupported consumption order: {order}.".format(order=order))
+        self.order = order
+        self.stock = 0
+
+        self._heap = []
+        self._sequence = itertools.count() # keys the FIFO order; breaks ties between same-day lots in FEFO
+
+    def _entry(self, lot):
+        sequence = next(self._sequence)
+        return (((lot.expires is None, lot.expires) if self.order == 'fefo' else sequence), sequence, lot)
+
+    def add(self, lot, *args, **kwargs):
+        heapq.heappush(self._heap, self._entry(lot))
+        self.stock += lot.amount
+
+    def extend(self, lots, *args, **kwargs):
+        """Adds many lots at once; heapifies once in O(n) rather than pushing each lot in O(log n)."""
+        lots = list(lots)
+        self._heap.extend(self._entry(lot) for lot in lots)
+        heapq.heapify(self._heap)
+        self.stock += sum(lot.amount for lot in lots)
+
+    def take(self, amount, *args, **kwargs):
+        """Takes the specified amount out of the lots, in order; does NOT check the stock beforehand.
+
+        :returns: a list of (lot, amount taken from it) pairs.
+        """
+        taken = []
+        remaining = amount
+        while remaining > 0 and self._heap:
+            lot = self._heap[0][2]
+            used = min(lot.amount, remaining)
+            lot.amount -= used
+            remaining -= used
+            taken.append((lot, used))
+            if lot.amount <= 0: heapq.heappop(self._heap)
+
+        self.stock -= amount - remaining
+        return taken
+
+    def discard_expired(self, on=None, *args, **kwargs):
+        """Removes all lots expired by the given date (today by default); lots without an expiry date never expire.
+
+        :returns: a list of the removed lots.
+        """
+        on = on or datetime.date.today()
+        expired = [entry[2] for entry in self._heap if entry[2].expires is not None and entry[2].expires < on]
+        if expired:
+            self._heap = [entry for entry in self._heap if entry[2].expires is None or not entry[2].expires < on]
+            heapq.heapify(self._heap)
+            self.stock -= sum(lot.amount for lot in expired)
+        return expired
+
+    def copy(self):
+        duplicate = type(self)(order=self.order)
+        duplicate.extend(BeanLot(amount=lot.amount, bean_type=lot.bean_type, caffeine_density=lot.caffeine_density,
+                                 roast_date=lot.roast_date, expires=lot.expires)
+                         for lot in self)
+        return duplicate
+
+    def __iter__(self):
+        for (_, _, lot) in sorted(self._heap, key=lambda entry: entry[:2]): yield lot
+
+    def __len__(self): return len(self._heap)
+
+    def __bool__(self): return self.stock > 0
+    __nonzero__ = __bool__ # Python 2
+
+
+class Container(Reservable):
+    """A generic bean container, holding lots of beans and using them up in a FIFO or FEFO order.
+
+    Safe to draw from concurrently: all changes to the contents happen under the container's lock,
+    and draws may be reserved in advance; see reservations.Reservable.
+    """
+    capacity = 2500
+    service_time = 20 # s; to top up the container, however much it gets topped up
+    shelf_life = datetime.timedelta(days=30) # from the roast date, for lots without an explicit expiry date
+    consumption = 'fifo' # see LotQueue
+    bean_type = comestibles.CoffeeBeans # drawn when the container has no lots to draw from
+    event_sink = None # see helpers.EventSink; None for the default sink
+
+    def __init__(self, contents=None, consumption=None, *args, **kwargs):
+        self.contents = self.fill(container=LotQueue(order=consumption or self.consumption), fill_contents=contents, **kwargs)
+
+    @property
+    def stock(self):
+        """The amount of beans held; O(1)."""
+        return self.contents.stock
+
+    def _level(self): return self.stock
+
+    def _take(self, amount): return self.draw(amount)
+
+    def fill(self, fill_contents=None, container=None, roast_date=None, caffeine_density=1, *args, **kwargs):
+        """Adds specified contents to the target container, as one new lot per bean type, respecting container capacity.
+
+        :param container: optional; a LotQueue, holding container contents
+        :param fill_contents: optional; a Mapping of types to amounts
+        :param roast_date: optional; the roast date of the added lots
+        :param caffeine_density: optional; the caffeine density of the added beans
+        """
+        return self.fill_lots(
+            container=container,
+            lots=[BeanLot(amount=amt, bean_type=bean_type, caffeine_density=caffeine_density, roast_date=roast_date)
+                  for (bean_type, amt) in (fill_contents or {}).items() if amt],
+        )
+
+    def fill_lots(self, lots, container=None, *args, **kwargs):
+        """Adds many lots to the target container in bulk, respecting container capacity.
+
+        :param lots: Iterable of BeanLots; lots without an expiry date expire after the container's shelf life.
+        :param container: optional; a LotQueue, holding container contents
+        """
+        with self.lock:
+            filled_container = self.contents if container is None else container.copy()
+
+            lots = list(lots)
+            if sum(lot.amount for lot in lots) > (self.capacity - filled_container.stock): raise RuntimeWarning("Contents amount exceeds capacity!")
+            for lot in lots:
+                if lot.expires is None: lot.expires = lot.roast_date + self.shelf_life
+            filled_container.extend(lots)
+
+        return filled_container
+
+    def service(self, below=1.0, material=None, *args, **kwargs):
+        """Tops up the container with the material, if it holds less than the given fraction of its capacity.
+
+        :param material: the bean type to top up with, e.g. the machine's materials.CoffeeBeans.
+        :returns: the amount added.
+        """
+        if not self.capacity: return 0
+        with self.lock:
+            shortfall = self.capacity - self.stock
+            if shortfall <= 0 or self.stock >= below * self.capacity: return 0
+            self.fill({material: shortfall})
+        return shortfall
+
+    def draw(self, amount, *args, **kwargs):
+        """Takes the specified amount of beans out of the lots, in the order of consumption.
+
+        :returns: the drawn beans, as a single item of the first drawn lot's type, with the lots' mean caffeine density;
+            if nothing is drawn, none of the next lot's type (or, for an empty container, of its bean_type).
+        """
+        with self.lock:
+            if amount > self.stock: raise RuntimeWarning("Amount to draw ({amt}) exceeded available amount by {rem}."
+                                                         .format(amt=amount, rem=amount - self.stock)
+                                                         )
+            taken = self.contents.take(amount)
+        if not taken:
+            upcoming = next(iter(self.contents), None)
+            return (self.bean_type if upcoming is None else upcoming.bean_type)(amount=0)
+
+        caffeine = sum(lot.caffeine_density * used for (lot, used) in taken)
+        return taken[0][0].bean_type(amount=amount, caffeine_density=caffeine / float(amount), **kwargs)
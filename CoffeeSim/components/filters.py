@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Water filters, softening the water on its way to the heaters."""
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim.helpers import make_sounds
+
+from CoffeeSim.components.reservations import Reservable
+
+
+class Filter(Reservable):
+    """A water filter that softens a limited volume of water; once it is spent, the machine needs descaling
+    (here: regenerating the filter) before it can brew again.
+
+    The reservable stock is the volume left to filter, so that brews can set it aside along with their water;
+    see reservations.Reservable.
+    """
+    filtered = 0 # the volume filtered since the last descaling
+    capacity = 50000 # mL filtered between descalings
+    service_time = 600 # s; a descaling cycle
+    event_sink = None # see helpers.EventSink; None for the default sink
+
+    def __init__(self, filtered=0, *args, **kwargs):
+        self.filtered = filtered
+
+    def _level(self): return self.capacity - self.filtered
+
+    def _take(self, amount): return self.filter(amount)
+
+    def filter(self, volume, *args, **kwargs):
+        """Passes the specified volume of water through the filter.
+
+        :returns: the volume filtered.
+        """
+        with self.lock:
+            if volume > self.capacity - self.filtered: raise RuntimeWarning("Filter spent! Cannot filter {vol} more.".format(vol=volume))
+            self.filtered += volume
+            self._availability_changed()
+        return volume
+
+    def descale(self, *args, **kwargs):
+        """Regenerates the filter; reservations stay in place.
+
+        :returns: the volume of filtering capacity restored.
+        """
+        with self.lock:
+            restored, self.filtered = self.filtered, 0
+            self._availability_changed()
+        if restored: make_sounds("Gurgle-gurgle-PSSSHHH...", sink=self.event_sink, source=self)
+        return restored
+
+    def service(self, below=1.0, *args, **kwargs):
+        """Descales the filter if the volume it has left is below the given fraction of its capacity.
+
+        :returns: the volume of filtering capacity restored.
+        """
+        with self.lock:
+            if self.filtered <= 0 or self.capacity - self.filtered >= below * self.capacity: return 0
+            return self.descale()
@@ -6,17 +6,36 @@ const = Constants.Unlocalized
 
 from CoffeeSim.helpers import make_sounds
 
+from CoffeeSim import extraction
+
 class Grinder(object):
+    grind_rate = 20 # amount of beans per second
+    grind_size = 'medium' # median particle size of the grounds, in micrometres, or a key of extraction.GRIND_SIZES
+    grind_spread = 0.5 # spread of the particle sizes; see extraction.particle_sizes()
+    event_sink = None # see helpers.EventSink; None for the default sink
+    
     def __init__(self, *args, **kwargs):
         pass
         
+    def grind_duration(self, items=None, *args, **kwargs):
+        """Duration model; how long grinding the specified items takes, in seconds.
+        
+        :param items: optional; a Mapping of grindable items to the amounts to grind, same as for grind()
+        """
+        return sum((items or {}).values()) / float(self.grind_rate)
+        
+    def particle_sizes(self, *args, **kwargs):
+        """The particle-size distribution of the grounds, as the grinder is set up; see extraction.particle_sizes()."""
+        return extraction.particle_sizes(median=self.grind_size, spread=self.grind_spread)
+        
     def grind(self, items=None, *args, **kwargs):
         grounded = dict(items or {})
         grounds = {}
+        kwargs.setdefault('particle_sizes', self.particle_sizes())
         
         while grounded:
             item, grind_amt = grounded.popitem()
-            make_sounds("WHIRRRRRRRR!")
+            make_sounds("WHIRRRRRRRR!", sink=self.event_sink, source=self)
             try: grounds[item] = item.grind(amount=grind_amt, **kwargs)
             # TODO: error handling (I'd rather not add broad exceptions blindly here)
             finally: pass 
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Grounds bins (knock boxes), collecting the spent grounds of the brews until someone empties them."""
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim.helpers import make_sounds
+
+from CoffeeSim.components.reservations import Reservable
+
+
+class GroundsBin(Reservable):
+    """A grounds bin of a limited capacity; once it is full, the machine cannot brew until it is emptied.
+
+    The reservable stock is the free space, so that brews can set aside the room for their grounds up front;
+    see reservations.Reservable.
+    """
+    grounds = 0 # the amount of spent grounds held
+    capacity = 2500 # in the bean amount units; as much as a full bean container holds
+    service_time = 15 # s; to take out, empty and put back the bin
+    event_sink = None # see helpers.EventSink; None for the default sink
+
+    def __init__(self, grounds=0, *args, **kwargs):
+        self.grounds = grounds
+
+    def _level(self): return self.capacity - self.grounds
+
+    def _take(self, amount): return self.deposit(amount)
+
+    def deposit(self, amount, *args, **kwargs):
+        """Adds the specified amount of spent grounds to the bin.
+
+        :returns: the amount deposited.
+        """
+        with self.lock:
+            if amount > self.capacity - self.grounds: raise RuntimeWarning("Grounds bin is full! Cannot fit {amt} more.".format(amt=amount))
+            self.grounds += amount
+            self._availability_changed()
+        return amount
+
+    def empty(self, *args, **kwargs):
+        """Throws out the grounds held; reservations stay in place.
+
+        :returns: the amount thrown out.
+        """
+        with self.lock:
+            emptied, self.grounds = self.grounds, 0
+            self._availability_changed()
+        if emptied: make_sounds("KNOCK-KNOCK-KNOCK!", sink=self.event_sink, source=self)
+        return emptied
+
+    def service(self, below=1.0, *args, **kwargs):
+        """Empties the bin if its free space is below the given fraction of its capacity.
+
+        :returns: the amount thrown out.
+        """
+        with self.lock:
+            if self.grounds <= 0 or self.capacity - self.grounds >= below * self.capacity: return 0
+            return self.empty()
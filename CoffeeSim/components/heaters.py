@@ -1,21 +1,131 @@
 # -*- coding: utf-8 -*-
 """Heating elements."""
 
+import collections
+import itertools
+import math
+
+try: import numpy
+except ImportError: numpy = None # optional; the batch model falls back to plain Python math
+
 import CoffeeSim.Constants as Constants
 const = Constants.Unlocalized
 
 from CoffeeSim.helpers import make_sounds
 
+class HeatResult(collections.namedtuple('HeatResult', ('heated', 'energy', 'duration', 'energies', 'durations'))):
+    """Outcome of heating a batch of liquids; see Heater.heat_batch().
+
+    heated maps each item to itself, heated, as heat() returns; energy (J) and duration (s) are the batch totals,
+    energies and durations the per-item values, aligned with the items.
+    """
+    __slots__ = ()
+
+
+def _vectorized(values): return numpy is not None and isinstance(values, numpy.ndarray)
+
+def _total(values): return float(values.sum()) if _vectorized(values) else float(sum(values))
+
+
 class Heater(object):
+    """A heating element, heating liquids one after another at a constant power, while losing heat to its surroundings.
+
+    The liquid being heated loses loss_coefficient W per degree above the ambient temperature, so heating slows down
+    as it gets hotter, and the heater cannot heat anything past ambient_temp + power / loss_coefficient at all.
+    """
+    power = 1500 # W
+    loss_coefficient = 0.5 # W/K
+    ambient_temp = const.ROOMTEMP
+    vectorize_from = 32 # batch size from which the model is computed with NumPy, if available; smaller batches are faster without
+    event_sink = None # see helpers.EventSink; None for the default sink
+
     def __init__(self, *args, **kwargs):
         pass
-        
+
+    @property
+    def max_temp(self):
+        """The temperature the heater settles at, with its power all lost to the surroundings; infinite without any losses."""
+        return self.ambient_temp + self.power / float(self.loss_coefficient) if self.loss_coefficient else float('inf')
+
+    def heating_times(self, volumes, temperatures, target_temp, heat_capacity=const.WATER_HEAT_CAPACITY, *args, **kwargs):
+        """Duration model, over whole arrays; how long heating each of the liquids to the target temperature takes.
+
+        Solves C dT/dt = P - k (T - T_ambient) for the time to get from each temperature to the target;
+        liquids already at or above the target take no time.
+
+        :param volumes: Sequence (or NumPy array) of liquid volumes.
+        :param temperatures: Sequence (or NumPy array) of the starting temperatures, aligned with the volumes.
+        :param heat_capacity: optional; heat capacity by volume, in J/(mL*K); a single value, or one per liquid.
+        :returns: the heating times in seconds; a NumPy array for NumPy array inputs or batches of vectorize_from or more
+            liquids (if NumPy is available), a list otherwise.
+        """
+        gap_after = self._gap_after(target_temp)
+        power, loss = float(self.power), self.loss_coefficient
+
+        if _vectorized(volumes) or (numpy is not None and len(volumes) >= self.vectorize_from):
+            capacities = numpy.asarray(volumes, dtype=float) * numpy.asarray(heat_capacity, dtype=float)
+            deltas = numpy.maximum(0, target_temp - numpy.asarray(temperatures, dtype=float))
+            if not loss: return capacities * deltas / power
+            # the gap to the steady-state temperature shrinks exponentially, with a time constant of C / k:
+            return capacities / loss * numpy.log1p(deltas / gap_after)
+
+        capacities = itertools.repeat(heat_capacity) if isinstance(heat_capacity, (int, float)) else heat_capacity
+        if not loss: return [volume * capacity * max(0, target_temp - temp) / power 
+                             for (volume, temp, capacity) in zip(volumes, temperatures, capacities)]
+        return [volume * capacity / loss * math.log1p(max(0, target_temp - temp) / gap_after) 
+                for (volume, temp, capacity) in zip(volumes, temperatures, capacities)]
+
+    def _gap_after(self, target_temp):
+        """How far below the heater's reach the target temperature is; raises if not below at all."""
+        gap_after = self.max_temp - target_temp
+        if gap_after <= 0: raise RuntimeWarning(
+            "Target temperature ({target}) is beyond the heater's reach ({max_temp})!".format(target=target_temp, max_temp=self.max_temp)
+        )
+        return gap_after
+
+    def heat_duration(self, items=None, target_temp=None, *args, **kwargs):
+        """Duration model; how long heating the specified items to the target temperature takes, in seconds.
+
+        :param items: optional; Iterable of liquids, same as for heat()
+        """
+        if target_temp is None or not items: return 0
+        items = list(items)
+        return _total(self.heating_times([item.volume for item in items], [item.temperature for item in items],
+                                         target_temp, heat_capacity=self._heat_capacities(items)))
+
+    @staticmethod
+    def _heat_capacities(items):
+        return [getattr(item, 'heat_capacity', const.WATER_HEAT_CAPACITY) for item in items]
+
+    def heat_batch(self, items=None, target_temp=None, *args, **kwargs):
+        """Heats a whole batch of liquids to the target temperature, one after another, with the heating times and energies
+        computed over the whole batch at once; liquids already at or above the target are left as they are.
+
+        :param items: optional; Iterable of liquids
+        :returns: a HeatResult.
+        """
+        items = list(items or [])
+        if not items or target_temp is None: return HeatResult(heated={item: item for item in items}, energy=0, duration=0,
+                                                                energies=[0] * len(items), durations=[0] * len(items))
+
+        durations = self.heating_times([item.volume for item in items], [item.temperature for item in items],
+                                       target_temp, heat_capacity=self._heat_capacities(items))
+        energies = durations * float(self.power) if _vectorized(durations) else [duration * self.power for duration in durations]
+
+        return HeatResult(heated=self.heat(items=items, target_temp=target_temp), energy=_total(energies), duration=_total(durations),
+                          energies=energies, durations=durations)
+
     def heat(self, items=None, target_temp=None, *args, **kwargs):
-        if not items: items = []
-        results = {}
-        for heated in items:
-            heated.temperature = heated.temperature if target_temp is None else target_temp
-            # simplistic, but I am *NOT* modelling thermodynamics unless I have to.
-            make_sounds("Hissssssss...")
-            results[heated] = heated
-        return results
\ No newline at end of file
+        """Heats the items to the target temperature, without computing the time and energy it takes; see heat_batch() for those.
+        Liquids already at or above the target are left as they are.
+
+        :returns: a dict mapping each item to itself, heated.
+        """
+        items = list(items or [])
+        if not items: return {}
+        if target_temp is not None:
+            self._gap_after(target_temp)
+            for item in items:
+                if item.temperature < target_temp: item.temperature = target_temp
+        make_sounds("Hissssssss...", sink=self.event_sink, source=self)
+        return {item: item for item in items}
@@ -43,4 +43,14 @@ class CoffeeButton(Button):
         
     default_onPress = send_preset
     
+    def apress(self, *args, **kwargs):
+        """Awaitable counterpart of press(); sends the preset to the owner's abrew() (see CoffeeSim.aio).
+        
+        :returns: an awaitable resolving to the brew.
+        """
+        owner = self.owner()
+        abrew = getattr(owner, 'abrew', None)
+        if abrew is None: raise TypeError('The button owner does not support asynchronous brewing!')
+        return abrew(preset=self.preset, *args, **kwargs)
+    
     
\ No newline at end of file
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""Reservations of supplies - for brewing concurrently on a shared machine.
+
+An order first reserves the water and beans it needs: each water source and bean container sets aside its share
+under its own lock, so that concurrent orders can never both count on the same stock. The order then commits
+the reservation stage by stage, drawing exactly what was set aside - or cancels it, e.g. when a later stage fails,
+handing the stock back. See AbstractCoffeemaker.reserve().
+"""
+
+import collections
+import threading
+
+_lock_creation = threading.Lock() # guards the lazy creation of the components' own locks
+
+
+class _ComponentLock(object):
+    """The lock of a component; created on first use, as components may be restored without running their constructors.
+    Stored on the instance under the same name, so that later lookups find it there without calling back here.
+    """
+
+    def __get__(self, instance, owner):
+        if instance is None: return self
+        with _lock_creation: return instance.__dict__.setdefault('lock', threading.RLock())
+
+
+class Reservable(object):
+    """Mixin for supply components with a reservable stock; subclasses define _level() and _take().
+
+    All changes to the component's contents should happen under its lock; the lock is re-entrant,
+    so that the component's methods can call each other while holding it.
+    """
+    reserved = 0 # the amount set aside for reservations not committed yet
+    lock = _ComponentLock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('lock', None) # locks can be neither pickled nor copied; the copy creates its own on first use
+        return state
+
+    @property
+    def available(self):
+        """The amount held and not reserved."""
+        with self.lock: return self._level() - self.reserved
+
+    def _level(self): raise NotImplementedError
+
+    def _take(self, amount): raise NotImplementedError
+
+    def _availability_changed(self): pass
+
+    def reserve(self, amount, partial=False, *args, **kwargs):
+        """Atomically sets aside the specified amount, if available.
+
+        :param partial: optional; if True, sets aside as much of the amount as is available, rather than nothing.
+        :returns: the amount reserved.
+        """
+        with self.lock:
+            available = self._level() - self.reserved
+            reserved = max(0, min(amount, available)) if partial else (amount if amount <= available else 0)
+            if reserved > 0:
+                self.reserved += reserved
+                self._availability_changed()
+        return reserved
+
+    def cancel(self, amount, *args, **kwargs):
+        """Hands a reserved amount back."""
+        with self.lock:
+            self.reserved -= amount
+            self._availability_changed()
+
+    def commit(self, amount, *args, **kwargs):
+        """Takes a reserved amount out of the component; if that fails, the amount stays reserved.
+
+        :returns: whatever the component hands out, e.g. the drawn liquids or beans.
+        """
+        with self.lock:
+            taken = self._take(amount)
+            self.reserved -= amount
+            self._availability_changed()
+        return taken
+
+
+class Reservation(object):
+    """Amounts reserved on any number of supply components, by component type.
+
+    Use as a context manager to cancel whatever is left uncommitted on leaving the block, whether it failed or not.
+    Safe to commit and cancel from different threads, e.g. when an asynchronous order is cancelled while
+    a stage of it is still running in a worker thread: each part is either committed or handed back, once.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.parts = {} # component type -> OrderedDict of components to the amounts reserved on them
+        self.lock = threading.RLock()
+
+    def add(self, comptype, component, amount, *args, **kwargs):
+        if amount <= 0: return
+        with self.lock:
+            parts = self.parts.get(comptype)
+            if parts is None: parts = self.parts[comptype] = collections.OrderedDict()
+            parts[component] = parts.get(component, 0) + amount
+
+    def amount(self, comptype):
+        """The total amount reserved on the components of the given type."""
+        with self.lock: return sum(self.parts.get(comptype, {}).values())
+
+    def merge(self, other, *args, **kwargs):
+        """Takes over all parts of another reservation, e.g. to commit the reservations of many orders at once."""
+        with other.lock: parts, other.parts = other.parts, {}
+        for (comptype, comptype_parts) in parts.items():
+            for (component, amount) in comptype_parts.items(): self.add(comptype, component, amount)
+        return self
+
+    def commit(self, comptype, amount=None, *args, **kwargs):
+        """Takes the amounts reserved on the components of the given type out of them, in the order they were reserved.
+
+        :param amount: optional; how much of the reserved amount to take; all of it by default.
+        :returns: a list of what each component handed out.
+        """
+        with self.lock:
+            parts = self.parts.get(comptype) or {}
+            taken = []
+            remaining = amount
+            for (component, reserved) in list(parts.items()):
+                if remaining is not None and remaining <= 0: break
+                used = reserved if remaining is None else min(reserved, remaining)
+                taken.append(component.commit(used))
+                if used < reserved: parts[component] = reserved - used
+                else: del parts[component]
+                if remaining is not None: remaining -= used
+
+            if not parts: self.parts.pop(comptype, None)
+        return taken
+
+    def cancel(self, *args, **kwargs):
+        """Hands back everything not committed yet."""
+        with self.lock: parts, self.parts = self.parts, {}
+        for comptype_parts in parts.values():
+            for (component, amount) in comptype_parts.items(): component.cancel(amount)
+
+    def __bool__(self):
+        with self.lock: return bool(self.parts)
+    __nonzero__ = __bool__ # Python 2
+
+    def __enter__(self): return self
+
+    def __exit__(self, *exc_info): self.cancel()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""Site-wide supplies, shared between coffeemakers running in separate processes."""
+
+import multiprocessing
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+import CoffeeSim.comestibles as comestibles
+
+from CoffeeSim.components import water_supply, bean_supply
+
+from CoffeeSim.helpers import make_sounds
+
+
+class SharedInventory(object):
+    """A stock of some resource (water, beans...) kept in shared memory.
+    
+    All changes happen atomically under the inventory's lock, so the stock can never be overdrawn, 
+    no matter how many processes draw from it at once. Must be handed to the child processes on their creation.
+    """
+    
+    def __init__(self, amount=0, *args, **kwargs):
+        self._level = multiprocessing.Value('d', amount)
+        
+    @property
+    def level(self): return self._level.value
+        
+    def reserve(self, amount, *args, **kwargs):
+        """Atomically takes the specified amount out of the stock, if available.
+        
+        :returns: True if reserved; False (and no changes made) if the stock is insufficient.
+        """
+        with self._level.get_lock():
+            if amount > self._level.value: return False
+            self._level.value -= amount
+        return True
+        
+    def release(self, amount, *args, **kwargs):
+        """Atomically puts the specified amount (back) into the stock."""
+        with self._level.get_lock():
+            self._level.value += amount
+            
+    refill = release
+    
+    
+class SharedReservable(object):
+    """Mixin for the reservations of supply components drawing from a SharedInventory; see reservations.Reservable.
+    
+    Reservations take the amounts out of the shared stock right away, so that no other process can draw them;
+    committing them hands out the already reserved amounts, and cancelling puts them back into the stock.
+    """
+    
+    @property
+    def available(self): return self.inventory.level
+    
+    def reserve(self, amount, partial=False, *args, **kwargs):
+        if partial: amount = min(amount, self.inventory.level)
+        return amount if amount > 0 and self.inventory.reserve(amount) else 0
+        
+    def cancel(self, amount, *args, **kwargs):
+        self.inventory.release(amount)
+        
+    def commit(self, amount, *args, **kwargs): return self._hand_out(amount)
+    
+    
+class SharedWaterLine(SharedReservable, water_supply.Tank):
+    """A plumbed water line - a Tank drawing from a site-wide SharedInventory rather than its own contents."""
+    capacity = None # restocked at the site level, not by the machines
+    
+    def __init__(self, inventory, liquid_type=comestibles.Water, *args, **kwargs):
+        self.inventory = inventory
+        self.liquid_type = liquid_type
+        self.contents = set() # nothing is actually kept in the line itself
+        
+    @property
+    def contents_volume(self, *args, **kwargs):
+        return self.inventory.level
+        
+    def fill(self, fill_contents=None, container=None, *args, **kwargs):
+        """Adds the volumes of the specified contents to the shared stock.
+        
+        :param fill_contents: optional; a Mapping of types to volumes
+        """
+        for vol in (fill_contents or {}).values(): self.inventory.refill(vol)
+        return self.contents
+        
+    def remove(self, remove_volume=0, container=None, *args, **kwargs):
+        if not remove_volume: return self.contents, set()
+        
+        if not self.inventory.reserve(remove_volume): raise RuntimeWarning("Amount to remove ({amt}) exceeded available amount by {rem}."
+                                                                           .format(amt=remove_volume, rem=remove_volume - self.inventory.level)
+                                                                           )
+        return self.contents, self._hand_out(remove_volume)
+        
+    def _hand_out(self, volume):
+        make_sounds("GLUG-GLUG-GLUG...", sink=self.event_sink, source=self)
+        return {self.liquid_type(volume=volume)}
+        
+        
+class SharedBeanStore(SharedReservable, bean_supply.Container):
+    """A site-wide bean store - a Container drawing from a SharedInventory."""
+    capacity = None
+    
+    def __init__(self, inventory, bean_type=comestibles.CoffeeBeans, *args, **kwargs):
+        self.inventory = inventory
+        self.bean_type = bean_type
+        self.contents = set()
+        
+    @property
+    def stock(self): return self.inventory.level
+        
+    def draw(self, amount, *args, **kwargs):
+        """Atomically takes the specified amount of beans out of the shared stock.
+        
+        :returns: the drawn beans.
+        """
+        if not self.inventory.reserve(amount): raise RuntimeWarning("Amount to draw ({amt}) exceeded available amount by {rem}."
+                                                                    .format(amt=amount, rem=amount - self.inventory.level)
+                                                                    )
+        return self._hand_out(amount, **kwargs)
+        
+    def _hand_out(self, amount, **kwargs): return self.bean_type(amount=amount, **kwargs)
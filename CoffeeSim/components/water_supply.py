@@ -1,22 +1,64 @@
 # -*- coding: utf-8 -*-
 """DDD."""
 
+import array
 import copy
+import heapq
+import itertools
+import threading
+
+try: from collections.abc import Mapping
+except ImportError: from collections import Mapping # Python 2
+
+try: import numpy
+except ImportError: numpy = None # optional; the columns fall back to the stdlib array module
 
 import CoffeeSim.Constants as Constants
 const = Constants.Unlocalized
 
 from CoffeeSim.helpers import make_sounds
 
+from CoffeeSim.components.reservations import Reservable
+
+
+class Tank(Reservable):
+    """A generic water tank.
 
-class Tank(object):
-    """A generic water tank."""
+    Safe to draw from concurrently: all changes to the contents happen under the tank's lock, 
+    and draws may be reserved in advance; see reservations.Reservable.
+    """
     capacity = 500
+    pour_rate = 25 # mL/s
+    service_time = 30 # s; to take out, fill up and put back the tank, however much it gets topped up
+    event_sink = None # see helpers.EventSink; None for the default sink
+    index = None # the WaterSourceIndex tracking the tank's level, if any
     
     def __init__(self, contents=None, *args, **kwargs):
         self.contents = set()
         after_fill = self.fill(container=self.contents, fill_contents=contents)
         self.contents.update(after_fill)
+        
+    @property
+    def contents(self): return self._contents
+    
+    @contents.setter
+    def contents(self, contents):
+        changed = contents is not getattr(self, '_contents', None)
+        self._contents = contents
+        if changed: self._contents_changed(contents)
+        
+    def _contents_changed(self, container):
+        """Notifies the index, if any, whenever the tank's own contents change."""
+        if self.index is not None and container is self._contents: self.index.refresh(self)
+        
+    def _availability_changed(self):
+        if self.index is not None: self.index.refresh(self)
+        
+    def _level(self): return self.get_volume(container=self.contents)
+    
+    def _take(self, amount):
+        self.contents, transferred = self.remove(remove_volume=amount)
+        return transferred
     
     @staticmethod
     def get_volume(container, *args, **kwargs):
@@ -24,7 +66,11 @@ class Tank(object):
     
     @property
     def contents_volume(self, *args, **kwargs):
-        return self.get_volume(container=self.contents)
+        with self.lock: return self.get_volume(container=self.contents)
+        
+    def draw_duration(self, volume=0, *args, **kwargs):
+        """Duration model; how long drawing the specified volume takes, in seconds."""
+        return volume / float(self.pour_rate)
         
     def fill(self, fill_contents=None, container=None, *args, **kwargs):
         """Adds specified contents to the target container, respecting tank capacity. 
@@ -32,43 +78,341 @@ class Tank(object):
         :param container: optional; a Set-like, holding tank contents
         :param fill_contents: optional; a Mapping of types to volumes
         """
-        filled_container = self.contents if container is None else (container or set()).copy()
-    
-        for cont, vol in (fill_contents or {}).items():
-            if vol > (self.capacity - self.get_volume(filled_container)): raise RuntimeWarning("Contents volume exceeds capacity!")
-            # in the future, could possibly fill to capacity and discard the rest; sticking to YAGNI for now.
-            filled_container.update({cont(volume=vol, **kwargs)})
+        with self.lock:
+            filled_container = self.contents if container is None else (container or set()).copy()
         
+            for cont, vol in (fill_contents or {}).items():
+                if vol > (self.capacity - self.get_volume(filled_container)): raise RuntimeWarning("Contents volume exceeds capacity!")
+                # in the future, could possibly fill to capacity and discard the rest; sticking to YAGNI for now.
+                filled_container.update({cont(volume=vol, **kwargs)})
+            
+            self._contents_changed(filled_container)
         return filled_container
         
+    def service(self, below=1.0, material=None, *args, **kwargs):
+        """Tops up the tank with the material, if it holds less than the given fraction of its capacity.
+        
+        :param material: the Liquid type to top up with, e.g. the machine's materials.Water.
+        :returns: the volume added.
+        """
+        if not self.capacity: return 0
+        with self.lock:
+            level = self.get_volume(container=self.contents)
+            shortfall = self.capacity - level
+            if shortfall <= 0 or level >= below * self.capacity: return 0
+            self.fill({material: shortfall})
+        return shortfall
+        
     def remove(self, remove_volume=0, container=None, *args, **kwargs):
-        emptied_container = self.contents if container is None else container.copy()
-        removed_contents = set()
-        to_remove = remove_volume
+        with self.lock:
+            emptied_container = self.contents if container is None else container.copy()
+            removed_contents = set()
+            to_remove = remove_volume
         
-        while to_remove and emptied_container:
-            pool_count = len(emptied_container)
-            content = emptied_container.pop()
+            # a single pass, smallest contents first, so that the larger ones make up for any shortfall of the smaller ones:
+            pool = sorted(emptied_container, key=lambda content: content.volume)
+            for (pool_count, content) in zip(range(len(pool), 0, -1), pool):
+                if not to_remove: break
             
-            amt_removed = min(content.volume, to_remove / float(pool_count)) # float() for backwards compatibility
+                amt_removed = min(content.volume, to_remove / float(pool_count)) # float() for backwards compatibility
             
-            removed = copy.deepcopy(content)
+                removed = copy.deepcopy(content)
             
-            make_sounds("GLUG-GLUG-GLUG...")
-            content.volume = content.volume - amt_removed
-            removed.volume = amt_removed
+                make_sounds("GLUG-GLUG-GLUG...", sink=self.event_sink, source=self)
+                content.volume = content.volume - amt_removed
+                removed.volume = amt_removed
             
-            to_remove -= amt_removed
+                to_remove -= amt_removed
             
-            if content.volume > 0: emptied_container.update([content]) # put the remainder back in
-            if removed.volume > 0: removed_contents.update([removed])
+                if content.volume <= 0: emptied_container.discard(content)
+                if removed.volume > 0: removed_contents.update([removed])
         
-        else:
             if to_remove: raise RuntimeWarning("Amount to remove ({amt}) exceeded available amount by {rem}."
                                                .format(amt=remove_volume, rem=to_remove)
                                                )
             
-        return emptied_container, removed_contents
+            self._contents_changed(emptied_container)
+            return emptied_container, removed_contents
+
+
+def _new_column(values=()):
+    return numpy.array(values, dtype=float) if numpy is not None else array.array('d', values)
+    
+def _append_to_column(column, value):
+    if numpy is not None: return numpy.append(column, value)
+    column.append(value)
+    return column
+    
+
+class LiquidColumns(object):
+    """Struct-of-arrays storage of liquids - one row of (type, volume, temperature) per liquid type,
+    with a running total of the stored volume. 
+    
+    Same-type liquids are mixed into a single row as they are added; Liquid instances are only built on demand.
+    Uses NumPy arrays for the columns where available, stdlib arrays otherwise.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        self.types = []
+        self.rows = {}
+        self.volumes = _new_column()
+        self.temperatures = _new_column()
+        self.total = 0
+        
+    def add(self, liquid_type, volume, temperature=const.ROOMTEMP, *args, **kwargs):
+        """Mixes the specified amount of a liquid into the stored contents.
+        
+        :param liquid_type: a Liquid class
+        :param volume: numeric; volume of the liquid to add
+        :param temperature: optional, numeric; temperature of the liquid to add
+        """
+        if volume <= 0: raise ValueError(
+            "Liquids must have a positive, nonzero volume! Value received: {val}.".format(val=volume)
+        )
+        row = self.rows.get(liquid_type)
+        
+        if row is None:
+            self.rows[liquid_type] = len(self.types)
+            self.types.append(liquid_type)
+            self.volumes = _append_to_column(self.volumes, volume)
+            self.temperatures = _append_to_column(self.temperatures, temperature)
+            
+        else:
+            curr_vol = self.volumes[row]
+            mixed_vol = curr_vol + volume
+            self.temperatures[row] = (self.temperatures[row] * curr_vol + temperature * volume) / float(mixed_vol)
+            self.volumes[row] = mixed_vol
+            
+        self.total += volume
+        
+    def draw(self, volume, *args, **kwargs):
+        """Removes the specified volume, taken from all stored liquids in exact proportion to their share of the total.
+        
+        :param volume: numeric; volume to remove; must not exceed the stored total.
+        :returns: a list of (type, volume, temperature) tuples for each liquid drawn.
+        """
+        if volume > self.total: raise RuntimeWarning("Amount to remove ({amt}) exceeded available amount by {rem}."
+                                                     .format(amt=volume, rem=volume - self.total)
+                                                     )
+        if volume <= 0: return []
+        
+        if volume >= self.total: 
+            drawn = self.volumes
+            self.volumes = _new_column([0] * len(self.types))
+            self.total = 0
+            
+        else:
+            ratio = volume / float(self.total) # float() for backwards compatibility
+            if numpy is not None:
+                drawn = self.volumes * ratio
+                self.volumes = self.volumes - drawn
+            else:
+                drawn = _new_column([vol * ratio for vol in self.volumes])
+                self.volumes = _new_column([vol - drawn_vol for (vol, drawn_vol) in zip(self.volumes, drawn)])
+            self.total -= volume
+        
+        return [(liquid_type, float(drawn_vol), float(temp)) 
+                for (liquid_type, drawn_vol, temp) in zip(self.types, drawn, self.temperatures) if drawn_vol > 0]
+    
+    def copy(self):
+        duplicate = type(self)()
+        duplicate.types, duplicate.rows = list(self.types), dict(self.rows)
+        duplicate.volumes, duplicate.temperatures = _new_column(self.volumes), _new_column(self.temperatures)
+        duplicate.total = self.total
+        return duplicate
+    
+    def __iter__(self):
+        for (liquid_type, volume, temp) in zip(self.types, self.volumes, self.temperatures):
+            if volume > 0: yield liquid_type(volume=float(volume), temperature=float(temp))
+            
+    def __len__(self): return sum(1 for volume in self.volumes if volume > 0)
+    
+    def __bool__(self): return self.total > 0
+    __nonzero__ = __bool__ # Python 2
+    
+    
+class CompactTank(Tank):
+    """A water tank storing its contents as LiquidColumns rather than as a Set of Liquid instances.
+    
+    Draws take from all contents in exact proportion in a single pass and the stored volume is tracked as a running total;
+    Liquid instances are only built for the drawn contents, or when iterating over the tank contents.
+    """
+    
+    def __init__(self, contents=None, *args, **kwargs):
+        self.contents = self.fill(container=LiquidColumns(), fill_contents=contents)
+    
+    @staticmethod
+    def get_volume(container, *args, **kwargs):
+        return container.total
+        
+    def fill(self, fill_contents=None, container=None, temperature=const.ROOMTEMP, *args, **kwargs):
+        """Adds specified contents to the target container, respecting tank capacity. 
+        
+        :param container: optional; LiquidColumns, holding tank contents
+        :param fill_contents: optional; a Mapping of types to volumes
+        :param temperature: optional; temperature of the added contents
+        """
+        with self.lock:
+            filled_container = self.contents if container is None else container.copy()
+        
+            for cont, vol in (fill_contents or {}).items():
+                if vol > (self.capacity - filled_container.total): raise RuntimeWarning("Contents volume exceeds capacity!")
+                filled_container.add(cont, vol, temperature=temperature)
+            
+            self._contents_changed(filled_container)
+            return filled_container
+        
+    def remove(self, remove_volume=0, container=None, *args, **kwargs):
+        with self.lock:
+            emptied_container = self.contents if container is None else container.copy()
+        
+            drawn = emptied_container.draw(remove_volume)
+            if drawn: make_sounds("GLUG-GLUG-GLUG...", sink=self.event_sink, source=self)
+            removed_contents = {liquid_type(volume=volume, temperature=temp) for (liquid_type, volume, temp) in drawn}
+        
+            self._contents_changed(emptied_container)
+            return emptied_container, removed_contents
         
+        
+class DrainSmallestFirst(object):
+    """Water allocation policy: empties the sources holding the least water first, 
+    so that as few sources as possible stay partly filled.
+    """
+    
+    def priority(self, source, level):
+        """Sort key of a source in the index; the lowest key is allocated from first."""
+        return level
+        
+    def split(self, index, volume):
+        """Takes sources off the index in the order of priority until they cover the volume.
+        
+        :returns: a dict of sources and the volume to draw from each.
+        """
+        solution = {}
+        remaining = volume
+        while remaining > 0:
+            entry = index.pop()
+            if entry is None: break
+            source, level = entry
+            used = min(level, remaining)
+            solution[source] = used
+            remaining -= used
+        return solution
+        
+        
+class NearestToEmptyFirst(DrainSmallestFirst):
+    """Water allocation policy: empties the sources with the lowest fill ratio first, regardless of their capacity."""
+    
+    def priority(self, source, level): return level / float(source.capacity)
+    
+    
+class BalanceLevels(DrainSmallestFirst):
+    """Water allocation policy: draws from the fullest sources first, so that the levels stay within about one draw of each other.
+    
+    Evening out the levels exactly would mean drawing from every equally full source on every draw; this does not.
+    """
+    
+    def priority(self, source, level): return -level
+        
+        
+WATER_POLICIES = {
+    'drain_smallest': DrainSmallestFirst,
+    'nearest_to_empty': NearestToEmptyFirst,
+    'balance_levels': BalanceLevels,
+}
+
+
+class WaterSourceIndex(Mapping):
+    """An index of the levels of a group of water sources, kept up to date incrementally as the sources are filled and drained.
+    
+    Acts as a read-only Mapping of sources to levels, with the total volume as a running sum; 
+    the sources are queued in a heap by the priority assigned by the allocation policy, so that allocating a draw
+    touches only the k sources it draws from, in O(k log n), rather than every source.
+    
+    Sources notify the index of their changes themselves (see Tank.index), so a source whose level changes 
+    behind its back - e.g. a shared_supply.SharedWaterLine - should not be indexed.
+    The levels are the volumes available, i.e. not reserved (see reservations.Reservable); the index has a lock of its own,
+    only ever taken after (never before) that of a source, so concurrent draws from separate sources do not wait for each other.
+    """
+    
+    def __init__(self, sources=(), policy='drain_smallest', *args, **kwargs):
+        """
+        :param sources: optional; Iterable of water sources to track.
+        :param policy: optional; a key of WATER_POLICIES or an allocation policy instance.
+        """
+        self.policy = WATER_POLICIES[policy]() if policy in WATER_POLICIES else policy
+        self.levels = {}
+        self.total = 0
+        
+        self._heap = []
+        self._queued = {} # source -> the level of its live heap entry; all other entries of the source are stale
+        self._sequence = itertools.count() # breaks ties between same-priority sources in the order of queueing
+        self._lock = threading.RLock()
+        
+        for source in sources: self.add(source)
+        
+    def __getitem__(self, source): return self.levels[source]
+    
+    def __iter__(self): return iter(self.levels)
+    
+    def __len__(self): return len(self.levels)
+        
+    def add(self, source, *args, **kwargs):
+        source.index = self
+        self.refresh(source)
+        
+    def discard(self, source, *args, **kwargs):
+        with self._lock:
+            if source not in self.levels: return
+            if source.index is self: source.index = None
+            self.total -= self.levels.pop(source)
+            self._queued.pop(source, None)
+        
+    def refresh(self, source, *args, **kwargs):
+        """Re-reads the level of the given source; called by the sources whenever their contents (or reservations) change."""
+        with source.lock, self._lock:
+            level = source.available
+            self.total += level - self.levels.get(source, 0)
+            self.levels[source] = level
+            self._push(source, level)
+        
+    def allocate(self, volume, *args, **kwargs):
+        """Picks the sources to draw the volume from, according to the policy; does NOT draw (nor reserve) anything.
+        
+        :returns: a dict of sources and the volume to draw from each.
+        """
+        with self._lock:
+            solution = self.policy.split(self, volume)
+            for source in solution: self._push(source, self.levels[source]) # still queued until actually drawn from
+        return solution
+        
+    def peek(self):
+        """Returns the (source, level) pair the policy would allocate from next, or None if all sources are empty."""
+        heap = self._heap
+        while heap:
+            _, _, source, level = heap[0]
+            if self._queued.get(source) == level: return source, level
+            heapq.heappop(heap) # stale
+        return None
+        
+    def pop(self):
+        """Takes the next (source, level) pair off the queue; see peek()."""
+        entry = self.peek()
+        if entry is not None: 
+            heapq.heappop(self._heap)
+            del self._queued[entry[0]]
+        return entry
+        
+    def _push(self, source, level):
+        if self._queued.get(source) == level: return
+        if level <= 0: 
+            self._queued.pop(source, None)
+            return
+            
+        self._queued[source] = level
+        heapq.heappush(self._heap, (self.policy.priority(source, level), next(self._sequence), source, level))
+        if len(self._heap) > 2 * len(self._queued) + 16: self._compact()
             
-    
\ No newline at end of file
+    def _compact(self):
+        self._heap = [entry for entry in self._heap if self._queued.get(entry[2]) == entry[3]]
+        heapq.heapify(self._heap)
@@ -0,0 +1,58 @@
+"""Exceptions raised by the coffeemakers when they cannot brew an order.
+
+All of them are RuntimeErrors, as the coffeemakers have always raised; the subclasses just tell the causes apart,
+each with a short, human-readable cause for reports (see e.g. the load test in the load module).
+"""
+
+
+class BrewingError(RuntimeError):
+    """Base of the errors raised when an order cannot be brewed."""
+    cause = 'brewing error'
+    
+    
+class NotPowered(BrewingError):
+    cause = 'not powered'
+    
+
+class SupplyExhausted(BrewingError):
+    """The machine ran out of some supply; restocking it fixes the problem."""
+    cause = 'supply exhausted'
+    
+class WaterExhausted(SupplyExhausted):
+    cause = 'water exhausted'
+    
+class BeansExhausted(SupplyExhausted):
+    cause = 'beans exhausted'
+    
+    
+class MaintenanceDue(BrewingError):
+    """Some component of the machine needs servicing before it can brew again; restocking (or servicing) it fixes the problem."""
+    cause = 'maintenance due'
+    
+class GroundsBinFull(MaintenanceDue):
+    cause = 'grounds bin full'
+    
+class DescalingDue(MaintenanceDue):
+    cause = 'descaling due'
+    
+    
+class ComponentMissing(BrewingError):
+    """The machine lacks a (working) component needed for the order."""
+    cause = 'component missing'
+    
+class NoWaterSource(ComponentMissing):
+    cause = 'no water source'
+    
+class NoBeanBin(ComponentMissing):
+    cause = 'no bean bin'
+    
+class NoGrinder(ComponentMissing):
+    cause = 'no grinder'
+    
+class NoHeater(ComponentMissing):
+    cause = 'no heater'
+    
+    
+def failure_cause(error):
+    """Returns the short cause of a failed order's exception; for exceptions other than BrewingErrors, their type name."""
+    return getattr(error, 'cause', None) or type(error).__name__
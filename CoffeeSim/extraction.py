@@ -0,0 +1,151 @@
+"""Extraction kinetics - how much of the caffeine in coffee grounds ends up in the brew.
+
+Grounds are a particle-size distribution: the mass fractions of the grounds in a set of log-spaced size bins,
+as produced by a grinder's settings (see grinders.Grinder.particle_sizes()). Each bin extracts by first-order kinetics,
+    yield = 1 - exp(-rate * contact time),
+with the rate growing with the inverse square of the particle size (the diffusion path through a particle),
+with the water temperature (an Arrhenius term) and, mildly, with the brewing pressure.
+
+The per-bin yields only depend on the distribution and the brewing conditions, which repeat from brew to brew,
+so they are cached by those; a simulation brewing the same few presets runs the array math only once per preset.
+Uses NumPy arrays where available, stdlib arrays otherwise.
+"""
+
+import array
+import math
+
+try: import numpy
+except ImportError: numpy = None # optional; falls back to plain Python math over stdlib arrays
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+# Median particle sizes of the named grind settings, in micrometres:
+GRIND_SIZES = {
+    'extra fine': 150,
+    'fine': 300,
+    'medium': 600,
+    'coarse': 1000,
+}
+
+# Brewing pressures of the preset pressure levels, in bars:
+PRESSURE_BARS = {
+    const.PRESSURE_LOW: 1,
+    const.PRESSURE_MEDIUM: 4,
+    const.PRESSURE_HIGH: 9,
+}
+
+BIN_COUNT = 24
+SIZE_RANGE = (50, 3000) # micrometres; the bin bounds are spaced evenly in log-size between these
+
+# Kinetics, calibrated so that medium grounds extract about 90% of their caffeine at 80 degrees, 4 bars and 45 seconds:
+REFERENCE_RATE = 0.07 # 1/s, for particles of REFERENCE_SIZE at REFERENCE_TEMP and 1 bar
+REFERENCE_SIZE = 600 # micrometres
+REFERENCE_TEMP = 80 # degrees
+REFERENCE_CONTACT_TIME = 45 # seconds; the default contact time
+ACTIVATION_ENERGY = 25000 # J/mol
+PRESSURE_GAIN = 0.1 # relative rate increase per bar above atmospheric
+GAS_CONSTANT = 8.314 # J/(mol*K)
+
+_CACHE_SIZE = 4096
+
+
+class ParticleSizes(object):
+    """A particle-size distribution: the bin sizes (micrometres) and the mass fraction of the grounds in each bin.
+
+    Distributions are shared between all the grounds ground with the same settings (see particle_sizes()),
+    and keyed by those settings for caching; treat them as immutable.
+    """
+    __slots__ = ('sizes', 'fractions', 'key')
+
+    def __init__(self, sizes, fractions, key=None, *args, **kwargs):
+        self.sizes = _column(sizes)
+        total = float(sum(fractions))
+        self.fractions = _column([fraction / total for fraction in fractions])
+        self.key = key if key is not None else (tuple(self.sizes), tuple(self.fractions))
+
+    @property
+    def median(self):
+        """The size below which half of the mass lies."""
+        seen = 0
+        for (size, fraction) in zip(self.sizes, self.fractions):
+            seen += fraction
+            if seen >= 0.5: return float(size)
+        return float(self.sizes[-1])
+
+
+def _column(values):
+    return numpy.array(values, dtype=float) if numpy is not None else array.array('d', values)
+
+
+_distributions = {}
+
+def particle_sizes(median=GRIND_SIZES['medium'], spread=0.5, *args, **kwargs):
+    """Returns the (shared) log-normal particle-size distribution of the given median size and spread.
+
+    :param median: optional; the median particle size in micrometres, or a key of GRIND_SIZES.
+    :param spread: optional; the standard deviation of the log-sizes; the larger, the less uniform the grind.
+    """
+    median = GRIND_SIZES.get(median, median)
+    key = (float(median), float(spread))
+    distribution = _distributions.get(key)
+    if distribution is None:
+        log_low, log_high = math.log(SIZE_RANGE[0]), math.log(SIZE_RANGE[1])
+        step = (log_high - log_low) / BIN_COUNT
+        centres = [log_low + (idx + 0.5) * step for idx in range(BIN_COUNT)]
+        log_median = math.log(median)
+        weights = [math.exp(-0.5 * ((centre - log_median) / spread) ** 2) if spread else 0 for centre in centres]
+        if not any(weights): weights[min(range(BIN_COUNT), key=lambda idx: abs(centres[idx] - log_median))] = 1
+        distribution = _distributions[key] = ParticleSizes([math.exp(centre) for centre in centres], weights, key=key)
+    return distribution
+
+
+def rate_factor(temperature, pressure=const.PRESSURE_MEDIUM):
+    """How much faster than at the reference conditions (REFERENCE_TEMP, 1 bar) extraction runs.
+
+    :param pressure: optional; a preset pressure level, or a numeric pressure in bars.
+    """
+    bars = PRESSURE_BARS.get(pressure, pressure)
+    if not isinstance(bars, (int, float)): bars = PRESSURE_BARS[const.PRESSURE_MEDIUM]
+    arrhenius = math.exp(ACTIVATION_ENERGY / GAS_CONSTANT * (1 / (REFERENCE_TEMP + 273.15) - 1 / (temperature + 273.15)))
+    return arrhenius * (1 + PRESSURE_GAIN * max(0, bars - 1))
+
+
+_bin_yields = {}
+
+def bin_yields(distribution, temperature, pressure=const.PRESSURE_MEDIUM, contact_time=REFERENCE_CONTACT_TIME, *args, **kwargs):
+    """The fraction of the caffeine extracted from each size bin of the distribution; cached per distribution and conditions.
+
+    :param distribution: a ParticleSizes
+    :param temperature: the water temperature
+    :param pressure: optional; a preset pressure level, or a numeric pressure in bars
+    :param contact_time: optional; contact time of the water with the grounds, in seconds
+    :returns: the per-bin yields, aligned with the distribution's bins; a NumPy array if available, a stdlib array otherwise.
+    """
+    key = (distribution.key, temperature, pressure, contact_time)
+    yields = _bin_yields.get(key)
+    if yields is None:
+        base = REFERENCE_RATE * rate_factor(temperature, pressure) * contact_time * REFERENCE_SIZE ** 2
+        if numpy is not None: yields = -numpy.expm1(-base / distribution.sizes ** 2)
+        else: yields = array.array('d', (-math.expm1(-base / size ** 2) for size in distribution.sizes))
+        if len(_bin_yields) >= _CACHE_SIZE: _bin_yields.clear()
+        _bin_yields[key] = yields
+    return yields
+
+
+_yields = {}
+
+def extraction_yield(distribution, temperature, pressure=const.PRESSURE_MEDIUM, contact_time=REFERENCE_CONTACT_TIME, *args, **kwargs):
+    """The fraction of the caffeine extracted from the grounds as a whole; see bin_yields().
+
+    :returns: a float between 0 and 1.
+    """
+    key = (distribution.key, temperature, pressure, contact_time)
+    total = _yields.get(key)
+    if total is None:
+        yields = bin_yields(distribution, temperature, pressure=pressure, contact_time=contact_time)
+        total = float(numpy.dot(distribution.fractions, yields)) if numpy is not None \
+                else math.fsum(fraction * bin_yield for (fraction, bin_yield) in zip(distribution.fractions, yields))
+        if len(_yields) >= _CACHE_SIZE: _yields.clear()
+        _yields[key] = total
+    return total
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Multi-process simulation of a whole fleet of coffeemakers, e.g. a café chain.
+
+Machines are spread over a process pool; machines at the same Site share its water line and bean store,
+which live in shared memory. Each machine picks its presets with its own deterministically seeded RNG,
+so a fleet run is reproducible for a given seed - as long as the sites' stock does not run out mid-run,
+as then which orders get served depends on the timing of the processes.
+"""
+
+import collections
+import multiprocessing
+import random
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim.make_coffee import make_coffee
+
+from CoffeeSim.helpers import NULL_SINK
+
+from CoffeeSim.models.generic import GenericCoffeemaker
+
+from CoffeeSim.components.shared_supply import SharedInventory, SharedWaterLine, SharedBeanStore
+
+class FleetRecord(collections.namedtuple('FleetRecord', ('machine', 'order', 'drink', 'volume', 'temperature', 'caffeine', 'error'))):
+    """Compact outcome of a single order in a fleet run; error is the exception type name for failed orders, None otherwise."""
+    __slots__ = ()
+
+
+class Site(object):
+    """A location whose water line and bean store are shared by all of its machines."""
+    
+    def __init__(self, water=10000, beans=10000, *args, **kwargs):
+        self.water = SharedInventory(water)
+        self.beans = SharedInventory(beans)
+        
+
+class SiteCoffeemaker(GenericCoffeemaker):
+    """A GenericCoffeemaker plumbed into its site's water line and fed from its site's bean store."""
+    
+    def __init__(self, site, turned_on=True, *args, **kwargs):
+        super(SiteCoffeemaker, self).__init__(turned_on=turned_on, *args, **kwargs)
+        self.installed_components[const.COMP_WATER] = [SharedWaterLine(site.water, liquid_type=self.materials.Water)]
+        self.installed_components[const.COMP_BEANS] = [SharedBeanStore(site.beans, bean_type=self.materials.CoffeeBeans)]
+        
+
+def machine_seed(seed, machine_id):
+    """Returns the RNG seed of a specific machine in a fleet run with the given base seed."""
+    return "{seed}:{machine}".format(seed=seed, machine=machine_id)
+    
+
+_worker_sites = None
+
+def _init_worker(sites):
+    global _worker_sites
+    _worker_sites = sites
+    
+def _run_machine(task):
+    machine_id, site_idx, order_count, seed, machine_type = task
+    machine = machine_type(site=_worker_sites[site_idx])
+    machine.event_sink = NULL_SINK
+    rng = random.Random(seed)
+    
+    records = []
+    for order_no in range(order_count):
+        try: coffee = make_coffee(machine, rng=rng, quiet=True)
+        except (RuntimeError, RuntimeWarning, ValueError) as err:
+            records.append(FleetRecord(machine_id, order_no, None, 0, 0, 0, type(err).__name__))
+            continue
+        records.append(FleetRecord(machine_id, order_no, coffee.display_name, coffee.volume, coffee.temperature, coffee.caffeine_content, None))
+    return records
+    
+    
+def iter_fleet(machines=1, orders=1, sites=None, processes=None, seed=0, machine_type=SiteCoffeemaker, *args, **kwargs):
+    """Runs a fleet simulation, yielding the FleetRecords as the machines finish their runs.
+    
+    :param machines: optional; number of machines in the fleet; the machines are assigned to sites round-robin.
+    :param orders: optional; number of orders each machine serves.
+    :param sites: optional; Sequence of Sites; by default, each machine gets a site of its own.
+    :param processes: optional; number of worker processes; defaults to the CPU count.
+    :param seed: optional; base RNG seed; see machine_seed().
+    :param machine_type: optional; a coffeemaker class taking a site argument; must be importable by the workers.
+    """
+    sites = list(sites or [Site() for _ in range(machines)])
+    tasks = [(machine_id, machine_id % len(sites), orders, machine_seed(seed, machine_id), machine_type) for machine_id in range(machines)]
+    
+    pool = multiprocessing.Pool(processes=processes, initializer=_init_worker, initargs=(sites,))
+    try:
+        for records in pool.imap_unordered(_run_machine, tasks):
+            for record in records: yield record
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+        
+def run_fleet(*args, **kwargs):
+    """Runs a fleet simulation; see iter_fleet() for the parameters.
+    
+    :returns: a list of all FleetRecords, sorted by machine and order.
+    """
+    return sorted(iter_fleet(*args, **kwargs))
@@ -1,8 +1,129 @@
 # -*- coding: utf-8 -*-
 """Assorted utility functions that might be needed throughout the project and should be shared."""
 
+import collections
+import sys
+import threading
+import time
+
+try: import queue
+except ImportError: import Queue as queue # Python 2
+
 import CoffeeSim.Constants as Constants
 
+EventRecord = collections.namedtuple('EventRecord', ('component', 'event', 'timestamp'))
+
+
+class EventSink(object):
+    """Base for the destinations of the events (e.g. sound effects) of the machines and their components."""
+    enabled = True # disabled sinks are skipped without even formatting the event
+    
+    def emit(self, component, event, *args, **kwargs):
+        """Handles a single event.
+        
+        :param component: name of the component emitting the event, or None if unknown
+        :param event: the event itself - a string
+        """
+        raise NotImplementedError
+        
+    def flush(self, *args, **kwargs): pass
+    
+    
+class NullSink(EventSink):
+    """Discards all events."""
+    enabled = False
+    
+    def emit(self, component, event, *args, **kwargs): pass
+    
+    
+class PrintSink(EventSink):
+    """Prints each event as it happens, as long as Constants.USE_SOUND_EFFECTS is set."""
+    
+    @property
+    def enabled(self): return Constants.USE_SOUND_EFFECTS
+    
+    def emit(self, component, event, *args, **kwargs): print(event)
+    
+    
+class StructuredSink(EventSink):
+    """Records all events as EventRecords of (component, event, timestamp)."""
+    
+    def __init__(self, clock=time.time, *args, **kwargs):
+        """
+        :param clock: optional; callable returning the current timestamp, e.g. to use simulated time instead.
+        """
+        self.clock = clock
+        self.records = []
+        
+    def emit(self, component, event, *args, **kwargs):
+        self.records.append(EventRecord(component, event, self.clock()))
+        
+        
+class RingBufferSink(StructuredSink):
+    """Keeps only the EventRecords of the last maxlen events."""
+    
+    def __init__(self, maxlen=100, clock=time.time, *args, **kwargs):
+        super(RingBufferSink, self).__init__(clock=clock, *args, **kwargs)
+        self.records = collections.deque(maxlen=maxlen)
+        
+        
+class BatchedWriterSink(EventSink):
+    """Writes the events to a stream in batches, from a background thread, so emitting an event never waits for I/O."""
+    
+    def __init__(self, stream=None, batch_size=256, *args, **kwargs):
+        """
+        :param stream: optional; file-like object to write to; defaults to the standard output at the time of writing.
+        :param batch_size: optional; number of events buffered before they are handed off to the writer.
+        """
+        self.stream = stream
+        self.batch_size = batch_size
+        
+        self._batch = []
+        self._lock = threading.Lock()
+        self._pending = queue.Queue()
+        self._writer = None
+        
+    def emit(self, component, event, *args, **kwargs):
+        with self._lock:
+            self._batch.append(event)
+            if len(self._batch) >= self.batch_size: self._submit()
+            
+    def flush(self, *args, **kwargs):
+        """Hands off the buffered events and waits until all of them are written."""
+        with self._lock: 
+            if self._batch: self._submit()
+        self._pending.join()
+        
+    def _submit(self):
+        batch, self._batch = self._batch, []
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_batches, name='BatchedWriterSink')
+            self._writer.daemon = True
+            self._writer.start()
+        self._pending.put(batch)
+        
+    def _write_batches(self):
+        while True:
+            batch = self._pending.get()
+            try:
+                stream = self.stream or sys.stdout
+                stream.write("\n".join(batch) + "\n")
+                stream.flush()
+            finally: self._pending.task_done()
+            
+            
+NULL_SINK = NullSink()
+default_sink = PrintSink()
+
+
 def make_sounds(sound, *sounds, **kwargs):
-    """Helper; just to avoid reliance on bare print()s for I/O."""
-    if Constants.USE_SOUND_EFFECTS: print(str(sound) + ", ".join(map(str, sounds)))
\ No newline at end of file
+    """Helper; just to avoid reliance on bare print()s for I/O.
+    
+    :param sink: optional keyword; EventSink to send the sounds to; defaults to default_sink.
+    :param source: optional keyword; the component making the sounds.
+    """
+    sink = kwargs.get('sink') or default_sink
+    if not sink.enabled: return
+    
+    source = kwargs.get('source')
+    sink.emit(type(source).__name__ if source is not None else None, str(sound) + ", ".join(map(str, sounds)))
@@ -0,0 +1,215 @@
+"""Load testing - a stream of orders arriving at a group of coffeemakers, in simulated time (see the simulation module).
+
+Orders arrive by a constant, Poisson or bursty arrival process, with their presets drawn from a weighted mix,
+and join the queue of the least busy machine; each machine brews its queue as many orders at a time as it has grinders
+or heaters (see simulation.BrewingStation), taking as long
+as its components' duration models say. The report gives the throughput, the queue wait and brew time percentiles,
+the failures by cause and the maintenance stops and downtime - in a fraction of a second per simulated day.
+
+Machines either get restocked instantly whenever they run out of something, or (with a maintenance policy; see the maintenance
+module) stop to be serviced, paying for it in downtime.
+
+Run from the CLI as `python -m CoffeeSim --load`; see -h for the options.
+"""
+
+import collections
+import math
+import random
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim import errors
+
+from CoffeeSim.helpers import NULL_SINK
+
+from CoffeeSim.maintenance import make_policy
+
+from CoffeeSim.presets import generic as presets
+
+from CoffeeSim.simulation import Simulation, Order, BrewingStation, SECONDS_PER_HOUR
+
+ARRIVAL_PROCESSES = ('constant', 'poisson', 'bursty')
+
+
+def arrival_times(process='poisson', rate=60, orders=None, duration=None, burst=5, rng=None, *args, **kwargs):
+    """Generates the arrival times of a stream of orders, in simulated seconds from the start.
+
+    :param process: optional; 'constant' for evenly spaced arrivals, 'poisson' for exponentially distributed gaps between them,
+        or 'bursty' for groups of orders arriving at once, with exponentially distributed gaps between the groups.
+    :param rate: optional; mean arrival rate, in orders per hour.
+    :param orders: optional; number of orders to generate.
+    :param duration: optional; simulated time to generate orders for; at least one of orders and duration is required.
+    :param burst: optional; number of orders per group, for the bursty process.
+    :param rng: optional; a random.Random instance, for reproducible arrivals.
+    """
+    if process not in ARRIVAL_PROCESSES: raise ValueError("Unsupported arrival process: {process}.".format(process=process))
+    if orders is None and duration is None: raise ValueError("Either the number of orders or the duration is required!")
+
+    rng = rng or random.Random()
+    mean_gap = SECONDS_PER_HOUR / float(rate)
+    group = burst if process == 'bursty' else 1
+
+    time, count = 0.0, 0
+    while orders is None or count < orders:
+        if process == 'constant': time = count * mean_gap
+        elif count: time += rng.expovariate(1.0 / (mean_gap * group))
+        if duration is not None and time > duration: return
+
+        for _ in range(group if orders is None else min(group, orders - count)):
+            yield time
+            count += 1
+
+
+def parse_mix(spec=None):
+    """Parses a preset mix, e.g. 'espresso=3,americano=1'; presets without a weight get a weight of 1.
+
+    :returns: a list of (preset, weight) pairs; all standard presets, evenly weighted, if no spec is given.
+    """
+    if not spec: return [(preset, 1) for preset in presets.STANDARD_PRESETS]
+    mix = []
+    for entry in spec.split(','):
+        name, _, weight = entry.partition('=')
+        mix.append((presets.preset_by_name(name), float(weight) if weight.strip() else 1))
+    return mix
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of already sorted values; None if there are none."""
+    if not values: return None
+    return values[max(0, int(math.ceil(fraction * len(values))) - 1)]
+
+
+class LoadStation(BrewingStation):
+    """A BrewingStation that, optionally, restocks its coffeemaker instantly whenever it runs out of something mid-order;
+    unless it has a maintenance policy, which then services the coffeemaker instead.
+    """
+
+    def __init__(self, simulation, coffeemaker, restock=True, *args, **kwargs):
+        super(LoadStation, self).__init__(simulation, coffeemaker, *args, **kwargs)
+        self.restock = restock
+        self.restocks = 0
+
+    def _recover(self, order, stage_idx, error):
+        if self.maintenance is not None: return super(LoadStation, self)._recover(order, stage_idx, error)
+        if not (self.restock and isinstance(error, (errors.SupplyExhausted, errors.MaintenanceDue))): return None
+        if order.stage_state.get('retried') == stage_idx or not any(self.coffeemaker.restock().values()): return None
+        self.restocks += 1
+        order.stage_state['retried'] = stage_idx
+        return 0
+
+
+class LoadTest(object):
+    """A group of coffeemakers serving a stream of orders in simulated time; each order joins the least busy machine."""
+
+    def __init__(self, coffeemakers, restock=True, maintenance=None, *args, **kwargs):
+        """
+        :param maintenance: optional; the name or class of the maintenance policy for each station; see the maintenance module.
+        """
+        self.simulation = Simulation()
+        self.stations = [LoadStation(self.simulation, machine, restock=restock, maintenance=make_policy(maintenance)) 
+                         for machine in coffeemakers]
+        self.placed = 0
+
+    def place(self, preset=None, coffee_volume=None, at=None, *args, **kwargs):
+        """Schedules the arrival of an order; see BrewingStation.place()."""
+        order = Order(preset=preset, coffee_volume=coffee_volume)
+        self.simulation.schedule_at(self.simulation.now if at is None else at, self._dispatch, order)
+        self.placed += 1
+        return order
+
+    def _dispatch(self, order):
+        station = min(self.stations, key=lambda station: (len(station.queue) + station.in_flight) / float(station.concurrency))
+        station._arrive(order)
+
+    def run(self, until=None, *args, **kwargs):
+        return self.simulation.run(until=until)
+
+    def report(self, quantiles=(0.5, 0.95, 0.99), *args, **kwargs):
+        """Summarizes the run so far.
+
+        :returns: a dict of the order counts, the throughput in cups per simulated hour, the per-machine utilization
+            and per-unit utilization of the grinders and heaters, the queue wait and brew time percentiles (in simulated seconds),
+            the failure counts by cause, and the maintenance stops, downtime (in simulated seconds) and services by component type.
+        """
+        completed = [order for station in self.stations for order in station.completed]
+        failed = [order for station in self.stations for order in station.failed]
+        waits = sorted(order.wait_time for order in completed + failed if order.wait_time is not None)
+        brew_times = sorted(order.brew_time for order in completed)
+        elapsed = self.simulation.now
+
+        def summary(values):
+            return collections.OrderedDict(('p{:g}'.format(100 * fraction), percentile(values, fraction)) for fraction in quantiles)
+
+        return {
+            'orders': self.placed,
+            'completed': len(completed),
+            'failed': len(failed),
+            'duration': elapsed,
+            'cups_per_hour': len(completed) * SECONDS_PER_HOUR / float(elapsed) if elapsed else 0,
+            'utilization': [station.utilization() for station in self.stations],
+            'unit_utilization': [station.unit_utilization() for station in self.stations],
+            'restocks': sum(station.restocks for station in self.stations),
+            'maintenance_stops': sum(station.stops for station in self.stations),
+            'downtime': sum(station.downtime for station in self.stations),
+            'services': dict(collections.Counter(record.comptype for station in self.stations for (_, record) in station.services)),
+            'wait': summary(waits),
+            'brew_time': summary(brew_times),
+            'failures': dict(collections.Counter(errors.failure_cause(order.error) for order in failed)),
+        }
+
+
+def run_load(machine_type=None, orders=None, duration=None, arrivals='poisson', rate=60, mix=None, workers=1,
+             seed=None, restock=True, burst=5, maintenance=None, *args, **kwargs):
+    """Runs a load test; see arrival_times() for the arrival parameters.
+
+    :param machine_type: optional; coffeemaker class to use; GenericCoffeemaker by default.
+    :param mix: optional; a Sequence of (preset, weight) pairs, or a spec string for parse_mix().
+    :param workers: optional; number of coffeemakers serving the orders.
+    :param seed: optional; RNG seed, for reproducible runs.
+    :param restock: optional; if True, machines get restocked as soon as they run out of something, without any downtime.
+    :param maintenance: optional; the name or class of a maintenance policy to service the machines with instead, 
+        with downtime; see the maintenance module.
+    :returns: the report dict; see LoadTest.report().
+    """
+    if machine_type is None:
+        from CoffeeSim.models.generic import GenericCoffeemaker
+        machine_type = GenericCoffeemaker
+
+    rng = random.Random(seed)
+    mix = parse_mix(mix) if mix is None or isinstance(mix, str) else list(mix)
+    choices, weights = [preset for (preset, _) in mix], [weight for (_, weight) in mix]
+
+    load_test = LoadTest([machine_type(event_sink=NULL_SINK) for _ in range(max(1, workers))], restock=restock, maintenance=maintenance)
+    for arrival in arrival_times(process=arrivals, rate=rate, orders=orders, duration=duration, burst=burst, rng=rng):
+        load_test.place(preset=rng.choices(choices, weights=weights)[0], at=arrival)
+    load_test.run()
+    return load_test.report()
+
+
+def format_report(report):
+    """Renders a load test report as human-readable text."""
+    def seconds(value): return "-" if value is None else "{:.1f}s".format(value)
+    def percentiles(summary): return ", ".join("{key} {value}".format(key=key, value=seconds(value)) for (key, value) in summary.items())
+
+    lines = [
+        "Orders: {orders} ({completed} completed, {failed} failed) over {hours:.2f} simulated hours".format(hours=report['duration'] / SECONDS_PER_HOUR, **report),
+        "Throughput: {:.1f} cups/hour".format(report['cups_per_hour']),
+        "Utilization: {}".format(", ".join("{:.0%}".format(value) for value in report['utilization'])),
+    ]
+    for comptype in sorted({comptype for units in report.get('unit_utilization', ()) for comptype in units}):
+        lines.append("  {comptype}: {values}".format(comptype=comptype, values=" | ".join(
+            ", ".join("{:.0%}".format(value) for value in units.get(comptype, ())) for units in report['unit_utilization'])))
+    lines += [
+        "Queue wait: {}".format(percentiles(report['wait'])),
+        "Brew time: {}".format(percentiles(report['brew_time'])),
+    ]
+    if report['restocks']: lines.append("Restocks: {}".format(report['restocks']))
+    if report.get('maintenance_stops'):
+        lines.append("Maintenance: {stops} stops, {downtime} downtime ({services})".format(
+            stops=report['maintenance_stops'], downtime=seconds(report['downtime']),
+            services=", ".join("{comptype}: {count}".format(comptype=comptype, count=count) for (comptype, count) in sorted(report['services'].items()))))
+    if report['failures']:
+        lines.append("Failures: {}".format(", ".join("{cause}: {count}".format(cause=cause, count=count)
+                                                     for (cause, count) in sorted(report['failures'].items()))))
+    return "\n".join(lines)
@@ -5,24 +5,33 @@
 import CoffeeSim.Constants as Constants
 const = Constants.Unlocalized
 
-def make_coffee(coffeemaker=None, preset=NotImplemented, *args, **kwargs):
+from CoffeeSim.helpers import NULL_SINK
+
+def make_coffee(coffeemaker=None, preset=NotImplemented, rng=None, quiet=False, event_sink=None, coffee_volume=None, results=None, *args, **kwargs):
     """Abstract, high-level coffeemaking interface.
     
     :param coffeemaker: optional; coffeemaker model to use
     :param preset: optional; preset to use (note: NOT guaranteed to be supported properly!)
+    :param rng: optional; a random.Random instance to pick a random preset with, for reproducible picks
+    :param quiet: optional; if True, does not announce the brewed coffee
+    :param event_sink: optional; helpers.EventSink to send the coffeemaker's events to
+    :param coffee_volume: optional; how much coffee to brew, overriding the preset volume
+    :param results: optional; a results.ResultStore to record the coffee in
     """
     if not coffeemaker or coffeemaker is NotImplemented:
         from CoffeeSim.models.generic import GenericCoffeemaker
         coffeemaker = GenericCoffeemaker()
         
+    if event_sink is not None: coffeemaker.event_sink = event_sink
+        
     if preset is NotImplemented:
         options = getattr(coffeemaker, 'coffee_buttons', None) or tuple()
         if options:
             import random
-            preset = getattr(random.choice(options), 'preset', None)
+            preset = getattr((rng or random).choice(options), 'preset', None)
             
-    coffee = coffeemaker.brew(preset=preset)
-    print("\n~~ {coffee} ~~".format(coffee=coffee))
+    coffee = coffeemaker.brew(preset=preset, coffee_volume=coffee_volume, results=results)
+    if not quiet: print("\n~~ {coffee} ~~".format(coffee=coffee))
     
     return coffee
         
@@ -32,11 +41,14 @@ def main(*args, **kwargs):
     
 def serve_CLI(*args, **kwargs):
     import argparse
+    from CoffeeSim.models import commercial
     
     coffee_maker_mapper = {
         'none': None,
         'generic': None, 
         'default': None,
+        'dual-boiler': commercial.DualBoilerCoffeemaker,
+        'multi-group': commercial.MultiGroupCoffeemaker,
     }
     
     preset_raw_mapper = {
@@ -51,9 +63,23 @@ def serve_CLI(*args, **kwargs):
     arg_parser.add_argument('-q', '--quiet', action='store_true', help="Optional. Silences the sound effects.")
     arg_parser.add_argument('args', nargs='*', help="Optional; passed to the program as *args.")
     
+    load_args = arg_parser.add_argument_group('load test', "Simulates a stream of orders instead of brewing a single cup; see the load module.")
+    load_args.add_argument('--load', action='store_true', help="Runs a load test and prints its report.")
+    load_args.add_argument('-n', '--orders', type=int, help="Number of orders to simulate. Default: 1000, unless --duration is given.")
+    load_args.add_argument('--duration', type=float, help="Simulated time to generate orders for, in hours.")
+    load_args.add_argument('--arrivals', choices=('constant', 'poisson', 'bursty'), default='poisson', help="Arrival process of the orders. Default: poisson.")
+    load_args.add_argument('--rate', type=float, default=60, help="Mean arrival rate, in orders per hour. Default: 60.")
+    load_args.add_argument('--mix', help="Weighted preset mix, e.g. 'espresso=3,americano=1'. Default: all standard presets, evenly.")
+    load_args.add_argument('--workers', type=int, default=1, help="Number of coffeemakers serving the orders. Default: 1.")
+    load_args.add_argument('--seed', type=int, help="RNG seed, for reproducible runs.")
+    load_args.add_argument('--no-restock', action='store_true', help="Fails the orders a machine runs out of supplies for, instead of restocking it.")
+    load_args.add_argument('--maintenance', choices=('reactive', 'predictive'), help="Services the machines by the given policy, with downtime, instead of restocking them instantly; see the maintenance module.")
+    
     parsed_args = vars(arg_parser.parse_args())
     coffee_maker, args = None, tuple()
     
+    load_test = {key: parsed_args.pop(key) for key in ('load', 'orders', 'duration', 'arrivals', 'rate', 'mix', 'workers', 'seed', 'no_restock', 'maintenance')}
+    
     if 'coffeemaker' in parsed_args: 
         coffee_maker_raw = parsed_args.pop('coffeemaker')
         
@@ -67,12 +93,29 @@ def serve_CLI(*args, **kwargs):
         used_preset = preset_raw_mapper.get(preset_raw) or preset_raw_mapper.get(str(preset_raw).lower(), NotImplemented)
         if coffee_maker is NotImplemented: print("WARNING: unspecified preset; a random available preset will be picked.")
         
-    if 'quiet' in parsed_args and parsed_args.pop('quiet'): Constants.USE_SOUND_EFFECTS = False
+    if 'quiet' in parsed_args and parsed_args.pop('quiet'): parsed_args['event_sink'] = NULL_SINK
         
     if 'args' in parsed_args: args = parsed_args.pop('args')
     
+    if load_test.pop('load'): return serve_load(coffee_maker, **load_test)
+    
+    if isinstance(coffee_maker, type): coffee_maker = coffee_maker()
     make_coffee(coffee_maker, preset=used_preset, *args, **parsed_args)
     
+def serve_load(coffee_maker=None, orders=None, duration=None, no_restock=False, *args, **kwargs):
+    from CoffeeSim import load
+    
+    if not coffee_maker or coffee_maker is NotImplemented:
+        from CoffeeSim.models.generic import GenericCoffeemaker
+        coffee_maker = GenericCoffeemaker
+    
+    if duration is not None: duration *= load.SECONDS_PER_HOUR
+    elif orders is None: orders = 1000
+    
+    report = load.run_load(machine_type=coffee_maker, orders=orders, duration=duration, restock=not no_restock, **kwargs)
+    print(load.format_report(report))
+    return report
+    
 if __name__ == '__main__': 
     main()
     
\ No newline at end of file
@@ -0,0 +1,381 @@
+"""Allocation and memory profiling of coffeemakers with tracemalloc - for pinning down what long runs allocate and retain.
+
+An AllocationProfiler instruments coffeemakers the way metrics.BrewMetrics does - wrapping the stage methods of a machine
+instance and the work methods of its components - and, while tracemalloc is tracing, charges each call with the memory
+it left allocated on return (including whatever it returns) and with its peak allocation above where it started.
+Nested calls count towards their callers too, so the stages include the work of the components they use.
+Snapshots taken between the rounds of a workload give the top allocation sites and the growth between snapshots;
+a soak run (see soak()) fails if the memory retained keeps growing past a threshold once the workload has warmed up.
+
+The measurements are process-wide, so profile single-threaded workloads; tracing slows the brews down several times over,
+so this is a mode for investigations and soak tests rather than for every run.
+
+Run from the CLI as `python -m CoffeeSim.memprofile`; see -h for the options.
+"""
+
+import collections
+import functools
+import gc
+import json
+import tracemalloc
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim import errors, metrics
+
+from CoffeeSim.helpers import NULL_SINK
+
+from CoffeeSim.presets import generic as presets
+
+_reset_peak = getattr(tracemalloc, 'reset_peak', None) # Python 3.9+; without it, no peaks are reported
+
+# Allocations of the tracing machinery itself are left out of the snapshots:
+TRACE_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__, all_frames=True),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+class MemoryGrowthError(RuntimeError):
+    """Raised by soak() when the memory retained grows past the threshold; report holds the profile of the run."""
+
+    def __init__(self, message, report=None, *args, **kwargs):
+        super(MemoryGrowthError, self).__init__(message)
+        self.report = report
+
+
+class AllocationProfiler(object):
+    """Collects the allocations of any number of coffeemakers by stage and by component, and snapshots of the traced memory;
+    the measurements are labelled with the machines' class names. Use as a context manager to trace while in the block.
+    """
+
+    stages = ('brew', 'brew_many') + metrics.BrewMetrics.stages
+
+    # Work methods of the components, by component type:
+    component_methods = {
+        const.COMP_WATER: ('fill', 'remove'),
+        const.COMP_BEANS: ('fill_lots', 'draw'),
+        const.COMP_GRINDER: ('grind',),
+        const.COMP_HEATER: ('heat',),
+        const.COMP_FILTER: ('filter',),
+        const.COMP_GROUNDSBIN: ('deposit',),
+    }
+
+    def __init__(self, frames=1, *args, **kwargs):
+        """
+        :param frames: optional; the number of stack frames tracemalloc keeps per allocation; more tell the allocation sites
+            apart by their callers too, at a cost in speed and memory.
+        """
+        self.frames = frames
+
+        self.calls = collections.Counter() # (machine, kind, name) -> number of calls; kind is 'stages' or 'components'
+        self.retained = collections.Counter() # ...-> total memory left allocated on return, in bytes
+        self.peaks = {} # ...-> the highest peak allocation of a single call above its start, in bytes
+
+        self.memory = [] # (label, bytes) pairs; the memory traced at each snapshot
+        self.baseline = self.previous = self.latest = None # tracemalloc Snapshots
+        self.baseline_idx = None # index into memory of the baseline snapshot
+
+        self._instrumented = {} # id(machine) -> list of (object, attribute name) pairs wrapped
+        self._frames = [] # [start, peak] of each call in progress, outermost first
+        self._started = False
+
+    # Tracing:
+
+    def start(self):
+        """Starts tracing, unless tracemalloc already is; see stop()."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started = True
+        tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS) # warms up the caches of the filtering, not to count them as growth
+        return self
+
+    def stop(self):
+        """Stops tracing, if start() started it."""
+        if self._started: tracemalloc.stop()
+        self._started = False
+
+    def __enter__(self): return self.start()
+
+    def __exit__(self, *exc_info): self.stop()
+
+    # Instrumentation:
+
+    def instrument(self, coffeemaker, *args, **kwargs):
+        """Starts charging the calls of the given coffeemaker instance's stages and components with their allocations."""
+        if id(coffeemaker) in self._instrumented: return coffeemaker
+        label = type(coffeemaker).__name__
+        wrapped = self._instrumented[id(coffeemaker)] = []
+
+        for name in self.stages:
+            self._wrap(coffeemaker, name, self._traced(getattr(coffeemaker, name), (label, 'stages', name)), wrapped)
+
+        for comptype, method_names in self.component_methods.items():
+            for idx, component in enumerate(coffeemaker.installed_components.get(comptype) or ()):
+                for method_name in method_names:
+                    method = getattr(component, method_name, None)
+                    if method is None: continue
+                    name = "{comptype}[{idx}].{method}".format(comptype=comptype, idx=idx, method=method_name)
+                    self._wrap(component, method_name, self._traced(method, (label, 'components', name)), wrapped)
+
+        return coffeemaker
+
+    def uninstrument(self, coffeemaker, *args, **kwargs):
+        """Stops profiling the given coffeemaker instance, restoring its original methods."""
+        for (obj, name) in self._instrumented.pop(id(coffeemaker), ()): delattr(obj, name)
+        return coffeemaker
+
+    _wrap = staticmethod(metrics.BrewMetrics._wrap)
+
+    def _traced(self, method, key):
+        frames = self._frames
+
+        @functools.wraps(method)
+        def traced(*args, **kwargs):
+            if not tracemalloc.is_tracing(): return method(*args, **kwargs)
+            current, peak = tracemalloc.get_traced_memory()
+            if frames: frames[-1][1] = max(frames[-1][1], peak) # the caller's peak so far, before resetting it
+            if _reset_peak is not None: _reset_peak()
+            frame = [current, current]
+            frames.append(frame)
+            try: return method(*args, **kwargs)
+            finally:
+                current, peak = tracemalloc.get_traced_memory()
+                frames.pop()
+                frame[1] = max(frame[1], peak)
+                if frames: frames[-1][1] = max(frames[-1][1], frame[1])
+                self.calls[key] += 1
+                self.retained[key] += current - frame[0]
+                self.peaks[key] = max(self.peaks.get(key, 0), frame[1] - frame[0])
+        return traced
+
+    # Snapshots:
+
+    def snapshot(self, label=None, baseline=False, *args, **kwargs):
+        """Takes a snapshot of the traced memory, after a garbage collection, for top_sites() and growth().
+
+        :param label: optional; the label of the snapshot in the memory list; its index by default.
+        :param baseline: optional; if True, growth() is measured since this snapshot by default; the first snapshot is the baseline
+            until another one is marked.
+        :returns: the tracemalloc Snapshot.
+        """
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS)
+        self.previous, self.latest = self.latest, snapshot
+        self.memory.append((len(self.memory) if label is None else label, sum(trace.size for trace in snapshot.traces)))
+        if baseline or self.baseline is None:
+            self.baseline, self.baseline_idx = snapshot, len(self.memory) - 1
+        return snapshot
+
+    @property
+    def growth_bytes(self):
+        """The growth of the memory traced from the baseline snapshot to the latest one, in bytes."""
+        return self.memory[-1][1] - self.memory[self.baseline_idx][1] if self.memory else 0
+
+    @staticmethod
+    def _site(traceback):
+        return " -> ".join("{file}:{line}".format(file=frame.filename, line=frame.lineno) for frame in traceback)
+
+    def top_sites(self, limit=10, *args, **kwargs):
+        """The allocation sites holding the most memory at the latest snapshot.
+
+        :returns: a list of dicts of the site, its size in bytes and the number of its memory blocks, largest first.
+        """
+        if self.latest is None: return []
+        return [{'site': self._site(stat.traceback), 'size': stat.size, 'count': stat.count}
+                for stat in self.latest.statistics('traceback' if self.frames > 1 else 'lineno')[:limit]]
+
+    def growth(self, limit=10, since='baseline', *args, **kwargs):
+        """The allocation sites that grew the most between two snapshots.
+
+        :param since: optional; 'baseline' to compare the latest snapshot to the baseline one, 'previous' to the one before it.
+        :returns: a list of dicts of the site and its growth in bytes and memory blocks, largest first; only the sites that grew.
+        """
+        earlier = self.baseline if since == 'baseline' else self.previous
+        if self.latest is None or earlier is None or earlier is self.latest: return []
+        stats = self.latest.compare_to(earlier, 'traceback' if self.frames > 1 else 'lineno')
+        return [{'site': self._site(stat.traceback), 'size_diff': stat.size_diff, 'count_diff': stat.count_diff}
+                for stat in stats if stat.size_diff > 0][:limit]
+
+    # Export:
+
+    def report(self, limit=10, *args, **kwargs):
+        """Returns the measurements as a JSON-serializable dict: the allocations by machine label, of the 'stages' and
+        the 'components' (each with the calls, the memory retained in total and per call, and the highest peak of a call),
+        the memory traced at each snapshot, its growth since the baseline, the top allocation sites and the sites that grew.
+        """
+        report = {'machines': {}, 'memory': [[label, size] for (label, size) in self.memory], 'growth_bytes': self.growth_bytes,
+                  'top_sites': self.top_sites(limit=limit), 'growth': self.growth(limit=limit)}
+        for (machine, kind, name), calls in self.calls.items():
+            report['machines'].setdefault(machine, {'stages': {}, 'components': {}})[kind][name] = {
+                'calls': calls,
+                'retained': self.retained[(machine, kind, name)],
+                'retained_per_call': self.retained[(machine, kind, name)] / float(calls),
+                'peak': self.peaks[(machine, kind, name)] if _reset_peak is not None else None,
+            }
+        return report
+
+
+class BrewWorkload(object):
+    """Rounds of brews on a single coffeemaker: the presets in turn, by brew() or by brew_many() over batches of orders;
+    the coffeemaker gets restocked whenever it runs out of something. Each call runs one round.
+    """
+
+    def __init__(self, coffeemaker=None, presets=None, brews=1000, batch=None, *args, **kwargs):
+        """
+        :param coffeemaker: optional; a coffeemaker instance; a quiet GenericCoffeemaker by default.
+        :param presets: optional; Sequence of the presets to brew in turn; the standard presets by default.
+        :param brews: optional; the number of brews per round.
+        :param batch: optional; if given, the orders are brewed by brew_many() in batches of this size.
+        """
+        if coffeemaker is None:
+            from CoffeeSim.models.generic import GenericCoffeemaker
+            coffeemaker = GenericCoffeemaker(event_sink=NULL_SINK)
+        self.coffeemaker = coffeemaker
+        self.machines = (coffeemaker,)
+        self.presets = tuple(presets or _standard_presets())
+        self.brews = brews
+        self.batch = batch
+        self.brewed = 0
+
+    def __call__(self, *args, **kwargs):
+        machine = self.coffeemaker
+        orders = [(self.presets[order_no % len(self.presets)], None) for order_no in range(self.brewed, self.brewed + self.brews)]
+        self.brewed += self.brews
+
+        if self.batch:
+            for start in range(0, len(orders), self.batch):
+                batch = orders[start:start + self.batch]
+                _, failures = machine.brew_many(batch)
+                if failures and any(machine.restock().values()): machine.brew_many([batch[failure.index] for failure in failures])
+            return
+
+        for (preset, coffee_volume) in orders:
+            try: machine.brew(preset=preset, coffee_volume=coffee_volume)
+            except (errors.SupplyExhausted, errors.MaintenanceDue):
+                if not any(machine.restock().values()): raise
+                machine.brew(preset=preset, coffee_volume=coffee_volume)
+
+
+def _standard_presets(): return presets.STANDARD_PRESETS
+
+
+def profile(workload, rounds=10, warmup=1, machines=None, frames=1, *args, **kwargs):
+    """Runs a workload under tracemalloc, round by round, taking a snapshot before the first round and after each one;
+    the snapshot after the warm-up rounds is the baseline.
+
+    :param workload: a callable running one round of the workload, e.g. a BrewWorkload.
+    :param rounds: optional; the number of rounds to run after the warm-up.
+    :param warmup: optional; the number of rounds to run first, e.g. to fill up the caches.
+    :param machines: optional; the coffeemakers to instrument; by default, the workload's machines attribute, if any.
+    :param frames: optional; see AllocationProfiler.
+    :returns: the AllocationProfiler, holding the measurements; see AllocationProfiler.report().
+    """
+    profiler = AllocationProfiler(frames=frames)
+    machines = list(getattr(workload, 'machines', ()) if machines is None else machines)
+    for machine in machines: profiler.instrument(machine)
+    try:
+        with profiler:
+            profiler.snapshot(label='start')
+            for round_no in range(warmup + rounds):
+                workload()
+                profiler.snapshot(label=round_no, baseline=round_no + 1 == warmup)
+    finally:
+        for machine in machines: profiler.uninstrument(machine)
+    return profiler
+
+
+def soak(workload, rounds=20, warmup=2, max_growth=1 << 20, limit=10, *args, **kwargs):
+    """Profiles a workload (see profile()) and fails if the memory it retains grows past a threshold after the warm-up.
+
+    :param max_growth: optional; the most the memory traced may grow from the baseline to the last round, in bytes.
+    :returns: the report; see AllocationProfiler.report().
+    :raises MemoryGrowthError: if the memory grew past max_growth; the exception holds the report.
+    """
+    profiler = profile(workload, rounds=rounds, warmup=warmup, **kwargs)
+    report = profiler.report(limit=limit)
+    if profiler.growth_bytes > max_growth:
+        raise MemoryGrowthError("Retained memory grew by {grown} over {rounds} rounds, past the threshold of {max}."
+                                .format(grown=format_size(profiler.growth_bytes), rounds=rounds, max=format_size(max_growth)), report=report)
+    return report
+
+
+def format_size(size):
+    """Renders a size in bytes in the largest binary unit it reaches, e.g. '12.3 KiB'."""
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(size) < 1024: return "{size:.1f} {unit}".format(size=size, unit=unit) if unit != 'B' else "{size} B".format(size=int(size))
+        size /= 1024.0
+    return "{size:.1f} GiB".format(size=size)
+
+
+def format_report(report):
+    """Renders a profile report as human-readable text."""
+    def peak(stats): return "" if stats['peak'] is None else ", peak {}".format(format_size(stats['peak']))
+
+    lines = ["Memory traced: {}".format(", ".join("{label}: {size}".format(label=label, size=format_size(size)) for (label, size) in report['memory'])),
+             "Growth since the baseline: {}".format(format_size(report['growth_bytes']))]
+    for machine, kinds in sorted(report['machines'].items()):
+        for kind in ('stages', 'components'):
+            if not kinds[kind]: continue
+            lines.append("{kind} ({machine}):".format(kind=kind.capitalize(), machine=machine))
+            for name, stats in sorted(kinds[kind].items()):
+                lines.append("  {name}: {calls} calls, {per_call} retained per call{peak}".format(
+                    name=name, calls=stats['calls'], per_call=format_size(stats['retained_per_call']), peak=peak(stats)))
+    if report['top_sites']:
+        lines.append("Top allocation sites:")
+        lines += ["  {site}: {size} in {count} blocks".format(site=site['site'], size=format_size(site['size']), count=site['count'])
+                  for site in report['top_sites']]
+    if report['growth']:
+        lines.append("Growth since the baseline, by site:")
+        lines += ["  {site}: +{size} (+{count} blocks)".format(site=site['site'], size=format_size(site['size_diff']), count=site['count_diff'])
+                  for site in report['growth']]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    import argparse
+    import sys
+    from CoffeeSim.models import commercial, generic
+
+    machine_types = {'generic': generic.GenericCoffeemaker, 'dual-boiler': commercial.DualBoilerCoffeemaker,
+                     'multi-group': commercial.MultiGroupCoffeemaker}
+
+    arg_parser = argparse.ArgumentParser(description="Runs rounds of brews under tracemalloc and reports their allocations.")
+    arg_parser.add_argument('-C', '--coffeemaker', choices=sorted(machine_types), default='generic', help="Optional. Coffeemaker model to use. Default: generic.")
+    arg_parser.add_argument('-P', '--preset', action='append', default=[], help="Optional. Preset to brew; repeat for more, brewed in turn. Default: all standard presets.")
+    arg_parser.add_argument('-n', '--brews', type=int, default=1000, help="Optional. Brews per round. Default: 1000.")
+    arg_parser.add_argument('-r', '--rounds', type=int, default=10, help="Optional. Rounds to run after the warm-up. Default: 10.")
+    arg_parser.add_argument('--warmup', type=int, default=1, help="Optional. Warm-up rounds. Default: 1.")
+    arg_parser.add_argument('--batch', type=int, help="Optional. Brews the orders by brew_many() in batches of this size, rather than one by one.")
+    arg_parser.add_argument('--frames', type=int, default=1, help="Optional. Stack frames kept per allocation. Default: 1.")
+    arg_parser.add_argument('--top', type=int, default=10, help="Optional. Allocation sites to list. Default: 10.")
+    arg_parser.add_argument('--soak', action='store_true', help="Optional. Fails (with exit code 1) if the retained memory grows past --max-growth.")
+    arg_parser.add_argument('--max-growth', type=float, default=1024, help="Optional. Retained memory growth a soak run allows, in KiB. Default: 1024.")
+    arg_parser.add_argument('--json', help="Optional. Path to write the report to, as JSON.")
+    parsed_args = arg_parser.parse_args(argv)
+
+    workload = BrewWorkload(coffeemaker=machine_types[parsed_args.coffeemaker](event_sink=NULL_SINK), brews=parsed_args.brews,
+                            presets=[presets.preset_by_name(name) for name in parsed_args.preset], batch=parsed_args.batch)
+    failure = None
+    if parsed_args.soak:
+        try: report = soak(workload, rounds=parsed_args.rounds, warmup=parsed_args.warmup, max_growth=parsed_args.max_growth * 1024,
+                           limit=parsed_args.top, frames=parsed_args.frames)
+        except MemoryGrowthError as err: report, failure = err.report, err
+    else:
+        report = profile(workload, rounds=parsed_args.rounds, warmup=parsed_args.warmup, frames=parsed_args.frames).report(limit=parsed_args.top)
+
+    print(format_report(report))
+    if parsed_args.json:
+        with open(parsed_args.json, 'w') as report_file: json.dump(report, report_file, indent=2, sort_keys=True)
+    if failure is not None:
+        print("FAILED: {}".format(failure), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""Per-stage brewing metrics - call and failure counters, latency histograms and volumes moved per component.
+
+A BrewMetrics instance collects nothing until it instruments a coffeemaker; it then wraps the machine's stage methods,
+its pick_FOO() hooks and its components' work methods on that one instance only, so a machine that is not instrumented
+pays nothing at all, and subclass overrides of any of the wrapped methods are measured just the same.
+Snapshots export to JSON or to the Prometheus text format.
+"""
+
+import collections
+import functools
+import json
+import math
+import timeit
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+
+class Histogram(object):
+    """A log-bucketed histogram: buckets grow geometrically, so quantiles have a fixed relative error at constant memory."""
+
+    def __init__(self, growth=1.05, smallest=1e-7, *args, **kwargs):
+        """
+        :param growth: optional; ratio of consecutive bucket bounds, i.e. 1 + the relative error of the quantiles.
+        :param smallest: optional; upper bound of the first bucket; all smaller values are counted in it.
+        """
+        self.growth = growth
+        self.smallest = smallest
+        self._log_growth = math.log(growth)
+
+        self.buckets = collections.Counter()
+        self.count = 0
+        self.total = 0
+        self.min = self.max = None
+
+    def add(self, value):
+        bucket = int(math.ceil(math.log(value / self.smallest) / self._log_growth)) if value > self.smallest else 0
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, fraction):
+        """Returns an upper estimate of the value below which the given fraction of the values fall; None if empty."""
+        if not self.count: return None
+        rank = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank: return min(self.max, self.smallest * self.growth ** bucket)
+        return self.max
+
+    def summary(self, quantiles=(0.5, 0.95, 0.99)):
+        summary = {'count': self.count, 'sum': self.total, 'min': self.min, 'max': self.max}
+        summary.update(('p{:g}'.format(100 * fraction), self.quantile(fraction)) for fraction in quantiles)
+        return summary
+
+
+class BrewMetrics(object):
+    """Collects the metrics of any number of coffeemakers; the metrics are labelled with the machines' class names."""
+
+    stages = ('reserve', 'get_water', 'get_grounds', 'get_extract', 'dispose_grounds', 'handle_extras')
+    hooks = ('pick_water_sources', 'pick_bean_sources', 'pick_grinder', 'pick_heater')
+
+    # Component work methods and how to tell the amount of material each call moves:
+    component_methods = {
+        const.COMP_WATER: ('remove', lambda remove_volume=0, *args, **kwargs: remove_volume),
+        const.COMP_BEANS: ('draw', lambda amount=0, *args, **kwargs: amount),
+        const.COMP_GRINDER: ('grind', lambda items=None, *args, **kwargs: sum((items or {}).values())),
+        const.COMP_HEATER: ('heat', lambda items=None, *args, **kwargs: sum(item.volume for item in (items or []))),
+    }
+
+    def __init__(self, clock=timeit.default_timer, *args, **kwargs):
+        self.clock = clock
+        self.enabled = True # instrumented machines skip collection while False
+
+        self.calls = collections.Counter()
+        self.failures = collections.Counter()
+        self.latencies = collections.defaultdict(Histogram)
+        self.volumes = collections.Counter()
+
+        self._instrumented = {} # id(machine) -> list of (object, attribute name) pairs wrapped
+
+    def instrument(self, coffeemaker, *args, **kwargs):
+        """Starts collecting the metrics of the given coffeemaker instance."""
+        if id(coffeemaker) in self._instrumented: return coffeemaker
+        label = type(coffeemaker).__name__
+        wrapped = self._instrumented[id(coffeemaker)] = []
+
+        for name in self.stages + self.hooks:
+            self._wrap(coffeemaker, name, self._timed(getattr(coffeemaker, name), label, name), wrapped)
+
+        for comptype, (method_name, amount_of) in self.component_methods.items():
+            for idx, component in enumerate(coffeemaker.installed_components.get(comptype) or ()):
+                component_label = "{comptype}[{idx}]".format(comptype=comptype, idx=idx)
+                self._wrap(component, method_name, self._metered(getattr(component, method_name), label, component_label, amount_of), wrapped)
+
+        return coffeemaker
+
+    def uninstrument(self, coffeemaker, *args, **kwargs):
+        """Stops collecting the metrics of the given coffeemaker instance, restoring its original methods."""
+        for (obj, name) in self._instrumented.pop(id(coffeemaker), ()): delattr(obj, name)
+        return coffeemaker
+
+    @staticmethod
+    def _wrap(obj, name, wrapper, wrapped):
+        setattr(obj, name, wrapper)
+        wrapped.append((obj, name))
+
+    def _timed(self, method, machine_label, name):
+        key = (machine_label, name)
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            if not self.enabled: return method(*args, **kwargs)
+            start = self.clock()
+            try: return method(*args, **kwargs)
+            except Exception as err:
+                self.failures[key + (type(err).__name__,)] += 1
+                raise
+            finally:
+                self.calls[key] += 1
+                self.latencies[key].add(self.clock() - start)
+        return timed
+
+    def _metered(self, method, machine_label, component_label, amount_of):
+        key = (machine_label, component_label)
+
+        @functools.wraps(method)
+        def metered(*args, **kwargs):
+            result = method(*args, **kwargs)
+            if self.enabled: self.volumes[key] += amount_of(*args, **kwargs)
+            return result
+        return metered
+
+    # Export:
+
+    def snapshot(self, *args, **kwargs):
+        """Returns the current metrics as a JSON-serializable dict, keyed by the machine labels."""
+        snapshot = {}
+        for (machine, name), calls in self.calls.items():
+            snapshot.setdefault(machine, {'stages': {}, 'volumes': {}})['stages'][name] = {
+                'calls': calls,
+                'failures': {err: count for ((fail_machine, fail_name, err), count) in self.failures.items() if (fail_machine, fail_name) == (machine, name)},
+                'latency': self.latencies[(machine, name)].summary(),
+            }
+        for (machine, component), volume in self.volumes.items():
+            snapshot.setdefault(machine, {'stages': {}, 'volumes': {}})['volumes'][component] = volume
+        return snapshot
+
+    def to_json(self, *args, **kwargs):
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self, prefix='coffeesim', *args, **kwargs):
+        """Returns the current metrics in the Prometheus text exposition format."""
+        lines = []
+        def metric(name, kind, doc, samples):
+            lines.append("# HELP {prefix}_{name} {doc}".format(prefix=prefix, name=name, doc=doc))
+            lines.append("# TYPE {prefix}_{name} {kind}".format(prefix=prefix, name=name, kind=kind))
+            for suffix, labels, value in sorted(samples):
+                label_str = ",".join('{}="{}"'.format(key, str(val).replace('"', '\\"')) for (key, val) in labels)
+                lines.append("{prefix}_{name}{suffix}{{{labels}}} {value!r}".format(prefix=prefix, name=name, suffix=suffix, labels=label_str, value=float(value)))
+
+        metric('stage_calls_total', 'counter', "Calls of each brewing stage or hook.",
+               [('', (('machine', machine), ('stage', name)), count) for ((machine, name), count) in self.calls.items()])
+        metric('stage_failures_total', 'counter', "Failed calls of each brewing stage or hook, by exception type.",
+               [('', (('machine', machine), ('stage', name), ('error', err)), count) for ((machine, name, err), count) in self.failures.items()])
+
+        latency_samples = []
+        for (machine, name), histogram in self.latencies.items():
+            labels = (('machine', machine), ('stage', name))
+            for fraction in (0.5, 0.95, 0.99):
+                latency_samples.append(('', labels + (('quantile', fraction),), histogram.quantile(fraction)))
+            latency_samples += [('_sum', labels, histogram.total), ('_count', labels, histogram.count)]
+        metric('stage_seconds', 'summary', "Wall time spent in each brewing stage or hook.", latency_samples)
+
+        metric('component_volume_total', 'counter', "Amount of material moved by each component.",
+               [('', (('machine', machine), ('component', component)), volume) for ((machine, component), volume) in self.volumes.items()])
+        return "\n".join(lines) + "\n"
+
+    def export(self, path, fmt=None, *args, **kwargs):
+        """Writes the current metrics to a local file.
+
+        :param fmt: optional; 'json' or 'prometheus'; by default, JSON for paths ending in .json and Prometheus otherwise.
+        """
+        fmt = fmt or ('json' if str(path).endswith('.json') else 'prometheus')
+        if fmt not in ('json', 'prometheus'): raise ValueError("Unsupported metrics format: {fmt}.".format(fmt=fmt))
+        with open(path, 'w') as export_file:
+            export_file.write(self.to_json() if fmt == 'json' else self.to_prometheus())
+        return path
@@ -0,0 +1,21 @@
+"""Commercial coffeemaker models - machines with several grinders and heaters, brewing more than one order at a time.
+"""
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim.models.generic import GenericCoffeemaker
+
+
+class DualBoilerCoffeemaker(GenericCoffeemaker):
+    """A GenericCoffeemaker with two boilers sharing a single grinder; an order can heat while the next one is being ground."""
+    
+    component_slots = dict(GenericCoffeemaker.component_slots, **{const.COMP_HEATER: 2})
+    
+    
+class MultiGroupCoffeemaker(GenericCoffeemaker):
+    """A commercial machine with a grinder and a boiler per group head; brews one order per group at once."""
+    
+    groups = 2
+    
+    component_slots = dict(GenericCoffeemaker.component_slots, **{const.COMP_GRINDER: groups, const.COMP_HEATER: groups})
@@ -1,17 +1,81 @@
 """Holds the ABC for coffeemaker model definitions.
 """
 
+import collections
+import threading
+
 import CoffeeSim.Constants as Constants
 const = Constants.Unlocalized
 
-from CoffeeSim.components import water_supply, bean_supply, grinders, heaters, interfaces
+from CoffeeSim.components import water_supply, bean_supply, grinders, heaters, filters, grounds_bins, interfaces, reservations
 
 from CoffeeSim.presets import generic as presets
+from CoffeeSim.presets.generic import PresetType
 
 import CoffeeSim.comestibles as comestibles
 
 from CoffeeSim.helpers import make_sounds
 
+from CoffeeSim import errors, maintenance, scheduling
+
+class BrewFailure(collections.namedtuple('BrewFailure', ('index', 'preset', 'volume', 'error'))):
+    """A record of a single order of a batch that could not be brewed; see AbstractCoffeemaker.brew_many()."""
+    __slots__ = ()
+
+class BrewPlan(collections.namedtuple('BrewPlan', ('preset', 'volume', 'strength', 'pressure', 'brew_name', 'extras',
+                                                   'dose', 'temperature', 'contact_time', 'handlers', 'unsupported'))):
+    """The brewing parameters of a preset, resolved for a specific machine class; see AbstractCoffeemaker.plan().
+
+    handlers is a tuple of (handler, is_method) pairs; methods get called with the brewing machine as the first argument.
+    unsupported is a tuple of the extras the machine has no handlers for.
+    """
+    __slots__ = ()
+
+
+_lazy_state_lock = threading.Lock() # guards the lazy creation of the machines' water indices and unit schedulers
+
+
+def _handler_identity(handler):
+    # handlers bound to different instances of the same machine class count as the same handler:
+    return getattr(handler, '__func__', handler)
+
+
+class HandlerRegistry(dict):
+    """A dict of extras to their handlers, counting the changes to its contents; see AbstractCoffeemaker.plan()."""
+    
+    def __init__(self, *args, **kwargs):
+        super(HandlerRegistry, self).__init__(*args, **kwargs)
+        self.version = 0
+        
+    def __setitem__(self, extra, handler):
+        if extra in self and _handler_identity(self[extra]) == _handler_identity(handler):
+            return super(HandlerRegistry, self).__setitem__(extra, handler) # re-registering the same handler changes nothing
+        super(HandlerRegistry, self).__setitem__(extra, handler)
+        self.version += 1
+        
+    def __delitem__(self, extra):
+        super(HandlerRegistry, self).__delitem__(extra)
+        self.version += 1
+        
+    def update(self, *args, **kwargs):
+        for (extra, handler) in dict(*args, **kwargs).items(): self[extra] = handler
+        
+    def setdefault(self, extra, handler=None):
+        if extra not in self: self[extra] = handler
+        return self[extra]
+        
+    def pop(self, *args):
+        self.version += 1
+        return super(HandlerRegistry, self).pop(*args)
+        
+    def popitem(self):
+        self.version += 1
+        return super(HandlerRegistry, self).popitem()
+        
+    def clear(self):
+        self.version += 1
+        super(HandlerRegistry, self).clear()
+
 class AbstractCoffeemaker(object):
     """An abstract base for all Coffeemakers; as such, it only defines the API and is *NOT* suitable for direct use.
     If you need a non-specific *functional* model, see the GenericCoffeemaker subclass.
@@ -30,56 +94,409 @@ class AbstractCoffeemaker(object):
     
     installed_components = {comptype: None for comptype in component_slots}
     
-    extra_handlers = dict()
+    extra_handlers = HandlerRegistry()
+    
+    _plans = {} # compiled BrewPlans, by (machine class, preset)
+    
+    # Module providing the classes of the drinks and raw materials the machine makes; e.g. CoffeeSim.compact_comestibles.
+    materials = comestibles
+    
+    # Amount of beans to grind per brew, by preset strength:
+    strength2amt = {
+        const.STRENGTH_LOW: 35,
+        const.STRENGTH_MEDIUM: 100,
+        const.STRENGTH_HIGH: 200,
+    }
+    default_amt = 100
+    
+    brew_temperature = 0.8*(const.WATER_EVAPORATE_PT-const.WATER_FREEZE_PT)
+    
+    # Duration models of the steps not handled by any component, in seconds:
+    pressure2time = { # contact time of the water with the grounds
+        const.PRESSURE_LOW: 180,
+        const.PRESSURE_MEDIUM: 45,
+        const.PRESSURE_HIGH: 25,
+    }
+    default_time = 45
+    extra_time = 15 # per extra
+    
+    # Opt-in allocation policy for machines with many water sources, e.g. 'balance_levels'; see water_supply.WATER_POLICIES.
+    # With a policy set, the water sources are tracked in an incrementally updated WaterSourceIndex;
+    # with None, every draw re-reads all source levels and drains the sources in the order of installation.
+    water_policy = None
+    
+    machine_id = 0 # identifies the machine's drinks in result stores; see the results module
     
     def __init__(self, *args, **kwargs): raise NotImplementedError
+    
+    def connect(self, *args, **kwargs):
+        """Sets up whatever the machine needs beyond its components - its interface, extra handlers, etc.
+        Called by the constructor, and on restoring the machine from a snapshot (see the checkpoint module).
+        """
+        pass
+    
+    @property
+    def water_index(self):
+        """The WaterSourceIndex of the installed water sources if the machine has a water_policy; None otherwise."""
+        if self.water_policy is None: return None
+        sources = self.installed_components.get(const.COMP_WATER) or ()
+        key = (self.water_policy, id(sources), len(sources)) # rebuilt whenever the policy or the installed sources change
+        if getattr(self, '_water_index_key', None) != key:
+            with _lazy_state_lock:
+                if getattr(self, '_water_index_key', None) != key:
+                    self._water_index = water_supply.WaterSourceIndex(sources=sources, policy=self.water_policy)
+                    self._water_index_key = key
+        return self._water_index
+    
+    @property
+    def unit_scheduler(self):
+        """The scheduling.UnitScheduler spreading the machine's work over its grinders and heaters, outside of simulated time."""
+        scheduler = getattr(self, '_unit_scheduler', None)
+        if scheduler is None:
+            with _lazy_state_lock:
+                scheduler = getattr(self, '_unit_scheduler', None)
+                if scheduler is None: scheduler = self._unit_scheduler = scheduling.UnitScheduler()
+        return scheduler
+    
+    @property
+    def event_sink(self): 
+        """The EventSink receiving the events of all of the installed components; None for the default sink."""
+        return getattr(self, '_event_sink', None)
+        
+    @event_sink.setter
+    def event_sink(self, sink):
+        self._event_sink = sink
+        for components in self.installed_components.values():
+            for component in (components or ()): component.event_sink = sink
 
-    def brew(self, preset=None, coffee_volume=None, *args, **kwargs):
+    def brew(self, preset=None, coffee_volume=None, results=None, *args, **kwargs):
         """High-level brewing simulation.
         
+        Safe to call from many threads on the same machine: the water and beans for the coffee, and the filtering capacity
+        and grounds bin room they take, are reserved up front (see reserve()), so concurrent brews can never count on 
+        the same supplies; if the brew fails, whatever it has not drawn yet is handed back.
+        
         :param preset: optional; a drink type preset to use, e.g. Espresso or Americano.
         :param coffee_volume: optional, numeric; how much coffee to brew. If specified, overrides the preset value.
+        :param results: optional; a results.ResultStore to record the brewed coffee in.
         :param **kwargs: passed along to callees.
         """
         if not self.powered: return None
-        coffee_volume = coffee_volume or (preset.volume if preset else None) or Constants.DEFAULT_VOLUME
-        
-        strength = preset.strength if preset else const.STRENGTH_MEDIUM
-        pressure = preset.pressure if preset else const.PRESSURE_MEDIUM
-        brewname = preset.output_name if preset else const.BREWTYPE_GENERIC
-        extras = preset.extras if preset else None
+        plan = self.plan(preset)
+        coffee_volume = coffee_volume or plan.volume
         
-        water = self.get_water(volume=coffee_volume, **kwargs)
-        grounds = self.get_grounds(strength=strength, **kwargs)
+        with self.reserve(volume=coffee_volume, amount=plan.dose, **kwargs) as reservation:
+            water = self.get_water(volume=coffee_volume, reservation=reservation, **kwargs)
+            grounds = self.get_grounds(strength=plan.strength, amount=plan.dose, reservation=reservation, **kwargs)
         
-        extract, spent_grounds = self.get_extract(grounds=grounds, medium=water, brew_name=brewname, **kwargs)
+            extract, spent_grounds = self.get_extract(grounds=grounds, medium=water, brew_name=plan.brew_name, 
+                                                      pressure=plan.pressure, contact_time=plan.contact_time, **kwargs)
         
-        self.dispose_grounds(grounds=spent_grounds, **kwargs)
+            self.dispose_grounds(grounds=spent_grounds, reservation=reservation, **kwargs)
         
-        coffee = self.handle_extras(brew=extract, extras=extras, **kwargs)
+        coffee = self.handle_extras(brew=extract, extras=plan.extras, plan=plan, **kwargs)
         
+        if results is not None: self.record(results, coffee, plan)
         return coffee
         
-    def get_water(self, volume=Constants.DEFAULT_VOLUME, *args, **kwargs):
+    def brew_many(self, orders, results=None, *args, **kwargs):
+        """High-level batch brewing simulation. 
+        
+        Brews the same drinks as calling brew() for each order in turn would, but runs each stage over the whole batch at once,
+        so components are resolved and water and beans are reserved once per batch, not once per cup.
+        Note that the batch goes through the pick_FOO() hooks, but not through get_FOO() overrides.
+        
+        :param orders: Iterable of (preset, coffee_volume) pairs; either may be None, with the same meaning as in brew().
+        :param results: optional; a results.ResultStore to record the brewed coffees in, in the order of the orders.
+        :param **kwargs: passed along to callees.
+        :returns: a tuple of (brews, failures); brews is a list aligned with orders, holding None for each order that failed, 
+            failures is a list of BrewFailure records for those orders.
+        """
+        orders = list(orders)
+        brews, failures = [None] * len(orders), []
+        if not self.powered: return brews, failures
+        
+        def fail(indices, error):
+            for idx in indices: failures.append(BrewFailure(index=idx, preset=orders[idx][0], volume=orders[idx][1], error=error))
+            return []
+        
+        plans = {}
+        for (preset, _) in orders:
+            if preset not in plans: plans[preset] = self.plan(preset)
+            
+        water_sources = self.installed_components.get(const.COMP_WATER)
+        bean_sources = self.installed_components.get(const.COMP_BEANS)
+        grinders = self.installed_components.get(const.COMP_GRINDER)
+        heaters = self.installed_components.get(const.COMP_HEATER)
+        
+        pending = list(range(len(orders)))
+        if not water_sources: pending = fail(pending, errors.NoWaterSource("No water sources available!"))
+        if not bean_sources: pending = fail(pending, errors.NoBeanBin("Coffee bin not found!"))
+        if not grinders: pending = fail(pending, errors.NoGrinder("No operational bean grinder found!"))
+        if not heaters: pending = fail(pending, errors.NoHeater("No operational heater found!"))
+        if not pending: return brews, failures
+        
+        # Supplies - check the availability once and reserve the water and beans (and the filtering and grounds bin room they take)
+        # for all accepted orders in one go; whatever the failed orders leave uncommitted is handed back at the end of the batch:
+        volumes = {idx: orders[idx][1] or plans[orders[idx][0]].volume for idx in pending}
+        available_vol = sum(src.available for src in water_sources) if self.water_policy is None else self.water_index.total
+        
+        doses = {idx: plans[orders[idx][0]].dose for idx in pending}
+        available_amt = sum(src.available for src in bean_sources)
+        
+        accepted = []
+        for idx in pending:
+            if volumes[idx] > available_vol: 
+                fail([idx], errors.WaterExhausted("Water levels insufficient!"))
+                continue
+            if doses[idx] > available_amt: 
+                fail([idx], errors.BeansExhausted("Coffee beans insufficient!"))
+                continue
+            available_vol -= volumes[idx]
+            available_amt -= doses[idx]
+            accepted.append(idx)
+        if not accepted: return brews, failures
+        
+        try: reservation = self.reserve(volume=sum(volumes[idx] for idx in accepted), amount=sum(doses[idx] for idx in accepted), **kwargs)
+        except (errors.SupplyExhausted, errors.MaintenanceDue):
+            # the supplies ran low since the check, e.g. with other threads brewing on the machine - reserve order by order instead:
+            reservation, reserved = reservations.Reservation(), []
+            for idx in accepted:
+                try: reservation.merge(self.reserve(volume=volumes[idx], amount=doses[idx], **kwargs)) # each order all or nothing
+                except (errors.SupplyExhausted, errors.MaintenanceDue) as err: fail([idx], err)
+                else: reserved.append(idx)
+            accepted = reserved
+            if not accepted: return brews, failures
+        
+        with reservation:
+            reservation.commit(const.COMP_WATER)
+            reservation.commit(const.COMP_FILTER)
+            waters = {idx: self.materials.Water(volume=volumes[idx]) for idx in accepted}
+            beans = {idx: self.merge_beans(reservation.commit(const.COMP_BEANS, amount=doses[idx])) for idx in accepted}
+        
+            # Grounds - one run per grinder, over the beans of the orders it got picked for:
+            grind_jobs = collections.OrderedDict()
+            for idx in accepted:
+                items = {beans[idx]: beans[idx].amount}
+                grind_jobs.setdefault(self.pick_grinder(grinders=grinders, items=items), {}).update(items)
+            grind_result = {}
+            for (grinder, items) in grind_jobs.items(): grind_result.update(grinder.grind(items=items))
+            grounds = {idx: grind_result.get(beans[idx], {}).get(const.MAT_GROUNDS) for idx in accepted}
+        
+            # Extraction - one run per heater, over the water of the orders it got picked for:
+            heat_jobs = collections.OrderedDict()
+            for idx in accepted: heat_jobs.setdefault(self.pick_heater(heaters=heaters, items=[waters[idx]]), []).append(waters[idx])
+            heated = {}
+            for (heater, items) in heat_jobs.items(): heated.update(heater.heat(items=items, target_temp=self.brew_temperature))
+        
+            for idx in accepted:
+                plan = plans[orders[idx][0]]
+            
+                try:
+                    extract = self.make_extract(grounds=grounds[idx], medium=heated[waters[idx]], brew_name=plan.brew_name, 
+                                                pressure=plan.pressure, contact_time=plan.contact_time, **kwargs)
+                    self.dispose_grounds(grounds=grounds[idx], reservation=reservation, **kwargs)
+                
+                    brews[idx] = self.apply_plan_extras(brew=extract, plan=plan)
+                
+                except (RuntimeError, RuntimeWarning, ValueError) as err: fail([idx], err)
+                
+        if results is not None:
+            for idx in accepted:
+                if brews[idx] is not None: self.record(results, brews[idx], plans[orders[idx][0]])
+        return brews, failures
+        
+    def record(self, results, coffee, plan, *args, **kwargs):
+        """Appends a brewed coffee to a results.ResultStore, with the preset and the extras of its BrewPlan."""
+        extras = [extra for extra in (plan.extras or ()) if extra not in plan.unsupported]
+        return results.append(coffee, preset=plan.preset, extras=extras, machine=self.machine_id)
+        
+    def resolve_preset(self, preset=None, *args, **kwargs):
+        """Handles reading the brewing parameters off a preset, falling back to the machine defaults where there's none.
+        
+        :param preset: optional; a drink type preset.
+        :returns: a tuple of (volume, strength, pressure, output name, extras).
+        """
+        if not preset: return (Constants.DEFAULT_VOLUME, const.STRENGTH_MEDIUM, const.PRESSURE_MEDIUM, const.BREWTYPE_GENERIC, None)
+        return (preset.volume or Constants.DEFAULT_VOLUME, preset.strength, preset.pressure, preset.output_name, preset.extras)
+        
+    def plan(self, preset=None, *args, **kwargs):
+        """Returns the BrewPlan of the preset for the machine's class, compiling it on first use.
+        
+        Plans are cached per (machine class, preset) and recompiled whenever any preset or the extra_handlers change;
+        they are compiled from the class attributes (strength2amt, brew_temperature...), so changes to those 
+        at runtime need an invalidate_plans() call.
+        """
+        key = (type(self), preset)
+        cached = self._plans.get(key)
+        versions = (PresetType.version, getattr(self.extra_handlers, 'version', None))
+        if cached is not None and cached[0] == versions and versions[1] is not None: return cached[1]
+        
+        plan = self.compile_plan(preset)
+        self._plans[key] = (versions, plan)
+        return plan
+        
+    def compile_plan(self, preset=None, *args, **kwargs):
+        """Resolves the preset into a BrewPlan; reports any unsupported extras, once."""
+        volume, strength, pressure, brew_name, extras = self.resolve_preset(preset)
+        machine_type = type(self)
+        
+        handlers, unsupported = [], []
+        for extra in (extras or ()):
+            handler = self.extra_handlers.get(extra, NotImplemented)
+            if handler is NotImplemented: 
+                unsupported.append(extra)
+                continue
+            # methods of this machine class get bound to whichever instance is brewing, not the one that registered them:
+            owner = getattr(handler, '__self__', None)
+            is_method = owner is not None and isinstance(owner, AbstractCoffeemaker) and issubclass(machine_type, type(owner))
+            handlers.append((handler.__func__, True) if is_method else (handler, False))
+            
+        for extra in unsupported: 
+            print("WARNING: '{}' extra not supported on {} machines, skipping!".format(extra, machine_type.__name__))
+            
+        return BrewPlan(
+            preset=preset, volume=volume, strength=strength, pressure=pressure, brew_name=brew_name, extras=extras,
+            dose=machine_type.strength2amt.get(strength, machine_type.default_amt),
+            temperature=machine_type.brew_temperature,
+            contact_time=machine_type.pressure2time.get(pressure, machine_type.default_time),
+            handlers=tuple(handlers), unsupported=tuple(unsupported),
+        )
+        
+    @classmethod
+    def invalidate_plans(cls, *args, **kwargs):
+        """Drops the compiled plans of this machine class and its subclasses."""
+        for key in [key for key in cls._plans if issubclass(key[0], cls)]: del cls._plans[key]
+        
+    def reserve(self, volume=Constants.DEFAULT_VOLUME, amount=None, *args, **kwargs):
+        """Atomically sets aside the water and beans for a brew, for get_water() and get_grounds() to draw later,
+        along with the room for the spent grounds, for dispose_grounds(); either all are reserved, or none is.
+        
+        :param volume: optional, numeric; the volume of water to reserve.
+        :param amount: optional, numeric; the amount of beans to reserve; none by default.
+        :returns: a reservations.Reservation; cancel() it (or use it as a context manager) to hand back whatever is not drawn.
+        """
+        reservation = self.reserve_water(volume=volume, **kwargs)
+        if amount: 
+            self.reserve_beans(amount=amount, reservation=reservation, **kwargs) # hands the water back if the beans run out
+            self.reserve_bin_space(amount=amount, reservation=reservation, **kwargs)
+        return reservation
+        
+    def reserve_water(self, volume=Constants.DEFAULT_VOLUME, reservation=None, *args, **kwargs):
+        """Atomically sets aside the specified volume of water, split between the sources by pick_water_sources(),
+        along with the filtering capacity for it.
+        
+        :param reservation: optional; a reservations.Reservation to add to; cancelled as a whole if the water runs out.
+        :returns: the reservation; a new one by default.
+        """
+        sources = self.installed_components.get(const.COMP_WATER)
+        reservation = self._reserve_supplies(const.COMP_WATER, sources, volume, self.pick_water_sources, reservation, index=self.water_index,
+                                             missing=errors.NoWaterSource("No water sources available!"), 
+                                             exhausted=errors.WaterExhausted("Water levels insufficient!"), **kwargs)
+        return self._reserve_capacity(const.COMP_FILTER, volume, reservation, exhausted=errors.DescalingDue("Filter spent; descaling due!"))
+        
+    def reserve_beans(self, amount=None, reservation=None, *args, **kwargs):
+        """Atomically sets aside the specified amount of beans, split between the containers by pick_bean_sources().
+        
+        :param reservation: optional; a reservations.Reservation to add to; cancelled as a whole if the beans run out.
+        :returns: the reservation; a new one by default.
+        """
+        sources = self.installed_components.get(const.COMP_BEANS)
+        return self._reserve_supplies(const.COMP_BEANS, sources, self.default_amt if amount is None else amount, self.pick_bean_sources, 
+                                      reservation, missing=errors.NoBeanBin("Coffee bin not found!"), 
+                                      exhausted=errors.BeansExhausted("Coffee beans insufficient!"), **kwargs)
+        
+    def reserve_bin_space(self, amount=None, reservation=None, *args, **kwargs):
+        """Atomically sets aside the room for the specified amount of spent grounds in the grounds bins.
+        
+        :param reservation: optional; a reservations.Reservation to add to; cancelled as a whole if the bins are full.
+        :returns: the reservation; a new one by default.
+        """
+        if reservation is None: reservation = reservations.Reservation()
+        return self._reserve_capacity(const.COMP_GROUNDSBIN, self.default_amt if amount is None else amount, reservation, 
+                                      exhausted=errors.GroundsBinFull("Grounds bin full!"))
+        
+    def _reserve_capacity(self, comptype, needed_amt, reservation, exhausted, *args, **kwargs):
+        """Reserves the amount on the components of the given type, in the order they were installed - e.g. the room 
+        in the grounds bins; if they fall short, cancels the reservation and raises. Machines without any need none.
+        """
+        components = self.installed_components.get(comptype)
+        if not components: return reservation
+        
+        for component in components:
+            if needed_amt <= 0: break
+            reserved = component.reserve(needed_amt, partial=True)
+            reservation.add(comptype, component, reserved)
+            needed_amt -= reserved
+            
+        if needed_amt > 0:
+            reservation.cancel()
+            raise exhausted
+        return reservation
+        
+    def _reserve_supplies(self, comptype, sources, needed_amt, pick, reservation, missing, exhausted, index=None, *args, **kwargs):
+        """Reserves the amount on the sources, as picked out of their available amounts; re-picks for whatever other threads
+        reserved in the meantime, until the sources run out - in which case it cancels the reservation and raises.
+        """
+        if reservation is None: reservation = reservations.Reservation()
+        if not sources: 
+            reservation.cancel()
+            raise missing
+        
+        while needed_amt > 0:
+            levels = {src: src.available for src in sources} if index is None else index
+            available_amt = sum(levels.values()) if index is None else index.total
+            picked = pick(sources=levels, needed_amt=needed_amt, **kwargs) if available_amt >= needed_amt else {}
+            
+            attempted = False
+            for (src, amt) in picked.items():
+                if amt <= 0: continue
+                attempted = True
+                reserved = src.reserve(amt, partial=True)
+                reservation.add(comptype, src, reserved)
+                needed_amt -= reserved
+                
+            if not attempted: 
+                reservation.cancel()
+                raise exhausted
+        return reservation
+        
+    def get_water(self, volume=Constants.DEFAULT_VOLUME, reservation=None, *args, **kwargs):
         """Handles the provision of water for the extraction process.
         
         :param volume: optional, numeric; requested amount of water.
+        :param reservation: optional; a reservations.Reservation to draw the water (and filter it) from, e.g. made by reserve();
+            by default, the water is reserved (see reserve_water()) and drawn right away.
         :param **kwargs: passed to callees.
         """
         if not self.powered: return None
         
-        sources = self.installed_components.get(const.COMP_WATER)
-        if not sources: raise RuntimeError("No water sources available!")
-        sources = {src: src.contents_volume for src in sources}
+        if reservation is None: 
+            with self.reserve_water(volume=volume, **kwargs) as reservation: 
+                water_found = reservation.commit(const.COMP_WATER)
+                reservation.commit(const.COMP_FILTER)
+        else: 
+            water_found = reservation.commit(const.COMP_WATER, amount=volume)
+            reservation.commit(const.COMP_FILTER, amount=volume)
+        obtained_vol = sum((liquid.volume for transferred in water_found for liquid in transferred))
+                
+        water_pool = self.materials.Water(volume=obtained_vol) # to simplify things for now - merge the water pool instances.
+        return water_pool
         
+    def draw_water(self, sources, volume, *args, **kwargs):
+        """Handles the transfer of water out of the sources; does NOT check the availability beforehand, 
+        nor respect any reservations - unlike get_water().
+        
+        :param sources: water sources to draw from; Mapping of objects to stored volumes, e.g. a WaterSourceIndex.
+        :param volume: numeric; the requested amount of water.
+        :returns: a Set of the drawn liquids.
+        """
         water_found = set()
         obtained_vol, needed_vol = 0, volume
         
-        available_vol = sum(( contents for contents in sources.values() ))
-        if available_vol < needed_vol: raise RuntimeError("Water levels insufficient!")
-        
         while obtained_vol < needed_vol:
-            water_sources = self.pick_water_sources(sources=sources, needed_amt=needed_vol, **kwargs)
+            water_sources = self.pick_water_sources(sources=sources, needed_amt=needed_vol - obtained_vol, **kwargs)
+            if not water_sources: break # nothing left to draw from
             
             for (curr_src, curr_vol) in water_sources.items():
                 curr_src.contents, transferred = curr_src.remove(remove_volume=curr_vol)
@@ -89,82 +506,144 @@ class AbstractCoffeemaker(object):
                 # a bit ugly to use tuple unpacking here, but it should enforce the synchronization of transfer on both ends.
                 if obtained_vol >= needed_vol: break # shouldn't really be necessary, but there's no harm in being a bit paranoid.
                 
-        water_pool = comestibles.Water(volume=obtained_vol) # to simplify things for now - merge the water pool instances.
-        return water_pool
+        return water_found
         
-    def get_grounds(self, strength=None, *args, **kwargs):
-        """Handles the provision of coffee grounds for the extraction process. """
-        strength2amt = {
-            const.STRENGTH_LOW: 35,
-            const.STRENGTH_MEDIUM: 100,
-            const.STRENGTH_HIGH: 200,
-        }
-        amt = strength2amt.get(strength, 100)
+    def get_grounds(self, strength=None, amount=None, grinder=None, reservation=None, *args, **kwargs):
+        """Handles the provision of coffee grounds for the extraction process. 
+        
+        :param amount: optional; the amount of beans to grind, if already resolved; overrides the strength.
+        :param grinder: optional; the grinder to use, if already picked (and booked); by default, one is picked with pick_grinder().
+        :param reservation: optional; a reservations.Reservation to draw the beans from, e.g. made by reserve();
+            by default, the beans are reserved (see reserve_beans()) and drawn right away.
+        """
+        amt = self.strength2amt.get(strength, self.default_amt) if amount is None else amount
         
         sources = self.installed_components.get(const.COMP_BEANS)
         grinders = self.installed_components.get(const.COMP_GRINDER)
         
-        if not sources: raise RuntimeError("Coffee bin not found!")
-        if not grinders: raise RuntimeError("No operational bean grinder found!")
+        if not sources: raise errors.NoBeanBin("Coffee bin not found!")
+        if not grinders: raise errors.NoGrinder("No operational bean grinder found!")
         
-        beans = self.pick_bean_sources(sources=sources, needed_amt=amt)
+        if reservation is None: 
+            with self.reserve_beans(amount=amt, **kwargs) as reservation: drawn = reservation.commit(const.COMP_BEANS)
+        else: drawn = reservation.commit(const.COMP_BEANS, amount=amt)
+        beans = self.merge_beans(drawn)
         
-        grind_result = self.pick_grinder(grinders=grinders).grind(items={beans: beans.amount})
+        items = {beans: beans.amount}
+        if grinder is None: grinder = self.pick_grinder(grinders=grinders, items=items)
+        grind_result = grinder.grind(items=items)
         
         grounds = grind_result.get(beans, {}).get(const.MAT_GROUNDS)
         
         return grounds
         
-    def get_extract(self, grounds=None, medium=None, brew_name=None, *args, **kwargs):
+    def draw_beans(self, sources, amount, *args, **kwargs):
+        """Handles the transfer of beans out of the containers; does NOT check the availability beforehand, 
+        nor respect any reservations - unlike get_grounds().
+        
+        :param sources: bean containers to draw from; Mapping of objects to stored amounts.
+        :param amount: numeric; the requested amount of beans.
+        :returns: the drawn beans, merged into a single item.
+        """
+        drawn = [src.draw(amt) for (src, amt) in self.pick_bean_sources(sources=sources, needed_amt=amount, **kwargs).items() if amt > 0]
+        return self.merge_beans(drawn)
+        
+    def merge_beans(self, drawn, *args, **kwargs):
+        """Merges the beans drawn from several containers into a single item, with their mean caffeine density."""
+        if len(drawn) == 1: return drawn[0]
+        
+        drawn_amt = sum((beans.amount for beans in drawn))
+        caffeine = sum((beans.amount * beans.caffeine_density for beans in drawn))
+        return self.materials.CoffeeBeans(amount=drawn_amt, caffeine_density=(caffeine / float(drawn_amt)) if drawn_amt else 1)
+        
+    def get_extract(self, grounds=None, medium=None, brew_name=None, pressure=None, contact_time=None, heater=None, *args, **kwargs):
         """Handles the process of brewing a basic coffee bean extract - i.e. plain black coffee.
         
         :param grounds: brewable caffeine source
         :param medium: heatable liquid
+        :param pressure: optional; brewing pressure level; see make_extract().
+        :param contact_time: optional; see make_extract().
+        :param heater: optional; the heater to use, if already picked (and booked); by default, one is picked with pick_heater().
         """
         if not (self.powered and grounds and medium): return medium
         
-        heater = self.pick_heater(heaters=self.installed_components.get(const.COMP_HEATER))
         to_heat = [medium]
-        heated = heater.heat(items=to_heat, target_temp=0.8*(const.WATER_EVAPORATE_PT-const.WATER_FREEZE_PT))
+        if heater is None: heater = self.pick_heater(heaters=self.installed_components.get(const.COMP_HEATER), items=to_heat)
+        if heater is None: raise errors.NoHeater("No operational heater found!")
+        heated = heater.heat(items=to_heat, target_temp=self.brew_temperature)
         heated = heated[medium]
         
-        caffeine = grounds.extract() if grounds else NotImplemented
+        brew = self.make_extract(grounds=grounds, medium=heated, brew_name=brew_name, pressure=pressure, contact_time=contact_time, **kwargs)
+        return brew, grounds
+        
+    def make_extract(self, grounds=None, medium=None, brew_name=None, pressure=None, contact_time=None, *args, **kwargs):
+        """Handles extracting the grounds into an already heated medium.
         
-        brew = (heated if caffeine is NotImplemented 
-                       else comestibles.Coffee(
-                                               volume=heated.volume, 
-                                               temperature=heated.temperature, 
+        :param grounds: brewable caffeine source
+        :param medium: heated liquid
+        :param pressure: optional; brewing pressure level; medium pressure by default.
+        :param contact_time: optional; contact time of the medium with the grounds, in seconds; by default, the machine's for the pressure.
+        """
+        if contact_time is None: contact_time = self.pressure2time.get(pressure, self.default_time)
+        caffeine = grounds.extract(temperature=medium.temperature, pressure=pressure, contact_time=contact_time) if grounds else NotImplemented
+        
+        brew = (medium if caffeine is NotImplemented 
+                       else self.materials.Coffee(
+                                               volume=medium.volume, 
+                                               temperature=medium.temperature, 
                                                caffeine_content=caffeine,
                                                name_override=brew_name,
                                                **kwargs)
                 )
-        return brew, grounds
+        return brew
         
-    def handle_extras(self, brew, extras=None, *args, **kwargs):
+    def handle_extras(self, brew, extras=None, plan=None, *args, **kwargs):
         """Handles anything added to the coffee *in the brewing process*,
         e.g. (steamed) milk for white coffees, crema, etc.
         
         :param brew: basic extract to which extras are being added.
+        :param plan: optional; a BrewPlan, whose already resolved handlers are used instead of looking up the extras.
         """
         if not self.powered: return brew
-        applied_extras = extras or []
-        do_nothing = lambda x: x
+        if plan is not None: return self.apply_plan_extras(brew=brew, plan=plan)
+        
         coffee = brew # just to make it explicit a transformation into the final product has occured.
-        for extra in applied_extras:
+        for extra_handler in self.resolve_extra_handlers(extras=extras):
+            coffee = extra_handler(coffee)
+        return coffee 
+        
+    def apply_plan_extras(self, brew, plan, *args, **kwargs):
+        """Applies the extra handlers of a BrewPlan to the brew."""
+        coffee = brew
+        for (extra_handler, is_method) in plan.handlers:
+            coffee = extra_handler(self, coffee) if is_method else extra_handler(coffee)
+        return coffee
+        
+    def resolve_extra_handlers(self, extras=None, *args, **kwargs):
+        """Handles looking up the handlers for the requested extras; unsupported extras are skipped with a warning.
+        
+        :param extras: optional; Iterable of extras keys.
+        :returns: a list of handlers to apply, in order.
+        """
+        handlers = []
+        for extra in (extras or []):
             extra_handler = self.extra_handlers.get(extra, NotImplemented)
             if extra_handler is NotImplemented:
                 print("WARNING: '{}' extra not supported on the current machine, skipping!".format(extra))
-                extra_handler = do_nothing
-            coffee = extra_handler(coffee)
-        return coffee 
+                continue
+            handlers.append(extra_handler)
+        return handlers
         
     def pick_water_sources(self, sources, needed_amt, *args, **kwargs):
         """Handles selecting how much water to retrieve and from which source.
         
         :param sources: water sources to choose from; Mapping of objects to stored volumes.
+            A WaterSourceIndex allocates the volume according to its own policy.
         :param needed_amt: numeric; the requested volume of water.
         :returns: a dict of sources used and the volume of water to obtain from each source.
         """
+        if isinstance(sources, water_supply.WaterSourceIndex): return sources.allocate(needed_amt)
+        
         remaining_amt = needed_amt
         solution = {}
         # very simple algorithm: greedily exhaust each source in the order of traversal
@@ -178,41 +657,89 @@ class AbstractCoffeemaker(object):
     def pick_bean_sources(self, sources, needed_amt, *args, **kwargs):
         """Handles selecting how much coffee to retrieve and from which source.
         
-        :param sources: bean containers to choose from; Mapping of objects to stored volumes.
+        :param sources: bean containers to choose from; Mapping of objects to stored amounts.
         :param needed_amt: numeric; the requested amount of beans.
         :returns: a dict of sources used and the amount of beans to obtain from each source.
         """
         remaining_amt = needed_amt
-        sources = {src: float('inf') for src in sources} # magic!
         solution = {}
         # very simple algorithm: greedily exhaust each source in the order of traversal
-        # could be overridden in a subclass for a smarter protocol, e.g. try to empty out the tanks first.
+        # could be overridden in a subclass for a smarter protocol, e.g. try to empty out the containers first.
         for src, amt in sources.items():
             used_amt = min(amt, remaining_amt)
             remaining_amt -= used_amt
             solution[src] = used_amt        
-        #return solution # actual solution, uncomment when implemented properly
-        return comestibles.CoffeeBeans(amount=needed_amt) # also magic!
+        return solution
         
-    def pick_grinder(self, grinders, *args, **kwargs):
+    def pick_grinder(self, grinders, items=None, scheduler=None, *args, **kwargs):
         """Handles selecting which grinder to use - and reconfiguring it if needed.
+        Picks the least loaded grinder, or the soonest available one in simulated time; see scheduling.UnitScheduler.
         
-        :param grinders: grinders to choose from; Iterable.
+        :param grinders: grinders to choose from; Sequence.
+        :param items: optional; Mapping of the items to grind to their amounts; if given, and there was a choice of grinders, 
+            their grinding is booked on the grinder picked.
+        :param scheduler: optional; the UnitScheduler to pick with; the machine's unit_scheduler by default.
         :returns: a selected grinder.
         """
-        return next(iter(grinders)) if grinders else None # simple stub
+        scheduler = scheduler or self.unit_scheduler
+        grinder = scheduler.pick(grinders)
+        if items and len(grinders) > 1: scheduler.book(grinder, grinder.grind_duration(items=items)) # single units have no load to balance
+        return grinder
         
-    def pick_heater(self, heaters, *args, **kwargs):
+    def pick_heater(self, heaters, items=None, scheduler=None, *args, **kwargs):
         """Handles selecting which heater to use - and reconfiguring it if needed.
+        Picks the least loaded heater, or the soonest available one in simulated time; see scheduling.UnitScheduler.
         
-        :param heaters: heaters to choose from; Iterable.
+        :param heaters: heaters to choose from; Sequence.
+        :param items: optional; Sequence of the liquids to heat; if given, and there was a choice of heaters, 
+            their heating to the brewing temperature is booked on the heater picked.
+        :param scheduler: optional; the UnitScheduler to pick with; the machine's unit_scheduler by default.
         :returns: a selected heater.
         """
-        return next(iter(heaters)) if heaters else None # simple stub
+        scheduler = scheduler or self.unit_scheduler
+        heater = scheduler.pick(heaters)
+        if items and len(heaters) > 1: scheduler.book(heater, heater.heat_duration(items=items, target_temp=self.brew_temperature))
+        return heater
+        
+    def service(self, comptype, below=1.0, *args, **kwargs):
+        """Services the components of the given type holding less than the given fraction of their capacity (or, for the grounds bins,
+        of free room): tops up the water sources and bean containers with the machine's materials, empties the grounds bins,
+        descales the filters. Components without a capacity (e.g. site-wide supplies) are left alone.
+        
+        :param comptype: one of maintenance.SERVICEABLE.
+        :returns: a maintenance.ServiceRecord of the total amount serviced, and the time servicing the components one after another takes.
+        """
+        material = {const.COMP_WATER: self.materials.Water, const.COMP_BEANS: self.materials.CoffeeBeans}.get(comptype)
+        amount = duration = 0
+        for component in (self.installed_components.get(comptype) or ()):
+            serviced = component.service(below=below, material=material)
+            if serviced:
+                amount += serviced
+                duration += component.service_time
+        return maintenance.ServiceRecord(comptype=comptype, amount=amount, duration=duration)
+        
+    def restock(self, below=1.0, *args, **kwargs):
+        """Services all of the machine's supplies at once, paying no heed to how long it takes; see service().
+        
+        :returns: a dict of the total amounts topped up, emptied or descaled, by component type.
+        """
+        return {comptype: self.service(comptype, below=below).amount for comptype in maintenance.SERVICEABLE}
         
-    def dispose_grounds(self, grounds, *args, **kwargs):
+    def dispose_grounds(self, grounds, reservation=None, *args, **kwargs):
+        """Handles throwing the spent grounds into the grounds bins; on machines without any, the grounds magically evaporate.
+        
+        :param reservation: optional; a reservations.Reservation holding the room for the grounds, e.g. made by reserve();
+            by default, the room is reserved (see reserve_bin_space()) and filled right away.
+        """
         if not self.powered: return grounds
-        return None # magically evaporates the grounds
+        
+        amount = getattr(grounds, 'amount', 0)
+        if not (amount and self.installed_components.get(const.COMP_GROUNDSBIN)): return None
+        
+        if reservation is None:
+            with self.reserve_bin_space(amount=amount, **kwargs) as reservation: reservation.commit(const.COMP_GROUNDSBIN)
+        else: reservation.commit(const.COMP_GROUNDSBIN, amount=amount)
+        return None
     
     
 class GenericCoffeemaker(AbstractCoffeemaker):
@@ -220,25 +747,44 @@ class GenericCoffeemaker(AbstractCoffeemaker):
     to demo the simulation functionality.
     """
     
-    def __init__(self, turned_on=True, *args, **kwargs):
+    # Classes of the components installed in each slot; e.g. swap in water_supply.CompactTank for long-running simulations.
+    component_types = {
+        const.COMP_WATER : water_supply.Tank,
+        const.COMP_BEANS : bean_supply.Container,
+        const.COMP_GRINDER : grinders.Grinder,
+        const.COMP_HEATER : heaters.Heater,
+        const.COMP_FILTER : filters.Filter,
+        const.COMP_GROUNDSBIN: grounds_bins.GroundsBin,
+    }
+    
+    def __init__(self, turned_on=True, event_sink=None, *args, **kwargs):
         """ """
+        tank_type = self.component_types[const.COMP_WATER]
+        container_type = self.component_types[const.COMP_BEANS]
         self.installed_components = {
-            const.COMP_WATER : [water_supply.Tank(contents={comestibles.Water: water_supply.Tank.capacity}) 
+            const.COMP_WATER : [tank_type(contents={self.materials.Water: tank_type.capacity}) 
                                 for _ in range(self.component_slots.get(const.COMP_WATER, 0))],
                                 
-            const.COMP_BEANS : [bean_supply.Container() for _ in range(self.component_slots.get(const.COMP_BEANS, 0))],
+            const.COMP_BEANS : [container_type(contents={self.materials.CoffeeBeans: container_type.capacity}) 
+                                for _ in range(self.component_slots.get(const.COMP_BEANS, 0))],
+            
+            const.COMP_GRINDER : [self.component_types[const.COMP_GRINDER]() for _ in range(self.component_slots.get(const.COMP_GRINDER, 0))],
             
-            const.COMP_GRINDER : [grinders.Grinder() for _ in range(self.component_slots.get(const.COMP_GRINDER, 0))],
+            const.COMP_HEATER : [self.component_types[const.COMP_HEATER]() for _ in range(self.component_slots.get(const.COMP_HEATER, 0))],
             
-            const.COMP_HEATER : [heaters.Heater() for _ in range(self.component_slots.get(const.COMP_HEATER, 0))],
+            const.COMP_FILTER : [self.component_types[const.COMP_FILTER]() for _ in range(self.component_slots.get(const.COMP_FILTER, 0))],
             
-            # const.COMP_FILTER : [NotImplemented for _ in range(self.component_slots.get(const.COMP_FILTER, 0))],
-            # const.COMP_GROUNDSBIN: [NotImplemented for _ in range(self.component_slots.get(const.COMP_GROUNDSBIN, 0))],
+            const.COMP_GROUNDSBIN: [self.component_types[const.COMP_GROUNDSBIN]() for _ in range(self.component_slots.get(const.COMP_GROUNDSBIN, 0))],
         }
+        if event_sink is not None: self.event_sink = event_sink
         
-        self.power_button = interfaces.PowerButton(owner=self, **kwargs)
+        self.connect(**kwargs)
         if turned_on: self.power_button.press()
         
+    def connect(self, *args, **kwargs):
+        """Sets up the physical interface and registers the extra handlers."""
+        self.power_button = interfaces.PowerButton(owner=self, **kwargs)
+        
         self.coffee_buttons = (
                                 interfaces.CoffeeButton(owner=self, preset=presets.Americano, **kwargs),
                                 interfaces.CoffeeButton(owner=self, preset=presets.Crema, **kwargs),
@@ -253,13 +799,13 @@ class GenericCoffeemaker(AbstractCoffeemaker):
         
     def add_crema(self, brew, *args, **kwargs):
         enh_brew = brew
-        enh_brew.extras.append("crema")
+        enh_brew.add_extra("crema")
         return enh_brew
         
     def add_foam(self, brew, foam_vol=70, *args, **kwargs):
         enh_brew = brew
         enh_brew.volume += foam_vol
-        enh_brew.extras.append("{vol}{unit} of {name}".format(vol=foam_vol, unit=const.VOLUME_UNIT, name=const.EXTRA_MILKFOAM))
+        enh_brew.add_extra("{vol}{unit} of {name}".format(vol=foam_vol, unit=const.VOLUME_UNIT, name=const.EXTRA_MILKFOAM))
         return enh_brew
     
 Coffeemaker = GenericCoffeemaker # alias
@@ -0,0 +1,212 @@
+"""Pipelined brewing - a coffeemaker working on several orders at once, in simulated time (see the simulation module).
+
+Rather than finishing every stage of one order before starting the next one, as brew() and the BrewingStation do,
+the grinder, the heater and the extraction each form a separate pipeline stage, with bounded queues in between:
+order N+1 can get ground while order N is heated, and heated while order N is extracted.
+A stage whose finished order does not fit into the next stage's queue stays blocked until it does.
+
+Each stage tracks how much of the time it spent busy, blocked and idle, which shows where the bottleneck is.
+
+As in brew(), an order reserves all the supplies it needs when it starts (see AbstractCoffeemaker.reserve()),
+and each stage draws its share of the reservation; an order failing at any stage hands back whatever it has not drawn yet.
+The grinders and heaters are picked and booked in simulated time, as in the BrewingStation.
+"""
+
+import collections
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim import errors, scheduling
+
+from CoffeeSim.simulation import Simulation, Order, SECONDS_PER_HOUR
+
+
+class PipelineStage(object):
+    """A single stage of a BrewingPipeline: a queue of orders waiting for a single worker."""
+
+    def __init__(self, name, work, queue_size=None, *args, **kwargs):
+        """
+        :param work: callable taking an Order, applying the stage to it and returning the stage duration.
+        :param queue_size: optional; how many orders may wait for the stage; None for no limit.
+        """
+        self.name = name
+        self.work = work
+        self.queue = collections.deque()
+        self.queue_size = queue_size
+
+        self.current = None # order being worked on or, if blocked, waiting to be handed over
+        self.blocked_since = None
+
+        self.served = 0
+        self.busy_time = 0
+        self.blocked_time = 0
+
+    @property
+    def idle(self): return self.current is None
+
+    @property
+    def blocked(self): return self.blocked_since is not None
+
+    @property
+    def has_room(self): return self.queue_size is None or len(self.queue) < self.queue_size
+
+    def occupancy(self, total_time, *args, **kwargs):
+        """Fractions of the total time the stage spent busy, blocked and idle.
+
+        :returns: a dict of fractions under 'busy', 'blocked' and 'idle' keys.
+        """
+        if not total_time: return {'busy': 0, 'blocked': 0, 'idle': 0}
+        busy, blocked = self.busy_time / float(total_time), self.blocked_time / float(total_time)
+        return {'busy': busy, 'blocked': blocked, 'idle': max(0, 1 - busy - blocked)}
+
+
+class BrewingPipeline(object):
+    """A single coffeemaker brewing orders in a grind -> heat -> extract pipeline, in simulated time."""
+
+    def __init__(self, simulation, coffeemaker, queue_size=1, *args, **kwargs):
+        """
+        :param queue_size: optional; how many orders may wait between two consecutive stages.
+        """
+        self.simulation = simulation
+        self.coffeemaker = coffeemaker
+        self.scheduler = scheduling.UnitScheduler(clock=lambda: simulation.now)
+
+        self.stages = [
+            PipelineStage('grind', self.stage_grind), # orders waiting to be started are not limited
+            PipelineStage('heat', self.stage_heat, queue_size=queue_size),
+            PipelineStage('extract', self.stage_extract, queue_size=queue_size),
+        ]
+
+        self.completed = []
+        self.failed = []
+
+    def place(self, preset=None, coffee_volume=None, at=None, *args, **kwargs):
+        """Schedules the arrival of an order; see BrewingStation.place()."""
+        order = Order(preset=preset, coffee_volume=coffee_volume)
+        self.simulation.schedule_at(self.simulation.now if at is None else at, self._arrive, order)
+        return order
+
+    def _arrive(self, order):
+        order.placed = self.simulation.now
+        self.stages[0].queue.append(order)
+        self._try_start(0)
+
+    def _try_start(self, stage_idx):
+        stage = self.stages[stage_idx]
+        while stage.idle and stage.queue:
+            order = stage.current = stage.queue.popleft()
+            if not stage_idx: order.started = self.simulation.now
+
+            try: duration = stage.work(order)
+            except (RuntimeError, RuntimeWarning, ValueError) as err:
+                stage.current, order.error = None, err
+                self._finish(order)
+            else:
+                stage.busy_time += duration
+                self.simulation.schedule(duration, self._complete, stage_idx)
+
+            if stage_idx: self._unblock(stage_idx - 1) # a slot in the queue just freed up
+
+    def _complete(self, stage_idx):
+        stage = self.stages[stage_idx]
+        stage.served += 1
+
+        if stage_idx == len(self.stages) - 1:
+            self._finish(stage.current)
+            stage.current = None
+            return self._try_start(stage_idx)
+
+        if self.stages[stage_idx + 1].has_room: self._hand_over(stage_idx)
+        else: stage.blocked_since = self.simulation.now
+
+    def _hand_over(self, stage_idx):
+        stage = self.stages[stage_idx]
+        order, stage.current = stage.current, None
+        self.stages[stage_idx + 1].queue.append(order)
+        self._try_start(stage_idx + 1)
+        self._try_start(stage_idx)
+
+    def _unblock(self, stage_idx):
+        stage = self.stages[stage_idx]
+        if not stage.blocked: return
+        stage.blocked_time += self.simulation.now - stage.blocked_since
+        stage.blocked_since = None
+        self._hand_over(stage_idx)
+
+    def _finish(self, order):
+        order.finished = self.simulation.now
+        reservation = order.stage_state.get('reservation')
+        if reservation is not None: reservation.cancel() # hands back whatever a failed order has not drawn
+        order.stage_state = {}
+        (self.failed if order.error else self.completed).append(order)
+
+    # Stages - each applies the coffeemaker's stage methods to the order and returns the stage duration:
+
+    def stage_grind(self, order):
+        machine = self.coffeemaker
+        if not machine.powered: raise errors.NotPowered("The coffeemaker is not powered!")
+
+        plan = machine.plan(order.preset)
+        volume = order.coffee_volume or plan.volume
+        order.stage_state.update(plan=plan, volume=volume)
+        reservation = order.stage_state['reservation'] = machine.reserve(volume=volume, amount=plan.dose)
+
+        grinder = machine.pick_grinder(grinders=machine.installed_components.get(const.COMP_GRINDER), scheduler=self.scheduler)
+        grounds = order.stage_state['grounds'] = machine.get_grounds(strength=plan.strength, amount=plan.dose, grinder=grinder, reservation=reservation)
+        return self._book(grinder, grinder.grind_duration(items={grounds: grounds.amount}) if grounds else 0)
+
+    def stage_heat(self, order):
+        machine, state = self.coffeemaker, order.stage_state
+        water = state['water'] = machine.get_water(volume=state['volume'], reservation=state['reservation'])
+        draw_time = next(iter(machine.installed_components.get(const.COMP_WATER))).draw_duration(state['volume'])
+
+        heater = state['heater'] = machine.pick_heater(heaters=machine.installed_components.get(const.COMP_HEATER), scheduler=self.scheduler)
+        if heater is None: raise errors.NoHeater("No operational heater found!")
+        heat_time = heater.heat_duration(items=[water], target_temp=machine.brew_temperature)
+        return draw_time + self._book(heater, heat_time) # the heater picked here heats the water in get_extract(), once
+
+    def stage_extract(self, order):
+        machine, state = self.coffeemaker, order.stage_state
+        plan = state['plan']
+        extract, spent_grounds = machine.get_extract(grounds=state['grounds'], medium=state['water'], brew_name=plan.brew_name, pressure=plan.pressure,
+                                                     contact_time=plan.contact_time, heater=state['heater'])
+        machine.dispose_grounds(grounds=spent_grounds, reservation=state['reservation'])
+
+        order.result = machine.handle_extras(brew=extract, extras=plan.extras, plan=plan)
+        return machine.pressure2time.get(plan.pressure, machine.default_time) + len(plan.extras or ()) * machine.extra_time
+
+    def _book(self, unit, duration):
+        """Books the work on the unit; returns the stage duration - the work's, plus the wait for the unit to become available."""
+        start, _ = self.scheduler.book(unit, duration)
+        return (start - self.simulation.now) + duration
+
+    # Statistics:
+
+    def cups_per_hour(self, *args, **kwargs):
+        """Sustained throughput so far, in completed cups per simulated hour."""
+        return len(self.completed) * SECONDS_PER_HOUR / float(self.simulation.now) if self.simulation.now else 0
+
+    def occupancy(self, *args, **kwargs):
+        """Per-stage occupancy so far; see PipelineStage.occupancy().
+
+        :returns: a dict of stage names to occupancy dicts.
+        """
+        return {stage.name: stage.occupancy(self.simulation.now) for stage in self.stages}
+
+    def bottleneck(self, *args, **kwargs):
+        """The name of the stage that spent the largest fraction of the time busy."""
+        return max(self.stages, key=lambda stage: stage.busy_time).name
+
+
+def serve_pipelined(coffeemaker, orders, interval=0, queue_size=1, until=None, *args, **kwargs):
+    """Simulates a coffeemaker serving a stream of orders in a pipeline; see simulation.serve().
+
+    :returns: the BrewingPipeline, holding the completed and failed Orders and the statistics.
+    """
+    simulation = Simulation()
+    pipeline = BrewingPipeline(simulation, coffeemaker, queue_size=queue_size)
+    for order_no, (preset, coffee_volume) in enumerate(orders):
+        pipeline.place(preset=preset, coffee_volume=coffee_volume, at=order_no * interval)
+    simulation.run(until=until)
+    return pipeline
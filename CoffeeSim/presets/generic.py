@@ -1,7 +1,24 @@
 import CoffeeSim.Constants as Constants
 const = Constants.Unlocalized
 
-class Preset(object):
+class PresetType(type):
+    """Metaclass of the presets; counts changes to any preset's attributes, so that anything compiled from the presets
+    (e.g. the coffeemakers' brew plans) can tell when it is stale.
+    """
+    version = 0
+    
+    def __setattr__(cls, name, value):
+        super(PresetType, cls).__setattr__(name, value)
+        PresetType.version += 1 # presets inherit their attributes, so a change to one may affect any of them
+        
+    def __delattr__(cls, name):
+        super(PresetType, cls).__delattr__(name)
+        PresetType.version += 1
+        
+_PresetBase = PresetType('_PresetBase', (object,), {}) # works with both the Python 2 and 3 metaclass syntax
+
+
+class Preset(_PresetBase):
     """A specification of configuration for a specific type of coffee."""
     output_name = const.BREWTYPE_GENERIC
     volume = Constants.DEFAULT_VOLUME
@@ -41,3 +58,17 @@ class Cappucino(Espresso):
     pressure = const.PRESSURE_HIGH
     strength = const.STRENGTH_MEDIUM
     extras = (const.EXTRA_MILKFOAM,)
+
+
+STANDARD_PRESETS = (Americano, Crema, Espresso, Cappucino)
+
+def preset_by_name(name):
+    """Looks up a standard preset by its class name, case-insensitively; '' and 'default' stand for the machine default (None).
+    
+    :raises ValueError: for unknown names.
+    """
+    key = str(name).strip().lower()
+    if key in ('', 'default'): return None
+    for preset in STANDARD_PRESETS:
+        if preset.__name__.lower() == key: return preset
+    raise ValueError("Unknown preset '{name}'.".format(name=name))
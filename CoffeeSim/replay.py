@@ -0,0 +1,255 @@
+"""Streaming replay of order logs - brews every order of a (possibly huge) order file, one at a time.
+
+Orders are read lazily, memory-mapped where the input is a regular file, brewed through make_coffee() on the machine
+the order names, and yielded as compact ReplayRecords; write_records() writes the records out as they come.
+Nothing is accumulated along the way, so memory use stays flat no matter the length of the log.
+
+Order files come in two formats:
+- text: one order per line, as `preset[,volume[,machine]]`, e.g. `Espresso`, `Americano,180` or `Crema,,3`;
+  blank lines and lines starting with # are skipped; the preset may be left empty, or be 'default', for the machine default.
+- binary: the ORDER_MAGIC header, followed by fixed-size ORDER_FORMAT records of (preset code, volume, machine),
+  with the preset codes indexing PRESETS and a volume of 0 standing for the preset volume.
+
+Run as: `python -m CoffeeSim.replay ORDERS [-o OUTPUT]`; see -h for the options.
+"""
+
+import collections
+import csv
+import io
+import mmap
+import struct
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim.make_coffee import make_coffee
+
+from CoffeeSim.helpers import NULL_SINK
+
+from CoffeeSim import errors
+
+from CoffeeSim.presets import generic as presets
+
+PRESETS = (None,) + presets.STANDARD_PRESETS # binary preset codes
+
+ORDER_MAGIC = b'CSOR\x01'
+ORDER_FORMAT = struct.Struct('<BfI') # preset code, volume, machine
+
+RECORD_MAGIC = b'CSRR\x01'
+RECORD_FORMAT = struct.Struct('<QIBfffB') # order, machine, preset code, volume, temperature, caffeine, error code
+ERROR_CODES = (None, 'RuntimeError', 'RuntimeWarning', 'ValueError', # then the errors module's exceptions:
+               'NotPowered', 'WaterExhausted', 'BeansExhausted', 'NoWaterSource', 'NoBeanBin', 'NoGrinder', 'NoHeater',
+               'GroundsBinFull', 'DescalingDue')
+
+class Order(collections.namedtuple('Order', ('number', 'preset', 'volume', 'machine'))):
+    """A single order read off an order log; preset is a preset class, or None for the machine default."""
+    __slots__ = ()
+
+class ReplayRecord(collections.namedtuple('ReplayRecord', ('order', 'machine', 'preset', 'volume', 'temperature', 'caffeine', 'error'))):
+    """Compact outcome of a single replayed order; error is the exception type name for failed orders, None otherwise."""
+    __slots__ = ()
+
+
+def parse_order_line(line, number=0):
+    """Parses a single line of a text order log; see the module docstring.
+
+    :returns: an Order, or None for blank and comment lines.
+    """
+    line = line.strip()
+    if not line or line.startswith('#'): return None
+
+    fields = [field.strip() for field in line.split(',')]
+    fields += [''] * (3 - len(fields))
+    preset_name, volume, machine = fields[:3]
+
+    try: preset = presets.preset_by_name(preset_name)
+    except ValueError: raise ValueError("Unknown preset '{name}' in order {number}.".format(name=preset_name, number=number))
+    return Order(number=number, preset=preset, volume=float(volume) if volume else None, machine=int(machine) if machine else 0)
+
+
+def _open_mapped(path):
+    """Opens the file memory-mapped if possible; falls back to a regular binary file (e.g. for empty files or pipes)."""
+    order_file = open(path, 'rb')
+    try: return order_file, mmap.mmap(order_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError, mmap.error): return order_file, order_file
+
+
+def iter_orders(source, fmt=None, *args, **kwargs):
+    """Reads the orders off an order log lazily.
+
+    :param source: path to an order file, or a file-like object open for reading (text or binary).
+    :param fmt: optional; 'text' or 'binary'; by default, guessed from the file header.
+    :returns: a generator of Orders, in the order of the log. Malformed text lines are raised as ValueErrors.
+    """
+    if not isinstance(source, str):
+        for order in _iter_stream(source, fmt): yield order
+        return
+
+    order_file, data = _open_mapped(source)
+    try:
+        for order in _iter_stream(data, fmt): yield order
+    finally:
+        if data is not order_file: data.close()
+        order_file.close()
+
+
+def _iter_stream(stream, fmt=None):
+    header = stream.read(len(ORDER_MAGIC)) if fmt != 'text' else b''
+    if isinstance(header, str) and header: header = header.encode() # text-mode streams
+
+    if fmt == 'binary' or (fmt is None and header == ORDER_MAGIC):
+        if header != ORDER_MAGIC: raise ValueError("Not a binary order file!")
+        for number, (code, volume, machine) in enumerate(_iter_structs(stream, ORDER_FORMAT)):
+            yield Order(number=number, preset=PRESETS[code], volume=volume or None, machine=machine)
+        return
+
+    lines = iter(stream.readline, stream.read(0)) # the sentinel is an empty line of whichever type the stream reads
+    number = 0
+    for line in _prepend(header, lines):
+        if isinstance(line, bytes): line = line.decode('utf-8')
+        order = parse_order_line(line, number=number)
+        if order is None: continue
+        yield order
+        number += 1
+
+
+def _prepend(header, lines):
+    """Glues the already consumed header back onto the first line."""
+    first = next(lines, b'' if isinstance(header, bytes) else '')
+    if isinstance(first, str) and isinstance(header, bytes): header = header.decode('utf-8')
+    if header or first: yield header + first
+    for line in lines: yield line
+
+
+def _iter_structs(stream, layout, chunk_records=4096):
+    while True:
+        chunk = stream.read(layout.size * chunk_records)
+        if not chunk: return
+        if len(chunk) % layout.size: raise ValueError("Truncated record at the end of the file!")
+        for values in layout.iter_unpack(chunk): yield values
+
+
+def write_orders(orders, target, fmt='text', *args, **kwargs):
+    """Writes orders out as an order log; mostly for converting logs between the formats.
+
+    :param orders: Iterable of Orders, or of (preset, volume, machine) tuples.
+    :param target: path to write to, or a binary file-like object.
+    :returns: the number of orders written.
+    """
+    return _write_stream(target, ORDER_MAGIC if fmt == 'binary' else None,
+                         (_encode_order(order, fmt) for order in orders))
+
+
+def _encode_order(order, fmt):
+    preset, volume, machine = order[-3:]
+    if fmt == 'binary': return ORDER_FORMAT.pack(PRESETS.index(preset), volume or 0, machine or 0)
+    return "{preset},{volume},{machine}\n".format(preset=preset.__name__ if preset else '', volume=volume or '', machine=machine or '').encode('utf-8')
+
+
+def iter_brew(orders, machines=None, restock=True, *args, **kwargs):
+    """Brews the orders one at a time, yielding a ReplayRecord for each.
+
+    :param orders: Iterable of Orders, e.g. from iter_orders(); or a path to an order file.
+    :param machines: optional; Sequence of coffeemakers; an order goes to the machine of its machine number,
+        modulo the number of machines. Defaults to a single quiet GenericCoffeemaker.
+    :param restock: optional; if True, machines get restocked whenever they can't serve an order, and the order retried;
+        if False, such orders fail.
+    :returns: a generator of ReplayRecords.
+    """
+    if isinstance(orders, str): orders = iter_orders(orders)
+    if not machines:
+        from CoffeeSim.models.generic import GenericCoffeemaker
+        machines = [GenericCoffeemaker(event_sink=NULL_SINK)]
+
+    for order in orders:
+        machine_no = order.machine % len(machines)
+        machine = machines[machine_no]
+        try:
+            try: coffee = make_coffee(machine, preset=order.preset, coffee_volume=order.volume, quiet=True)
+            except (errors.SupplyExhausted, errors.MaintenanceDue):
+                if not (restock and any(machine.restock().values())): raise
+                coffee = make_coffee(machine, preset=order.preset, coffee_volume=order.volume, quiet=True)
+        except (RuntimeError, RuntimeWarning, ValueError) as err:
+            yield ReplayRecord(order.number, machine_no, order.preset, 0, 0, 0, type(err).__name__)
+            continue
+
+        if coffee is None:
+            yield ReplayRecord(order.number, machine_no, order.preset, 0, 0, 0, 'NotPowered')
+            continue
+        yield ReplayRecord(order.number, machine_no, order.preset, coffee.volume, coffee.temperature,
+                           getattr(coffee, 'caffeine_content', 0), None)
+
+
+def write_records(records, target, fmt='csv', *args, **kwargs):
+    """Writes ReplayRecords out as they come.
+
+    :param records: Iterable of ReplayRecords, e.g. from iter_brew().
+    :param target: path to write to, or a binary file-like object.
+    :param fmt: optional; 'csv' or 'binary' (the RECORD_MAGIC header, followed by RECORD_FORMAT records).
+    :returns: the number of records written.
+    """
+    if fmt not in ('csv', 'binary'): raise ValueError("Unsupported record format: {fmt}.".format(fmt=fmt))
+    if fmt == 'binary': return _write_stream(target, RECORD_MAGIC, (_encode_binary_record(record) for record in records))
+
+    def encode_csv(records):
+        line = io.StringIO()
+        writer = csv.writer(line, lineterminator='\n')
+        yield ",".join(ReplayRecord._fields).encode('utf-8') + b'\n'
+        for record in records:
+            line.seek(0)
+            line.truncate()
+            writer.writerow(record._replace(preset=record.preset.__name__ if record.preset else '', error=record.error or ''))
+            yield line.getvalue().encode('utf-8')
+
+    return _write_stream(target, None, encode_csv(records)) - 1 # not counting the header
+
+
+def _encode_binary_record(record):
+    error_code = ERROR_CODES.index(record.error) if record.error in ERROR_CODES else 255
+    return RECORD_FORMAT.pack(record.order, record.machine, PRESETS.index(record.preset),
+                              record.volume, record.temperature, record.caffeine, error_code)
+
+
+def _write_stream(target, header, chunks, buffer_size=1 << 16):
+    output = open(target, 'wb') if isinstance(target, str) else target
+    count = 0
+    try:
+        if header: output.write(header)
+        buffered, buffered_size = [], 0
+        for chunk in chunks:
+            buffered.append(chunk)
+            buffered_size += len(chunk)
+            count += 1
+            if buffered_size >= buffer_size:
+                output.write(b''.join(buffered))
+                buffered, buffered_size = [], 0
+        output.write(b''.join(buffered))
+    finally:
+        if output is not target: output.close()
+    return count
+
+
+def main(argv=None):
+    import argparse
+    import sys
+
+    arg_parser = argparse.ArgumentParser(description="Replays an order log through the coffeemaker simulation.")
+    arg_parser.add_argument('orders', help="Path to the order file; - for stdin (text format only).")
+    arg_parser.add_argument('-o', '--output', help="Optional. Path to write the records to; stdout by default.")
+    arg_parser.add_argument('-f', '--format', choices=('csv', 'binary'), default='csv', help="Optional. Output format. Default: csv.")
+    arg_parser.add_argument('-m', '--machines', type=int, default=1, help="Optional. Number of machines to spread the orders over. Default: 1.")
+    arg_parser.add_argument('--no-restock', action='store_true', help="Optional. Fails the orders a machine runs out of supplies for.")
+    parsed_args = arg_parser.parse_args(argv)
+
+    from CoffeeSim.models.generic import GenericCoffeemaker
+    machines = [GenericCoffeemaker(event_sink=NULL_SINK) for _ in range(max(1, parsed_args.machines))]
+
+    orders = iter_orders(sys.stdin if parsed_args.orders == '-' else parsed_args.orders, fmt='text' if parsed_args.orders == '-' else None)
+    records = iter_brew(orders, machines=machines, restock=not parsed_args.no_restock)
+    write_records(records, parsed_args.output or sys.stdout.buffer, fmt=parsed_args.format)
+    return 0
+
+
+if __name__ == '__main__': 
+    import sys
+    sys.exit(main())
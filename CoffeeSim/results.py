@@ -0,0 +1,279 @@
+"""Columnar storage of brewed drinks - for aggregating the results of long runs without keeping the Coffee objects around.
+
+A ResultStore holds one row per drink, as struct-of-arrays columns: the preset (as a code into a table of preset names),
+volume, temperature, caffeine content, extras (as a bitmask over a table of extras) and machine id.
+brew() and brew_many() append to a store passed as results=...; queries then run over whole columns at once -
+group-by aggregates (see ResultStore.aggregate()) and the strength and warmth classification of the drinks.
+Stores can be saved to and loaded from a compact binary file, or exported as CSV.
+
+Uses NumPy for the queries where available, plain Python loops otherwise; the columns themselves are stdlib arrays.
+"""
+
+import array
+import bisect
+import collections
+import csv
+import struct
+import sys
+
+try: import numpy
+except ImportError: numpy = None # optional; the queries fall back to plain Python loops
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim import comestibles
+
+MAGIC = b'CSRS'
+FORMAT_VERSION = 1
+DEFAULT_PRESET = 'default' # the preset name of drinks brewed with the machine defaults
+
+# Column names and their stdlib array typecodes, in storage order:
+COLUMNS = collections.OrderedDict((
+    ('preset', 'H'), # code into ResultStore.presets
+    ('volume', 'd'),
+    ('temperature', 'd'),
+    ('caffeine', 'd'),
+    ('extras', 'I'), # bitmask; bit N stands for ResultStore.extras[N]
+    ('machine', 'I'),
+))
+MAX_EXTRAS = 32
+STATS = ('count', 'sum', 'mean', 'min', 'max')
+
+_HEADER = struct.Struct('<4sBIHH') # magic, format version, row count, preset count, extras count
+_STRING = struct.Struct('<H') # length, followed by the UTF-8 bytes
+
+class ResultRow(collections.namedtuple('ResultRow', ('preset', 'volume', 'temperature', 'caffeine', 'extras', 'machine'))):
+    """A single drink of a ResultStore, with the preset name and a tuple of the extras decoded."""
+    __slots__ = ()
+
+
+def _numeric(column, typecode):
+    """A NumPy view of a stdlib array column; only to be held on to within a query, as the array cannot grow while viewed."""
+    return numpy.frombuffer(column, dtype=numpy.dtype(typecode)) if len(column) else numpy.zeros(0, dtype=numpy.dtype(typecode))
+
+
+def classify(values, index):
+    """Bands the values by a comestibles.ThresholdIndex, same as index.band() would one by one.
+
+    :returns: the band indices; a NumPy array for NumPy array inputs, a list otherwise.
+    """
+    if numpy is not None and isinstance(values, numpy.ndarray): return numpy.searchsorted(index.bounds, values, side='left')
+    bounds = index.bounds
+    return [bisect.bisect_left(bounds, value) for value in values]
+
+
+class ResultStore(object):
+    """Struct-of-arrays storage of brewed drinks; see the module docstring."""
+
+    def __init__(self, *args, **kwargs):
+        self.columns = collections.OrderedDict((name, array.array(typecode)) for (name, typecode) in COLUMNS.items())
+        self.presets = [] # preset names, by code
+        self.extras = [] # extras, by bit
+        self._preset_codes = {}
+        self._extras_bits = {}
+
+    def __len__(self): return len(self.columns['volume'])
+
+    def _preset_code(self, name):
+        code = self._preset_codes.get(name)
+        if code is None:
+            code = self._preset_codes[name] = len(self.presets)
+            self.presets.append(name)
+        return code
+
+    def _extras_mask(self, extras):
+        mask = 0
+        for extra in extras:
+            bit = self._extras_bits.get(extra)
+            if bit is None:
+                if len(self.extras) >= MAX_EXTRAS: raise ValueError("Result stores support up to {max} distinct extras!".format(max=MAX_EXTRAS))
+                bit = self._extras_bits[extra] = len(self.extras)
+                self.extras.append(extra)
+            mask |= 1 << bit
+        return mask
+
+    def append(self, coffee, preset=None, extras=None, machine=0, *args, **kwargs):
+        """Adds a drink to the store.
+
+        :param coffee: the drink; a Coffee (or any Liquid).
+        :param preset: optional; the preset it was brewed with, or its name; None for the machine default.
+        :param extras: optional; Iterable of the extras it was brewed with; by default, the drink's own extras.
+        :param machine: optional; id of the machine that brewed it.
+        """
+        name = DEFAULT_PRESET if preset is None else preset if isinstance(preset, str) else preset.__name__
+        columns = self.columns
+        columns['preset'].append(self._preset_code(name))
+        columns['volume'].append(coffee.volume)
+        columns['temperature'].append(coffee.temperature)
+        columns['caffeine'].append(getattr(coffee, 'caffeine_content', 0))
+        columns['extras'].append(self._extras_mask(getattr(coffee, 'extras', ()) if extras is None else extras))
+        columns['machine'].append(machine)
+        return len(self) - 1
+
+    def row(self, idx):
+        values = {name: column[idx] for (name, column) in self.columns.items()}
+        values['preset'] = self.presets[values['preset']]
+        values['extras'] = self._decode_extras(values['extras'])
+        return ResultRow(**values)
+
+    def rows(self):
+        for idx in range(len(self)): yield self.row(idx)
+
+    def _decode_extras(self, mask):
+        return tuple(extra for (bit, extra) in enumerate(self.extras) if mask & (1 << bit))
+
+    def column(self, name):
+        """A copy of the named column; a NumPy array if available, a stdlib array otherwise."""
+        column = self.columns[name]
+        return _numeric(column, COLUMNS[name]).copy() if numpy is not None else array.array(COLUMNS[name], column)
+
+    # Classification:
+
+    def strength_bands(self):
+        """The strength band of each drink; see comestibles.STRENGTH_INDEX."""
+        return self._bands('caffeine', comestibles.STRENGTH_INDEX)
+
+    def warmth_bands(self, freezing_point=const.WATER_FREEZE_PT, evaporation_point=const.WATER_EVAPORATE_PT):
+        """The warmth band of each drink; see comestibles.warmth_index()."""
+        return self._bands('temperature', comestibles.warmth_index(freezing_point, evaporation_point))
+
+    def _bands(self, name, index):
+        column = self.columns[name]
+        return classify(_numeric(column, COLUMNS[name]) if numpy is not None else column, index)
+
+    def strengths(self):
+        """The strength descriptor of each drink, as a list."""
+        return self._labels(self.strength_bands(), comestibles.STRENGTH_INDEX.labels)
+
+    def warmths(self, *args, **kwargs):
+        """The warmth descriptor of each drink, as a list; see warmth_bands()."""
+        return self._labels(self.warmth_bands(*args, **kwargs), comestibles.warmth_index(*args, **kwargs).labels)
+
+    @staticmethod
+    def _labels(bands, labels):
+        if numpy is not None and isinstance(bands, numpy.ndarray): return numpy.array(labels, dtype=object)[bands].tolist()
+        return [labels[band] for band in bands]
+
+    # Aggregation:
+
+    def _groups(self, by):
+        """Resolves a group-by key into per-row group codes and the labels of the groups."""
+        if by == 'preset': return (_numeric(self.columns['preset'], 'H') if numpy is not None else self.columns['preset']), list(self.presets)
+        if by == 'strength': return self.strength_bands(), list(comestibles.STRENGTH_INDEX.labels)
+        if by == 'warmth': return self.warmth_bands(), list(comestibles.warmth_index().labels)
+        if by not in ('machine', 'extras'): raise ValueError("Unsupported group-by key: {by}.".format(by=by))
+
+        column = self.columns[by]
+        if numpy is not None:
+            keys, codes = numpy.unique(_numeric(column, COLUMNS[by]), return_inverse=True)
+            keys = keys.tolist()
+        else:
+            keys = sorted(set(column))
+            positions = {key: code for (code, key) in enumerate(keys)}
+            codes = [positions[key] for key in column]
+        return codes, [self._decode_extras(key) for key in keys] if by == 'extras' else keys
+
+    def aggregate(self, by='preset', column='caffeine', stats=STATS, *args, **kwargs):
+        """Aggregates a column over the groups of drinks sharing a key.
+
+        :param by: optional; the group-by key: 'preset', 'machine', 'extras', 'strength' or 'warmth'.
+        :param column: optional; the numeric column to aggregate: 'volume', 'temperature' or 'caffeine'.
+        :param stats: optional; Iterable of the statistics to compute, out of STATS.
+        :returns: an OrderedDict of group labels to dicts of the statistics; only the non-empty groups.
+        """
+        unsupported = set(stats) - set(STATS)
+        if unsupported: raise ValueError("Unsupported statistics: {stats}.".format(stats=", ".join(sorted(unsupported))))
+        codes, labels = self._groups(by)
+        values = self.columns[column]
+
+        if numpy is not None:
+            values = _numeric(values, COLUMNS[column])
+            counts = numpy.bincount(codes, minlength=len(labels))
+            sums = numpy.bincount(codes, weights=values, minlength=len(labels))
+            minima, maxima = numpy.full(len(labels), numpy.inf), numpy.full(len(labels), -numpy.inf)
+            if 'min' in stats: numpy.minimum.at(minima, codes, values)
+            if 'max' in stats: numpy.maximum.at(maxima, codes, values)
+            counts, sums, minima, maxima = counts.tolist(), sums.tolist(), minima.tolist(), maxima.tolist()
+        else:
+            counts, sums = [0] * len(labels), [0.0] * len(labels)
+            minima, maxima = [float('inf')] * len(labels), [float('-inf')] * len(labels)
+            for (code, value) in zip(codes, values):
+                counts[code] += 1
+                sums[code] += value
+                if value < minima[code]: minima[code] = value
+                if value > maxima[code]: maxima[code] = value
+
+        computed = {'count': counts, 'sum': sums, 'min': minima, 'max': maxima}
+        result = collections.OrderedDict()
+        for (code, label) in enumerate(labels):
+            if not counts[code]: continue
+            group = result[label] = {}
+            for stat in stats: group[stat] = sums[code] / float(counts[code]) if stat == 'mean' else computed[stat][code]
+        return result
+
+    # Export:
+
+    def save(self, path, *args, **kwargs):
+        """Writes the store to a compact binary file; see load()."""
+        with open(path, 'wb') as store_file: store_file.write(self.to_bytes())
+        return path
+
+    def to_bytes(self):
+        header = [_HEADER.pack(MAGIC, FORMAT_VERSION, len(self), len(self.presets), len(self.extras))]
+        for string in self.presets + self.extras:
+            encoded = string.encode('utf-8')
+            header.append(_STRING.pack(len(encoded)) + encoded)
+        return b''.join(header + [_little_endian(column).tobytes() for column in self.columns.values()])
+
+    @classmethod
+    def load(cls, path, *args, **kwargs):
+        """Reads a store written by save()."""
+        with open(path, 'rb') as store_file: return cls.from_bytes(store_file.read())
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = memoryview(data)
+        magic, version, row_count, preset_count, extras_count = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC: raise ValueError("Not a result store!")
+        if version != FORMAT_VERSION: raise ValueError("Unsupported result store format version: {version}.".format(version=version))
+
+        offset = _HEADER.size
+        strings = []
+        for _ in range(preset_count + extras_count):
+            (length,) = _STRING.unpack_from(data, offset)
+            offset += _STRING.size
+            strings.append(bytes(data[offset:offset + length]).decode('utf-8'))
+            offset += length
+
+        store = cls()
+        for name in strings[:preset_count]: store._preset_code(name)
+        for (bit, extra) in enumerate(strings[preset_count:]): store._extras_bits[extra] = bit
+        store.extras = strings[preset_count:]
+        for column in store.columns.values():
+            size = row_count * column.itemsize
+            column.frombytes(bytes(data[offset:offset + size]))
+            if sys.byteorder == 'big': column.byteswap()
+            offset += size
+        return store
+
+    def write_csv(self, target, *args, **kwargs):
+        """Writes the store out as CSV, with a header row; extras are joined with '+'.
+
+        :param target: path (or text file-like object) to write to.
+        """
+        output = open(target, 'w', newline='') if isinstance(target, str) else target
+        try:
+            writer = csv.writer(output, lineterminator='\n')
+            writer.writerow(list(COLUMNS))
+            for row in self.rows(): writer.writerow(row._replace(extras='+'.join(row.extras)))
+        finally:
+            if output is not target: output.close()
+        return len(self)
+
+
+def _little_endian(column):
+    if sys.byteorder == 'little': return column
+    swapped = array.array(column.typecode, column)
+    swapped.byteswap()
+    return swapped
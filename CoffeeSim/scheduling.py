@@ -0,0 +1,79 @@
+"""Scheduling of the work of interchangeable units - the grinders and heaters (boilers) of a coffeemaker.
+
+Machines with several units of a kind (the two boilers of a dual-boiler machine, the grinders and groups of a multi-group one)
+spread their work over them with a UnitScheduler, which picks the least loaded unit for each job - or, in simulated time,
+the one available the soonest - and keeps track of how long each unit has been busy.
+Machines declare their units through component_slots, e.g. {const.COMP_HEATER: 2, ...}.
+"""
+
+import threading
+
+
+class UnitScheduler(object):
+    """Books jobs on units, keeping track of each unit's total busy time and of when it is next available.
+
+    Without a clock, units are picked by their load - the number of jobs currently running on them (see claim()),
+    then the total duration of the jobs booked on them so far - and booked jobs do not wait for each other.
+    With a clock (e.g. that of a simulation.Simulation), units are picked by the time they become available,
+    and each booked job starts once its unit is done with the jobs booked on it before.
+    Ties go to the unit listed first, i.e. the first installed.
+    Booking, claiming and releasing are thread-safe.
+    """
+
+    def __init__(self, clock=None, *args, **kwargs):
+        """
+        :param clock: optional; a callable returning the current (e.g. simulated) time.
+        """
+        self.clock = clock
+        self.busy_time = {} # unit -> total duration of the jobs booked on it
+        self.jobs = {} # unit -> number of jobs booked on it
+        self.available_at = {} # unit -> time at which the unit is done with its booked jobs; with a clock only
+        self.claims = {} # unit -> number of jobs currently running on it; see claim()
+        self._lock = threading.Lock()
+
+    def pick(self, units, *args, **kwargs):
+        """Selects the unit to run the next job on; see the class docstring.
+
+        :param units: units to choose from; Iterable.
+        :returns: the selected unit; None if there are none.
+        """
+        units = units if isinstance(units, (list, tuple)) else list(units or ())
+        if len(units) < 2: return units[0] if units else None
+        busy_time = self.busy_time
+        if self.clock is None: return min(units, key=lambda unit: (self.claims.get(unit, 0), busy_time.get(unit, 0)))
+        now = self.clock()
+        return min(units, key=lambda unit: (max(now, self.available_at.get(unit, now)), busy_time.get(unit, 0)))
+
+    def book(self, unit, duration, *args, **kwargs):
+        """Books a job of the given duration on the unit.
+
+        :returns: a tuple of the job's (start, end) times; without a clock, (0, duration).
+        """
+        with self._lock:
+            self.busy_time[unit] = self.busy_time.get(unit, 0) + duration
+            self.jobs[unit] = self.jobs.get(unit, 0) + 1
+            if self.clock is None: return 0, duration
+
+            now = self.clock()
+            start = max(now, self.available_at.get(unit, now))
+            end = self.available_at[unit] = start + duration
+        return start, end
+
+    def claim(self, unit):
+        """Marks a job as running on the unit until release() is called, so that concurrent jobs get picked other units."""
+        with self._lock: self.claims[unit] = self.claims.get(unit, 0) + 1
+        return unit
+
+    def release(self, unit):
+        with self._lock:
+            claims = self.claims.pop(unit, 0) - 1
+            if claims > 0: self.claims[unit] = claims
+
+    def utilization(self, units, elapsed=None, *args, **kwargs):
+        """Fraction of the elapsed time each unit spent busy.
+
+        :param elapsed: optional; the time elapsed; by default, the clock's current time.
+        :returns: a list aligned with the units.
+        """
+        if elapsed is None: elapsed = self.clock() if self.clock is not None else 0
+        return [self.busy_time.get(unit, 0) / float(elapsed) if elapsed else 0 for unit in (units or ())]
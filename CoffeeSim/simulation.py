@@ -0,0 +1,291 @@
+"""Discrete-event simulation of coffeemakers serving orders over (simulated) time.
+
+The Simulation holds a simulated clock and a heap-based queue of scheduled events; a BrewingStation runs
+the orders placed at a single coffeemaker through the machine's usual brewing stages as such events,
+each stage taking as long as the duration model of the component doing the work says it does.
+Machines with several grinders or heaters brew as many orders at once, each stage waiting for the soonest available unit.
+With a maintenance policy (see the maintenance module), stations also stop to refill, empty and descale their machines,
+which takes them out of service for a while.
+Since nothing actually waits, a simulated day of service runs in a fraction of a second.
+"""
+
+import collections
+import heapq
+import itertools
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim import errors, scheduling
+
+from CoffeeSim.maintenance import make_policy
+
+SECONDS_PER_HOUR = 3600
+
+
+class Simulation(object):
+    """An event queue with a simulated clock; times are in seconds."""
+
+    def __init__(self, start=0, *args, **kwargs):
+        self.now = start
+        self._queue = []
+        self._sequence = itertools.count() # breaks ties between same-time events in the order of scheduling
+
+    @property
+    def pending(self): return len(self._queue)
+
+    def schedule(self, delay, callback, *args, **kwargs):
+        """Schedules the callback to be called with the given arguments after the given delay from now."""
+        return self.schedule_at(self.now + max(0, delay), callback, *args, **kwargs)
+
+    def schedule_at(self, time, callback, *args, **kwargs):
+        """Schedules the callback to be called with the given arguments at the given (absolute) time."""
+        if time < self.now: raise ValueError("Cannot schedule events in the past! Time: {time}, now: {now}.".format(time=time, now=self.now))
+        heapq.heappush(self._queue, (time, next(self._sequence), callback, args, kwargs))
+
+    def step(self):
+        """Advances the clock to the next event and processes it.
+
+        :returns: False if there were no events left to process, True otherwise.
+        """
+        if not self._queue: return False
+        time, _, callback, args, kwargs = heapq.heappop(self._queue)
+        self.now = time
+        callback(*args, **kwargs)
+        return True
+
+    def run(self, until=None, *args, **kwargs):
+        """Processes the events in order of time, until there are none left or the specified time is reached.
+
+        :param until: optional; simulated time to stop at. Events scheduled for later stay queued.
+        """
+        while self._queue and (until is None or self._queue[0][0] <= until): self.step()
+        if until is not None: self.now = max(self.now, until)
+        return self.now
+
+
+class Order(object):
+    """A single order placed at a BrewingStation, along with its timeline and outcome."""
+
+    def __init__(self, preset=None, coffee_volume=None, *args, **kwargs):
+        self.preset = preset
+        self.coffee_volume = coffee_volume
+
+        self.placed = self.started = self.finished = None
+        self.result = self.error = None
+        self.stage_state = {} # intermediate products, passed between the stages
+
+    @property
+    def wait_time(self): return None if self.started is None else self.started - self.placed
+
+    @property
+    def brew_time(self): return None if self.finished is None else self.finished - self.started
+
+
+class BrewingStation(object):
+    """A single coffeemaker serving orders in simulated time.
+
+    Orders queue up in the order of arrival and are brewed up to concurrency at a time; each goes through the same stages as brew(),
+    with the stage effects applied at the start of the stage and the next stage following after the stage's duration.
+    The grinding and extraction stages get the soonest available grinder and heater, and also last until it is done
+    with the orders booked on it before (see scheduling.UnitScheduler); the water sources are not scheduled.
+    
+    Maintenance stops (see the maintenance module) service the machine at their start, then keep the station from starting
+    any new orders until they are over; the orders already brewing carry on. An order whose stage failed for lack of 
+    something the policy has serviced retries the stage, once, after the stop.
+    """
+    stage_names = ('get_water', 'get_grounds', 'get_extract', 'dispose_grounds', 'handle_extras')
+    scheduled_units = (const.COMP_GRINDER, const.COMP_HEATER)
+    maintenance_stop_time = 60 # s; to stop the machine for maintenance and get it going again, on top of servicing the components
+
+    def __init__(self, simulation, coffeemaker, concurrency=None, maintenance=None, *args, **kwargs):
+        """
+        :param concurrency: optional; the number of orders brewed at once; by default, the machine's number of grinders or heaters,
+            whichever is larger.
+        :param maintenance: optional; a maintenance.MaintenancePolicy, or the name of one; by default, the machine is never serviced.
+        """
+        self.simulation = simulation
+        self.coffeemaker = coffeemaker
+        self.scheduler = scheduling.UnitScheduler(clock=lambda: simulation.now)
+        self.concurrency = concurrency or max([1] + [len(coffeemaker.installed_components.get(comptype) or ())
+                                                     for comptype in self.scheduled_units])
+
+        self.queue = collections.deque()
+        self.in_flight = 0
+        self.completed = []
+        self.failed = []
+        self.busy_time = 0
+
+        self.maintenance = make_policy(maintenance)
+        self.services = [] # (time, maintenance.ServiceRecord) pairs, one per component type serviced
+        self.stops = 0 # maintenance stops made
+        self.downtime = 0 # total time spent in maintenance stops
+        self.down_until = simulation.now
+
+    @property
+    def busy(self): return self.in_flight >= self.concurrency or self.down
+
+    @property
+    def down(self):
+        """Whether the station is stopped for maintenance."""
+        return self.simulation.now < self.down_until
+
+    def place(self, preset=None, coffee_volume=None, at=None, *args, **kwargs):
+        """Schedules the arrival of an order.
+
+        :param at: optional; simulated time of the order's arrival; defaults to now.
+        :returns: the Order.
+        """
+        order = Order(preset=preset, coffee_volume=coffee_volume)
+        self.simulation.schedule_at(self.simulation.now if at is None else at, self._arrive, order)
+        return order
+
+    def _arrive(self, order):
+        order.placed = self.simulation.now
+        self.queue.append(order)
+        self._start_next()
+
+    def _start_next(self):
+        maintenance = self.maintenance
+        while self.queue and not self.busy:
+            if maintenance is not None and self._service(maintenance.before_order(self, self.queue[0])): return # resumes after the stop
+            self.in_flight += 1
+            order = self.queue.popleft()
+            order.started = self.simulation.now
+            self._run_stage(order, 0)
+
+        if maintenance is not None and not (self.queue or self.in_flight or self.down): self._service(maintenance.when_idle(self))
+
+    def _run_stage(self, order, stage_idx):
+        if stage_idx >= len(self.stage_names): return self._finish(order)
+
+        try: duration = getattr(self, 'stage_' + self.stage_names[stage_idx])(order)
+        except (RuntimeError, RuntimeWarning, ValueError) as err:
+            delay = self._recover(order, stage_idx, err)
+            if delay is not None: return self.simulation.schedule(delay, self._run_stage, order, stage_idx)
+            order.error = err
+            return self._finish(order)
+
+        self.busy_time += duration
+        self.simulation.schedule(duration, self._run_stage, order, stage_idx + 1)
+
+    def _recover(self, order, stage_idx, error):
+        """Has the maintenance policy service whatever the stage failed for, so that the stage can be retried - once per stage.
+
+        :returns: the delay to retry the stage after; None to fail the order.
+        """
+        if self.maintenance is None or order.stage_state.get('retried') == stage_idx: return None
+        if not self._service(self.maintenance.after_failure(self, order, error)): return None
+        order.stage_state['retried'] = stage_idx
+        return self.down_until - self.simulation.now
+
+    def _service(self, comptypes):
+        """Makes a maintenance stop servicing the components of the given types, unless there is nothing to service;
+        see AbstractCoffeemaker.service(). A stop made while the station is already down follows the one in progress.
+
+        :returns: the stop's duration; 0 if no stop was made.
+        """
+        records = [record for record in (self.coffeemaker.service(comptype) for comptype in comptypes) if record.amount]
+        if not records: return 0
+
+        now = self.simulation.now
+        duration = self.maintenance_stop_time + sum(record.duration for record in records)
+        self.down_until = max(self.down_until, now) + duration
+        self.services.extend((now, record) for record in records)
+        self.stops += 1
+        self.downtime += duration
+        self.simulation.schedule_at(self.down_until, self._start_next)
+        return duration
+
+    def _finish(self, order):
+        order.finished = self.simulation.now
+        order.stage_state = {}
+        (self.failed if order.error else self.completed).append(order)
+        self.in_flight -= 1
+        self._start_next()
+
+    # Stages - each applies the coffeemaker's stage method to the order and returns the stage duration:
+
+    def stage_get_water(self, order):
+        machine = self.coffeemaker
+        if not machine.powered: raise errors.NotPowered("The coffeemaker is not powered!")
+
+        plan = order.stage_state['plan'] = machine.plan(order.preset)
+        volume = order.coffee_volume or plan.volume
+
+        order.stage_state['water'] = machine.get_water(volume=volume)
+        sources = machine.installed_components.get(const.COMP_WATER)
+        return next(iter(sources)).draw_duration(volume)
+
+    def stage_get_grounds(self, order):
+        machine = self.coffeemaker
+        grinder = machine.pick_grinder(grinders=machine.installed_components.get(const.COMP_GRINDER), scheduler=self.scheduler)
+        plan = order.stage_state['plan']
+        grounds = order.stage_state['grounds'] = machine.get_grounds(strength=plan.strength, amount=plan.dose, grinder=grinder)
+        return self._book(grinder, grinder.grind_duration(items={grounds: grounds.amount}) if grounds else 0)
+
+    def stage_get_extract(self, order):
+        machine, state = self.coffeemaker, order.stage_state
+        plan = state['plan']
+        heater = machine.pick_heater(heaters=machine.installed_components.get(const.COMP_HEATER), scheduler=self.scheduler)
+        if heater is None: raise errors.NoHeater("No operational heater found!")
+        heat_time = heater.heat_duration(items=[state['water']], target_temp=machine.brew_temperature)
+
+        state['extract'], state['spent_grounds'] = machine.get_extract(grounds=state['grounds'], medium=state['water'], brew_name=plan.brew_name, 
+                                                                       pressure=plan.pressure, contact_time=plan.contact_time, heater=heater)
+        return self._book(heater, heat_time + machine.pressure2time.get(plan.pressure, machine.default_time))
+
+    def _book(self, unit, duration):
+        """Books the work on the unit; returns the stage duration - the work's, plus the wait for the unit to become available."""
+        start, _ = self.scheduler.book(unit, duration)
+        return (start - self.simulation.now) + duration
+
+    def stage_dispose_grounds(self, order):
+        self.coffeemaker.dispose_grounds(grounds=order.stage_state['spent_grounds'])
+        return 0
+
+    def stage_handle_extras(self, order):
+        plan = order.stage_state['plan']
+        order.result = self.coffeemaker.handle_extras(brew=order.stage_state['extract'], extras=plan.extras, plan=plan)
+        return len(plan.extras or ()) * self.coffeemaker.extra_time
+
+    # Statistics:
+
+    def cups_per_hour(self, *args, **kwargs):
+        """Sustained throughput so far, in completed cups per simulated hour."""
+        return len(self.completed) * SECONDS_PER_HOUR / float(self.simulation.now) if self.simulation.now else 0
+
+    def utilization(self, *args, **kwargs):
+        """Fraction of the simulated time so far the coffeemaker spent brewing, out of its concurrency."""
+        return self.busy_time / float(self.simulation.now * self.concurrency) if self.simulation.now else 0
+
+    def availability(self, *args, **kwargs):
+        """Fraction of the simulated time so far the station was not stopped for maintenance."""
+        return 1 - min(self.downtime, self.simulation.now) / float(self.simulation.now) if self.simulation.now else 1
+
+    def unit_utilization(self, *args, **kwargs):
+        """Fraction of the simulated time so far each grinder and heater spent working.
+
+        :returns: a dict of component types to lists of the fractions, in the order of installation.
+        """
+        return {comptype: self.scheduler.utilization(self.coffeemaker.installed_components.get(comptype), elapsed=self.simulation.now)
+                for comptype in self.scheduled_units}
+
+
+def serve(coffeemaker, orders, interval=0, until=None, concurrency=None, maintenance=None, *args, **kwargs):
+    """Simulates a coffeemaker serving a stream of orders.
+
+    :param coffeemaker: a coffeemaker instance
+    :param orders: Iterable of (preset, coffee_volume) pairs, same as for brew_many()
+    :param interval: optional; simulated time between consecutive orders' arrivals, in seconds
+    :param until: optional; simulated time to stop at
+    :param concurrency: optional; the number of orders brewed at once; see BrewingStation
+    :param maintenance: optional; a maintenance.MaintenancePolicy, or the name of one; see BrewingStation
+    :returns: the BrewingStation, holding the completed and failed Orders and the statistics.
+    """
+    simulation = Simulation()
+    station = BrewingStation(simulation, coffeemaker, concurrency=concurrency, maintenance=maintenance)
+    for order_no, (preset, coffee_volume) in enumerate(orders):
+        station.place(preset=preset, coffee_volume=coffee_volume, at=order_no * interval)
+    simulation.run(until=until)
+    return station
@@ -0,0 +1,335 @@
+"""Parameter sweeps - brewing a batch of orders for every combination of a grid of preset and machine parameters.
+
+A grid maps parameter names to the values to try; the sweep runs one cell per combination:
+- 'preset': a standard preset name (see presets.preset_by_name()), 'default', or 'random' for a random coffee button per order;
+- any Preset attribute - 'volume', 'strength', 'pressure', 'extras', 'output_name' - overriding the preset's;
+- a component slot - a key of SLOT_ALIASES (e.g. 'tanks') or a component type (e.g. const.COMP_WATER) - setting how many
+  of the component the machine gets.
+
+Each cell brews on a fresh machine, restocking it whenever it runs out, with its own RNG seeded from the base seed
+and the cell's parameters, so a cell's result does not depend on the rest of the grid or on the process running it.
+Cells run on a process pool; finished cells are appended to an on-disk cache keyed on the cell's parameters and
+the version of the simulation code, so re-running an interrupted (or extended) sweep only runs the missing cells.
+
+Run as: `python -m CoffeeSim.sweep -p preset=espresso,americano -p volume=50,100 -p tanks=1,2 -o sweep.csv`; see -h for the options.
+"""
+
+import collections
+import csv
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import random
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim import errors
+
+from CoffeeSim.make_coffee import make_coffee
+
+from CoffeeSim.helpers import NULL_SINK
+
+from CoffeeSim.presets import generic as presets
+
+SLOT_ALIASES = {
+    'tanks': const.COMP_WATER,
+    'bins': const.COMP_BEANS,
+    'grinders': const.COMP_GRINDER,
+    'heaters': const.COMP_HEATER,
+}
+PRESET_FIELDS = ('output_name', 'volume', 'pressure', 'strength', 'extras')
+
+class SweepResult(collections.namedtuple('SweepResult', ('served', 'failed', 'restocks', 'mean_caffeine', 'mean_temperature', 'mean_volume', 'drink', 'error'))):
+    """Outcome of a single sweep cell: order counts, the number of restocks needed, the mean caffeine, temperature
+    and volume of the served drinks, the description of the last drink and the cause of the first failure, if any.
+    """
+    __slots__ = ()
+
+
+def expand_grid(grid):
+    """Lists the cells of a grid, in order; the last parameter varies fastest.
+
+    :param grid: a Mapping of parameter names to Iterables of values; see the module docstring.
+    :returns: a list of OrderedDicts of parameter names to values.
+    """
+    names = list(grid)
+    for name in names:
+        if name != 'preset' and name not in PRESET_FIELDS and _slot(name) is None: raise ValueError("Unknown sweep parameter: {name}.".format(name=name))
+    cells = [collections.OrderedDict(zip(names, values)) for values in itertools.product(*(list(grid[name]) for name in names))]
+    for params in cells: cell_preset(params) # fails early on invalid presets, rather than in the workers
+    return cells
+
+
+def _slot(name):
+    name = SLOT_ALIASES.get(name, name)
+    return name if name in (const.COMP_WATER, const.COMP_BEANS, const.COMP_GRINDER, const.COMP_HEATER) else None
+
+
+_code_version = None
+
+def code_version():
+    """A digest of the simulation's source code; cached results of other code versions are not reused."""
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha1()
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        for root, dirs, files in os.walk(package_dir):
+            dirs.sort()
+            for name in sorted(files):
+                if not name.endswith('.py'): continue
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, package_dir).encode('utf-8'))
+                with open(path, 'rb') as source: digest.update(source.read())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+
+def _type_path(machine_type):
+    return None if machine_type is None else "{module}.{name}".format(module=machine_type.__module__, name=machine_type.__name__)
+
+def cell_key(params, cups, seed, machine_type=None):
+    """The cache key of a cell: a digest of its parameters, the run settings and the code version."""
+    spec = json.dumps({'params': list(params.items()), 'cups': cups, 'seed': seed, 'machine': _type_path(machine_type), 'code': code_version()},
+                      sort_keys=True, default=repr)
+    return hashlib.sha1(spec.encode('utf-8')).hexdigest()
+
+
+def cell_seed(seed, params):
+    """Returns the RNG seed of the cell with the given parameters in a sweep with the given base seed."""
+    return "{seed}:{params}".format(seed=seed, params=json.dumps(list(params.items()), default=repr))
+
+
+_presets = {}
+_machine_types = {}
+
+def cell_preset(params):
+    """Builds the preset of a cell - the named preset, with any preset attributes of the cell overriding its own.
+
+    :returns: a Preset class, None for the machine default, or NotImplemented for random presets.
+    """
+    overrides = tuple((name, _preset_value(name, params[name])) for name in PRESET_FIELDS if name in params)
+    name = params.get('preset')
+    if str(name).strip().lower() == 'random':
+        if overrides: raise ValueError("Random presets cannot have their attributes overridden!")
+        return NotImplemented
+    base = presets.preset_by_name(name) if name is not None else None
+    if not overrides: return base
+
+    key = (base, overrides)
+    preset = _presets.get(key)
+    if preset is None:
+        base = base or presets.GenericPreset
+        preset = _presets[key] = presets.PresetType(base.__name__, (base,), dict(overrides, __module__=__name__))
+    return preset
+
+def _preset_value(name, value):
+    if name == 'extras' and not isinstance(value, (tuple, list)): return tuple(extra for extra in str(value or '').split('+') if extra)
+    if name == 'extras': return tuple(value)
+    return value
+
+
+def cell_machine_type(params, machine_type=None):
+    """Builds the coffeemaker class of a cell - the given machine class with the cell's component slot counts.
+
+    :param machine_type: optional; a coffeemaker class; GenericCoffeemaker by default.
+    """
+    if machine_type is None:
+        from CoffeeSim.models.generic import GenericCoffeemaker
+        machine_type = GenericCoffeemaker
+    slots = tuple(sorted((_slot(name), int(value)) for (name, value) in params.items() if _slot(name) is not None))
+    if not slots: return machine_type
+
+    key = (machine_type, slots)
+    cell_type = _machine_types.get(key)
+    if cell_type is None:
+        cell_type = _machine_types[key] = type(machine_type.__name__, (machine_type,), {'component_slots': dict(machine_type.component_slots, **dict(slots))})
+    return cell_type
+
+
+def run_cell(params, cups=20, seed=0, machine_type=None, *args, **kwargs):
+    """Brews the cups of a single cell on a fresh machine; see the module docstring.
+
+    :returns: a SweepResult.
+    """
+    rng = random.Random(cell_seed(seed, params))
+    preset = cell_preset(params)
+    machine = cell_machine_type(params, machine_type=machine_type)(event_sink=NULL_SINK)
+
+    served, failed, restocks, error = 0, 0, 0, None
+    caffeine = temperature = volume = 0
+    drink = None
+    for _ in range(cups):
+        try:
+            try: coffee = make_coffee(machine, preset=preset, rng=rng, quiet=True)
+            except (errors.SupplyExhausted, errors.MaintenanceDue):
+                if not any(machine.restock().values()): raise
+                restocks += 1
+                coffee = make_coffee(machine, preset=preset, rng=rng, quiet=True)
+        except (RuntimeError, RuntimeWarning, ValueError) as err:
+            failed += 1
+            error = error or errors.failure_cause(err)
+            continue
+
+        served += 1
+        caffeine += getattr(coffee, 'caffeine_content', 0)
+        temperature += coffee.temperature
+        volume += coffee.volume
+        drink = str(coffee)
+
+    mean = (lambda total: total / float(served)) if served else (lambda total: 0)
+    return SweepResult(served=served, failed=failed, restocks=restocks, mean_caffeine=mean(caffeine), mean_temperature=mean(temperature),
+                       mean_volume=mean(volume), drink=drink, error=error)
+
+
+def _run_task(task):
+    idx, params, cups, seed, machine_type = task
+    return idx, run_cell(params, cups=cups, seed=seed, machine_type=machine_type)
+
+
+class ResultCache(object):
+    """An append-only, on-disk cache of cell results: a file of JSON lines of {"key": ..., "result": [...]}.
+
+    Every result is flushed as soon as it is added, so the cache survives an interrupted sweep;
+    a line left half-written by the interruption is ignored.
+    """
+
+    def __init__(self, path, *args, **kwargs):
+        self.path = path
+        self.results = {}
+        if os.path.exists(path):
+            with open(path) as cache_file:
+                for line in cache_file:
+                    try: entry = json.loads(line)
+                    except ValueError: continue
+                    self.results[entry['key']] = SweepResult(*entry['result'])
+        self._file = None
+
+    def get(self, key, default=None): return self.results.get(key, default)
+
+    def __contains__(self, key): return key in self.results
+
+    def __len__(self): return len(self.results)
+
+    def add(self, key, result, *args, **kwargs):
+        self.results[key] = result
+        if self._file is None: self._file = open(self.path, 'a')
+        self._file.write(json.dumps({'key': key, 'result': list(result)}) + "\n")
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None: self._file.close()
+        self._file = None
+
+
+def iter_sweep(grid, cups=20, seed=0, processes=None, cache=None, machine_type=None, *args, **kwargs):
+    """Runs a sweep, yielding the results as the cells finish; cached cells come first.
+
+    :param grid: a Mapping of parameter names to Iterables of values; see the module docstring.
+    :param cups: optional; number of orders each cell brews.
+    :param seed: optional; base RNG seed; see cell_seed().
+    :param processes: optional; number of worker processes; defaults to the CPU count; 1 runs the cells in this process.
+    :param cache: optional; a ResultCache, or the path of one.
+    :param machine_type: optional; a coffeemaker class; must be importable by the workers.
+    :returns: a generator of (cell index, parameters, SweepResult, cached) tuples.
+    """
+    cells = expand_grid(grid)
+    own_cache = isinstance(cache, str)
+    if own_cache: cache = ResultCache(cache)
+
+    try:
+        keys = [cell_key(params, cups, seed, machine_type) for params in cells]
+        tasks = []
+        for (idx, params) in enumerate(cells):
+            if cache is not None and keys[idx] in cache: yield idx, params, cache.get(keys[idx]), True
+            else: tasks.append((idx, params, cups, seed, machine_type))
+
+        for (idx, result) in _run_tasks(tasks, processes):
+            if cache is not None: cache.add(keys[idx], result)
+            yield idx, cells[idx], result, False
+    finally:
+        if own_cache: cache.close()
+
+
+def _run_tasks(tasks, processes=None):
+    if not tasks: return
+    if processes == 1:
+        for task in tasks: yield _run_task(task)
+        return
+
+    pool = multiprocessing.Pool(processes=processes)
+    try:
+        chunksize = max(1, len(tasks) // (4 * (processes or multiprocessing.cpu_count())))
+        for outcome in pool.imap_unordered(_run_task, tasks, chunksize): yield outcome
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def run_sweep(grid, output=None, *args, **kwargs):
+    """Runs a sweep; see iter_sweep() for the parameters.
+
+    :param output: optional; path (or text file-like object) to write the results to, as CSV.
+    :returns: a list of rows - OrderedDicts of the cell's parameters and SweepResult fields - in the grid order.
+    """
+    rows = [None] * len(expand_grid(grid))
+    for (idx, params, result, _) in iter_sweep(grid, *args, **kwargs):
+        row = rows[idx] = collections.OrderedDict(params)
+        row.update(result._asdict())
+    if output is not None: write_table(rows, output)
+    return rows
+
+
+def write_table(rows, target, *args, **kwargs):
+    """Writes sweep rows out as CSV, with a header row."""
+    output = open(target, 'w', newline='') if isinstance(target, str) else target
+    try:
+        writer = csv.writer(output, lineterminator='\n')
+        if rows: writer.writerow(list(rows[0]))
+        for row in rows: writer.writerow(['+'.join(value) if isinstance(value, (tuple, list)) else value for value in row.values()])
+    finally:
+        if output is not target: output.close()
+    return len(rows)
+
+
+def parse_values(spec):
+    """Parses a CLI parameter spec, e.g. 'volume=50,100', into a (name, values) pair; numeric values become numbers."""
+    name, _, values = spec.partition('=')
+    if not values: raise ValueError("Sweep parameters are given as name=value[,value...]; got '{spec}'.".format(spec=spec))
+
+    def parse(value):
+        for convert in (int, float):
+            try: return convert(value)
+            except ValueError: pass
+        return value
+    return name.strip(), [parse(value.strip()) for value in values.split(',')]
+
+
+def main(argv=None):
+    import argparse
+    import sys
+
+    arg_parser = argparse.ArgumentParser(description="Brews a batch of orders for every combination of a grid of parameters.")
+    arg_parser.add_argument('-p', '--param', action='append', default=[], metavar='NAME=VALUES',
+                            help="A grid parameter and its comma-separated values; repeat for more parameters. Supported: preset, {fields}, {slots}."
+                                 .format(fields=", ".join(PRESET_FIELDS), slots=", ".join(sorted(SLOT_ALIASES))))
+    arg_parser.add_argument('-o', '--output', help="Optional. Path to write the results table to; stdout by default.")
+    arg_parser.add_argument('-n', '--cups', type=int, default=20, help="Optional. Orders brewed per cell. Default: 20.")
+    arg_parser.add_argument('--seed', type=int, default=0, help="Optional. Base RNG seed. Default: 0.")
+    arg_parser.add_argument('-j', '--processes', type=int, help="Optional. Worker processes. Default: the CPU count.")
+    arg_parser.add_argument('--cache', default='.sweep-cache.jsonl', help="Optional. Path of the result cache. Default: .sweep-cache.jsonl.")
+    arg_parser.add_argument('--no-cache', action='store_true', help="Optional. Runs every cell, without reading or writing the cache.")
+    parsed_args = arg_parser.parse_args(argv)
+
+    grid = collections.OrderedDict(parse_values(spec) for spec in parsed_args.param) or {'preset': [preset.__name__ for preset in presets.STANDARD_PRESETS]}
+    run_sweep(grid, output=parsed_args.output or sys.stdout, cups=parsed_args.cups, seed=parsed_args.seed,
+              processes=parsed_args.processes, cache=None if parsed_args.no_cache else parsed_args.cache)
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
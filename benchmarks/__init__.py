@@ -0,0 +1 @@
+"""Performance benchmarks for CoffeeSim; NOT part of the test suite."""
@@ -0,0 +1,41 @@
+"""Runs the benchmark suite: `python -m benchmarks -h` for the options."""
+
+import argparse
+import fnmatch
+import sys
+
+from benchmarks import suite, micro, macro # registers the benchmarks
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="CoffeeSim benchmark suite.")
+    arg_parser.add_argument('-k', '--filter', help="Optional. Only runs the benchmarks whose names match this glob pattern.")
+    arg_parser.add_argument('-g', '--group', choices=('micro', 'macro'), help="Optional. Only runs this group of benchmarks.")
+    arg_parser.add_argument('-r', '--repeat', type=int, default=5, help="Optional. Measurements per benchmark; the best one counts.")
+    arg_parser.add_argument('--quick', action='store_true', help="Optional. Runs each benchmark a tenth as many times; noisier.")
+    arg_parser.add_argument('-o', '--save', metavar='PATH', help="Optional. Saves the results as a JSON baseline.")
+    arg_parser.add_argument('-c', '--compare', metavar='PATH', help="Optional. Compares the results against a JSON baseline.")
+    arg_parser.add_argument('-t', '--threshold', type=float, default=10.0, help="Optional. Slowdown in percent counted as a regression. Default: 10.")
+    parsed_args = arg_parser.parse_args(argv)
+    
+    names = [name for (name, bench) in suite.REGISTRY.items() 
+             if (not parsed_args.group or bench.group == parsed_args.group) 
+             and (not parsed_args.filter or fnmatch.fnmatch(name, parsed_args.filter))]
+    
+    def report(name, result): 
+        print("{name:<32}{usec:>14.3f} us/op".format(name=name, usec=1e6 * result['seconds_per_op']))
+        sys.stdout.flush()
+    
+    results = suite.run(names=names, repeat=parsed_args.repeat, scale=0.1 if parsed_args.quick else 1.0, report=report)
+    if parsed_args.save: suite.save(results, parsed_args.save)
+    
+    if parsed_args.compare:
+        comparison = suite.compare(results, suite.load(parsed_args.compare), threshold=parsed_args.threshold)
+        print("")
+        for (name, previous, current, change, regressed) in comparison:
+            print("{name:<32}{change:>+9.1f}%{flag}".format(name=name, change=change, flag="  REGRESSION" if regressed else ""))
+        if any(regressed for (_, _, _, _, regressed) in comparison): return 1
+    return 0
+    
+    
+if __name__ == '__main__': sys.exit(main())
@@ -0,0 +1,63 @@
+"""Macro-benchmarks of whole brews, as the users drive them."""
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim.make_coffee import make_coffee
+
+from CoffeeSim.models.generic import GenericCoffeemaker
+
+from CoffeeSim.presets import generic as presets
+
+from CoffeeSim.helpers import NULL_SINK
+
+from benchmarks.suite import benchmark
+
+PRESETS = (presets.Americano, presets.Crema, presets.Espresso, presets.Cappucino)
+
+
+def refill(coffeemaker):
+    """Tops up the coffeemaker's tanks and bean containers, so that it never runs dry, and empties its grounds bins 
+    and descales its filters; resets the contents, rather than adding to them.
+    """
+    for tank in coffeemaker.installed_components[const.COMP_WATER]:
+        if tank.contents_volume < tank.capacity / 2.0: 
+            tank.contents = tank.fill({coffeemaker.materials.Water: tank.capacity}, container=type(tank.contents)())
+    for container in coffeemaker.installed_components[const.COMP_BEANS]:
+        if container.stock < container.capacity / 2.0:
+            container.contents = container.fill({coffeemaker.materials.CoffeeBeans: container.capacity}, container=type(container.contents)())
+    for comptype in (const.COMP_GROUNDSBIN, const.COMP_FILTER): 
+        for component in coffeemaker.installed_components[comptype]: component.service(below=0.5)
+            
+def quiet_coffeemaker():
+    return GenericCoffeemaker(event_sink=NULL_SINK)
+    
+
+def _register_preset_benchmarks(preset):
+    @benchmark('make_coffee[{}]'.format(preset.__name__), 'macro', number=2000)
+    def make_coffee_preset(number):
+        coffeemaker = quiet_coffeemaker()
+        def run():
+            refill(coffeemaker)
+            return make_coffee(coffeemaker, preset=preset, quiet=True)
+        return run
+        
+    @benchmark('brew[{}]'.format(preset.__name__), 'macro', number=2000)
+    def brew_preset(number):
+        coffeemaker = quiet_coffeemaker()
+        def run():
+            refill(coffeemaker)
+            return coffeemaker.brew(preset=preset)
+        return run
+        
+for _preset in PRESETS: _register_preset_benchmarks(_preset)
+    
+    
+@benchmark('sustained 100k brews', 'macro', number=100000)
+def sustained_brews(number):
+    coffeemaker = quiet_coffeemaker()
+    orders = iter([PRESETS[order_no % len(PRESETS)] for order_no in range(number)])
+    def run():
+        refill(coffeemaker)
+        return coffeemaker.brew(preset=next(orders))
+    return run
@@ -0,0 +1,66 @@
+"""Memory benchmark: per-object footprint of the comestibles vs. their compact (slotted) variants.
+
+Run as: `python -m benchmarks.memory [object count]`
+"""
+
+import gc
+import sys
+import tracemalloc
+
+from CoffeeSim import comestibles, compact_comestibles
+
+
+def make_liquid(materials): return materials.Liquid(volume=100, temperature=60)
+
+def make_water(materials): return materials.Water(volume=100)
+
+def make_coffee(materials): 
+    coffee = materials.Coffee(volume=100, temperature=80, caffeine_content=90, name_override='Caffe Crema')
+    coffee.add_extra('crema')
+    str(coffee) # a served cup has had its description rendered at least once
+    return coffee
+
+def make_beans(materials): return materials.CoffeeBeans(amount=100)
+
+def make_grounds(materials): return materials.CoffeeGrounds(amount=100)
+
+CASES = (
+    ('Liquid', make_liquid),
+    ('Water', make_water),
+    ('Coffee', make_coffee),
+    ('CoffeeBeans', make_beans),
+    ('CoffeeGrounds', make_grounds),
+)
+
+
+def measure(factory, materials, count):
+    """Returns the average number of bytes retained per object built by the factory."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        objects = [factory(materials) for _ in range(count)]
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+    finally: tracemalloc.stop()
+    
+    retained -= sys.getsizeof(objects) # don't count the holding list
+    return retained / float(count)
+    
+
+def run(count=10000):
+    results = {}
+    for name, factory in CASES:
+        results[name] = (measure(factory, comestibles, count), measure(factory, compact_comestibles, count))
+    return results
+    
+    
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    count = int(argv[0]) if argv else 10000
+    
+    print("{:<16}{:>14}{:>14}{:>10}".format("Bytes/object", "comestibles", "compact", "saved"))
+    for name, (regular, compact) in sorted(run(count).items()):
+        print("{:<16}{:>14.1f}{:>14.1f}{:>9.0f}%".format(name, regular, compact, 100 * (1 - compact / regular)))
+        
+
+if __name__ == '__main__': main()
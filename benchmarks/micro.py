@@ -0,0 +1,80 @@
+"""Micro-benchmarks of the individual hot paths."""
+
+from CoffeeSim import comestibles, compact_comestibles, results
+
+from CoffeeSim.components import water_supply, heaters
+
+from CoffeeSim.helpers import NULL_SINK
+
+from benchmarks.suite import benchmark
+
+
+def _filled_tanks(tank_type, number):
+    """Fresh tanks for each run, as removing drains the tank's liquids in place."""
+    tanks = []
+    for _ in range(number):
+        tank = tank_type(contents={comestibles.Water: 300})
+        tank.event_sink = NULL_SINK
+        tanks.append(tank)
+    return iter(tanks)
+    
+
+@benchmark('Tank.fill', 'micro', number=20000)
+def tank_fill(number):
+    tank = water_supply.Tank()
+    empty = set()
+    return lambda: tank.fill({comestibles.Water: 100}, container=empty) # fills a copy, leaving the tank as it was
+    
+@benchmark('Tank.remove', 'micro', number=20000)
+def tank_remove(number):
+    tanks = _filled_tanks(water_supply.Tank, number)
+    return lambda: next(tanks).remove(remove_volume=100)
+    
+@benchmark('CompactTank.remove', 'micro', number=20000)
+def compact_tank_remove(number):
+    tanks = _filled_tanks(water_supply.CompactTank, number)
+    return lambda: next(tanks).remove(remove_volume=100)
+    
+@benchmark('CoffeeBeans.grind', 'micro', number=20000)
+def beans_grind(number):
+    beans = iter([comestibles.CoffeeBeans(amount=200) for _ in range(number)])
+    return lambda: next(beans).grind(amount=100)
+    
+@benchmark('Heater.heat', 'micro', number=20000)
+def heater_heat(number):
+    heater = heaters.Heater()
+    heater.event_sink = NULL_SINK
+    items = [comestibles.Water(volume=100)]
+    return lambda: heater.heat(items=items, target_temp=80)
+    
+@benchmark('Heater.heat_batch, 1000 cups', 'micro', number=200)
+def heater_heat_batch(number):
+    heater = heaters.Heater()
+    heater.event_sink = NULL_SINK
+    batches = iter([[comestibles.Water(volume=100) for _ in range(1000)] for _ in range(number)])
+    return lambda: heater.heat_batch(items=next(batches), target_temp=80)
+    
+@benchmark('Coffee.__str__', 'micro', number=20000)
+def coffee_str(number):
+    coffee = comestibles.Coffee(volume=100, temperature=80, caffeine_content=90, name_override='Caffe Crema', extras=['crema'])
+    return lambda: str(coffee)
+    
+@benchmark('compact Coffee.__str__', 'micro', number=20000)
+def compact_coffee_str(number):
+    coffee = compact_comestibles.Coffee(volume=100, temperature=80, caffeine_content=90, name_override='Caffe Crema', extras=['crema'])
+    return lambda: str(coffee)
+    
+@benchmark('ResultStore.append', 'micro', number=20000)
+def result_store_append(number):
+    store = results.ResultStore()
+    coffee = comestibles.Coffee(volume=100, temperature=80, caffeine_content=90, extras=['crema'])
+    return lambda: store.append(coffee, preset='Crema')
+    
+@benchmark('ResultStore.aggregate, 100k cups', 'micro', number=20)
+def result_store_aggregate(number):
+    store = results.ResultStore()
+    for idx in range(100000):
+        coffee = comestibles.Coffee(volume=50 + idx % 150, temperature=60 + idx % 25, caffeine_content=idx % 200)
+        store.append(coffee, preset=('Espresso', 'Americano', 'Crema', 'Cappucino')[idx % 4], machine=idx % 8)
+    return lambda: store.aggregate(by='preset', column='caffeine')
+
@@ -0,0 +1,73 @@
+"""Benchmark registry, runner and baseline comparison."""
+
+import collections
+import json
+import platform
+import sys
+import time
+import timeit
+
+Benchmark = collections.namedtuple('Benchmark', ('name', 'group', 'setup', 'number'))
+
+REGISTRY = collections.OrderedDict()
+
+
+def benchmark(name, group, number=1000):
+    """Registers a benchmark.
+    
+    Decorates a setup function, which takes the number of runs per measurement, prepares everything the benchmark needs
+    and returns the callable to time. Setup is repeated (untimed) before every measurement, so a callable that uses up
+    whatever it works on can be given enough fresh material up front.
+    """
+    def register(setup):
+        REGISTRY[name] = Benchmark(name=name, group=group, setup=setup, number=number)
+        return setup
+    return register
+    
+    
+def run(names=None, repeat=5, scale=1.0, report=None):
+    """Runs the selected benchmarks.
+    
+    :param names: optional; Iterable of benchmark names to run; all registered benchmarks by default.
+    :param repeat: optional; number of measurements per benchmark; the best one counts.
+    :param scale: optional; multiplier of each benchmark's number of runs per measurement, e.g. 0.1 for a quick check.
+    :param report: optional; callable receiving each benchmark's name and result as they are finished.
+    :returns: a results dict, suitable for save().
+    """
+    results = collections.OrderedDict()
+    for name, bench in REGISTRY.items():
+        if names is not None and name not in names: continue
+        
+        number = max(1, int(bench.number * scale))
+        best = min(timeit.Timer(bench.setup(number)).timeit(number=number) for _ in range(max(1, repeat)))
+        
+        results[name] = {'group': bench.group, 'number': number, 'seconds_per_op': best / number}
+        if report: report(name, results[name])
+        
+    return {
+        'meta': {'python': platform.python_version(), 'implementation': platform.python_implementation(), 'timestamp': time.time()},
+        'results': results,
+    }
+    
+    
+def save(results, path):
+    with open(path, 'w') as baseline_file: json.dump(results, baseline_file, indent=2)
+        
+def load(path):
+    with open(path) as baseline_file: return json.load(baseline_file)
+    
+    
+def compare(results, baseline, threshold=10.0):
+    """Compares the results against a baseline.
+    
+    :param threshold: optional; slowdown, in percent, beyond which a benchmark counts as regressed.
+    :returns: a list of (name, baseline seconds per op, current seconds per op, change in percent, regressed) tuples,
+        for all benchmarks present in both.
+    """
+    comparison = []
+    for name, current in results['results'].items():
+        previous = baseline['results'].get(name)
+        if not previous: continue
+        change = 100.0 * (current['seconds_per_op'] / previous['seconds_per_op'] - 1)
+        comparison.append((name, previous['seconds_per_op'], current['seconds_per_op'], change, change > threshold))
+    return comparison
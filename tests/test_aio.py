@@ -0,0 +1,60 @@
+"""Tests to verify asynchronous brewing."""
+
+import asyncio
+import unittest 
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim import aio
+
+from CoffeeSim.models import generic
+
+from CoffeeSim.presets import generic as presets
+
+
+class AsyncBrewingTest(unittest.TestCase):
+
+    def setUp(self):
+        Constants.USE_SOUND_EFFECTS = False
+        self.machine = aio.AsyncGenericCoffeemaker()
+        
+    def tearDown(self):
+        Constants.USE_SOUND_EFFECTS = True
+        
+    def test_interleaved_orders(self):
+        orders = (presets.Espresso, presets.Crema, presets.Cappucino, presets.Espresso)
+        
+        async def serve(): return await asyncio.gather(*(self.machine.abrew(preset=preset) for preset in orders))
+        brewed = asyncio.run(serve())
+        asyncio.run(self.machine.abrew()) # resources carry over to a new loop
+        
+        reference = generic.GenericCoffeemaker()
+        self.assertEqual([str(brew) for brew in brewed], [str(reference.brew(preset=preset)) for preset in orders])
+        reference.brew()
+        self.assertAlmostEqual(sum(tank.contents_volume for tank in self.machine.installed_components[const.COMP_WATER]),
+                               sum(tank.contents_volume for tank in reference.installed_components[const.COMP_WATER]))
+        
+    def test_button(self):
+        brewed = asyncio.run(self.machine.coffee_buttons[0].apress())
+        self.assertEqual(brewed.display_name, self.machine.coffee_buttons[0].preset.output_name)
+        with self.assertRaises(TypeError): generic.GenericCoffeemaker().coffee_buttons[0].apress()
+        
+    def test_timeout_and_cancellation(self):
+        self.machine.time_scale = 0.01 # an Americano takes a few seconds even at this pace
+        
+        async def serve():
+            with self.assertRaises(asyncio.TimeoutError): await self.machine.abrew(preset=presets.Americano, timeout=0.05)
+            
+            order = asyncio.ensure_future(self.machine.abrew(preset=presets.Americano))
+            await asyncio.sleep(0.05)
+            order.cancel()
+            with self.assertRaises(asyncio.CancelledError): await order
+            
+        asyncio.run(serve())
+        for resource in self.machine.resources.values(): self.assertEqual(resource.in_use, 0)
+        
+        
+def main(): return unittest.main()
+        
+if __name__ == '__main__': main()
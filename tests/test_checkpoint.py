@@ -0,0 +1,98 @@
+"""Tests to verify the snapshots and restores of coffeemakers."""
+
+import os
+import tempfile
+import unittest 
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim import checkpoint, fleet
+
+from CoffeeSim.components import water_supply
+
+from CoffeeSim.helpers import NULL_SINK
+
+from CoffeeSim.models import generic
+
+from CoffeeSim.presets import generic as presets
+
+
+class CompactCoffeemaker(generic.GenericCoffeemaker):
+    component_types = dict(generic.GenericCoffeemaker.component_types, **{const.COMP_WATER: water_supply.CompactTank})
+    water_policy = 'balance_levels'
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.machine = generic.GenericCoffeemaker(event_sink=NULL_SINK)
+        self.machine.brew(preset=presets.Espresso)
+        
+    def state(self, machine):
+        tanks = [(type(tank), sorted((type(liquid), liquid.volume, liquid.temperature) for liquid in tank.contents), tank.capacity)
+                 for tank in machine.installed_components[const.COMP_WATER]]
+        bins = [[(lot.bean_type, lot.amount, lot.roast_date, lot.expires) for lot in container.contents]
+                for container in machine.installed_components[const.COMP_BEANS]]
+        levels = [(getattr(comp, 'grounds', None), getattr(comp, 'filtered', None))
+                  for comptype in (const.COMP_GROUNDSBIN, const.COMP_FILTER) for comp in machine.installed_components[comptype]]
+        return (type(machine), machine.machine_id, machine.powered, machine.water_policy, tanks, bins, levels, 
+                {comptype: [type(comp) for comp in comps] for (comptype, comps) in machine.installed_components.items() if comps})
+    
+    def test_round_trip(self):
+        self.machine.installed_components[const.COMP_WATER][0].capacity = 800
+        self.machine.machine_id = 7
+        self.machine.installed_components[const.COMP_WATER][0].fill({generic.comestibles.Water: 250}, temperature=60)
+        
+        restored = checkpoint.restore(checkpoint.snapshot(self.machine), event_sink=NULL_SINK)
+        self.assertEqual(self.state(restored), self.state(self.machine))
+        self.assertEqual(restored.machine_id, 7)
+        self.assertEqual(str(restored.brew(preset=presets.Cappucino)), str(self.machine.brew(preset=presets.Cappucino)))
+        
+        self.machine.power_button.press()
+        self.assertFalse(checkpoint.restore(checkpoint.snapshot(self.machine)).powered)
+        
+    def test_forks_are_independent(self):
+        """Verifies every restore of the same snapshot is a separate machine, with its interface wired to it."""
+        state = checkpoint.snapshot(self.machine)
+        forks = [checkpoint.restore(state, event_sink=NULL_SINK) for _ in range(2)]
+        forks[0].brew(preset=presets.Americano)
+        
+        self.assertEqual(self.state(forks[1]), self.state(checkpoint.restore(state)))
+        self.assertNotEqual(self.state(forks[0]), self.state(forks[1]))
+        self.assertIs(forks[1].power_button.owner(), forks[1])
+        forks[1].coffee_buttons[0].press()
+        self.assertEqual(self.state(forks[1]), self.state(forks[0]))
+        
+    def test_coffee_in_tanks(self):
+        """Verifies coffee held in a tank keeps its caffeine and extras."""
+        tank = self.machine.installed_components[const.COMP_WATER][0]
+        tank.contents.add(generic.comestibles.Coffee(volume=100.0, temperature=80.0, caffeine_content=50.0, extras=["crema"]))
+        
+        restored = checkpoint.restore(checkpoint.snapshot(self.machine), event_sink=NULL_SINK)
+        coffees = [liquid for liquid in restored.installed_components[const.COMP_WATER][0].contents if isinstance(liquid, generic.comestibles.Coffee)]
+        self.assertEqual([(coffee.caffeine_content, coffee.extras, str(coffee)) for coffee in coffees], 
+                         [(50, ["crema"], str(liquid)) for liquid in tank.contents if isinstance(liquid, generic.comestibles.Coffee)])
+        
+    def test_compact_tanks(self):
+        machine = CompactCoffeemaker(event_sink=NULL_SINK)
+        machine.brew(preset=presets.Americano)
+        restored = checkpoint.restore(checkpoint.snapshot(machine), event_sink=NULL_SINK)
+        self.assertEqual(self.state(restored), self.state(machine))
+        self.assertEqual(restored.water_index.total, machine.water_index.total)
+        
+    def test_files(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = checkpoint.save(self.machine, os.path.join(tmp_dir, 'machine.snap'))
+            self.assertEqual(self.state(checkpoint.load(path)), self.state(self.machine))
+            
+    def test_invalid(self):
+        with self.assertRaises(ValueError): checkpoint.restore(b'not a snapshot at all')
+        data = checkpoint.snapshot(self.machine)
+        with self.assertRaises(ValueError): checkpoint.restore(data[:4] + b'\xff' + data[5:])
+        with self.assertRaises(TypeError): checkpoint.snapshot(fleet.SiteCoffeemaker(site=fleet.Site(), event_sink=NULL_SINK))
+
+
+def main(): return unittest.main()
+        
+if __name__ == '__main__': main()
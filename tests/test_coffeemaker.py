@@ -1,11 +1,28 @@
 """Tests to verify high-level performance of the coffee machines as a whole."""
 
+import asyncio
+import contextlib
+import io
+import sys
+import threading
+import time
 import unittest 
 
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim import aio, errors
+
+from CoffeeSim.helpers import NULL_SINK
+
 from CoffeeSim.make_coffee import make_coffee
 
 from CoffeeSim.models import generic
 
+from CoffeeSim.components import water_supply, bean_supply
+
+from CoffeeSim.presets import generic as presets
+
 def handle_IO(*args): print(", ".join(map(str, args)))
 
 class AbstractBrewingInterfaceTest(unittest.TestCase):
@@ -52,6 +69,226 @@ class GenericCoffeemakerIntegrationTest(unittest.TestCase):
         brew = self.machine.brew()
         self.assertIsNotNone(brew)
         
+    def test_compact_tanks(self):
+        """Verifies the machine brews the same with the compact tanks installed."""
+        class CompactTankCoffeemaker(generic.GenericCoffeemaker):
+            component_types = dict(generic.GenericCoffeemaker.component_types, **{const.COMP_WATER: water_supply.CompactTank})
+        
+        machine, reference = CompactTankCoffeemaker(), generic.GenericCoffeemaker()
+        for preset in (presets.Espresso, presets.Cappucino, presets.Americano):
+            self.assertEqual(str(machine.brew(preset=preset)), str(reference.brew(preset=preset)))
+            
+    def test_indexed_water_sources(self):
+        """Verifies a machine with many tanks and a water policy brews the same, draining the tanks by the policy."""
+        class ReservoirCoffeemaker(generic.GenericCoffeemaker):
+            component_slots = dict(generic.GenericCoffeemaker.component_slots, **{const.COMP_WATER: 20})
+            water_policy = 'balance_levels'
+            
+        machine = ReservoirCoffeemaker()
+        self.machine.powered = True
+        for preset in (presets.Espresso, presets.Cappucino, presets.Americano):
+            self.assertEqual(str(machine.brew(preset=preset)), str(self.machine.brew(preset=preset)))
+            
+        tanks = machine.installed_components[const.COMP_WATER]
+        self.assertAlmostEqual(machine.water_index.total, sum(tank.contents_volume for tank in tanks))
+        largest_draw = max(preset.volume for preset in (presets.Espresso, presets.Cappucino, presets.Americano))
+        self.assertLessEqual(max(tank.contents_volume for tank in tanks) - min(tank.contents_volume for tank in tanks), largest_draw)
+        
+        with self.assertRaises(RuntimeError): machine.brew(coffee_volume=machine.water_index.total + 1)
+        
+
+    def test_bean_depletion(self):
+        """Verifies brewing uses up the beans, drawing across the containers, and fails once they run out."""
+        class TwoBinCoffeemaker(generic.GenericCoffeemaker):
+            component_slots = dict(generic.GenericCoffeemaker.component_slots, **{const.COMP_BEANS: 2})
+            
+        machine = TwoBinCoffeemaker()
+        containers = machine.installed_components[const.COMP_BEANS]
+        for container in containers: container.contents = container.fill({machine.materials.CoffeeBeans: 150}, container=bean_supply.LotQueue())
+        
+        self.assertTrue(machine.brew(preset=presets.Espresso)) # 200 - more than either container holds
+        self.assertEqual(sum(container.stock for container in containers), 100)
+        with self.assertRaises(RuntimeError): machine.brew(preset=presets.Espresso)
+        
+        
+class BatchBrewingTest(unittest.TestCase):
+    """Tests whether batch brewing matches the one-cup-at-a-time API."""
+    def setUp(self):
+        self.machine = generic.GenericCoffeemaker()
+        
+    def test_batch_matches_single(self):
+        """Verifies a batch yields the same drinks as brewing the orders one by one."""
+        orders = [(presets.Espresso, None), (presets.Crema, None), (None, 50), (presets.Cappucino, 30)]
+        batch, failures = self.machine.brew_many(orders)
+        self.assertFalse(failures)
+        
+        single_machine = generic.GenericCoffeemaker()
+        singles = [single_machine.brew(preset=preset, coffee_volume=volume) for (preset, volume) in orders]
+        describe = lambda brewed: (brewed.display_name, brewed.volume, brewed.temperature, brewed.caffeine_content, brewed.extras)
+        self.assertEqual([describe(brewed) for brewed in batch], [describe(brewed) for brewed in singles])
+        
+        tanks = zip(self.machine.installed_components[const.COMP_WATER], single_machine.installed_components[const.COMP_WATER])
+        for batch_tank, single_tank in tanks: self.assertAlmostEqual(batch_tank.contents_volume, single_tank.contents_volume)
+        
+    def test_batch_failures(self):
+        """Verifies orders exceeding the available water fail individually, without affecting the rest of the batch."""
+        orders = [(presets.Americano, None)] * 3 + [(presets.Crema, None), (presets.Espresso, None), (presets.Americano, None)]
+        batch, failures = self.machine.brew_many(orders)
+        
+        self.assertEqual([failure.index for failure in failures], [3, 5])
+        for failure in failures: self.assertIsInstance(failure.error, RuntimeError)
+        self.assertEqual([brewed is None for brewed in batch], [False, False, False, True, False, True])
+        
+    def test_batch_power_required(self):
+        """Verifies power is required to use the machine in batch mode too."""
+        self.machine.powered = False
+        batch, failures = self.machine.brew_many([(None, None)])
+        self.assertEqual(batch, [None])
+        self.assertFalse(failures)
+        
+        
+class ConcurrentBrewingTest(unittest.TestCase):
+    """Tests brewing from many threads on a single shared machine."""
+    
+    def setUp(self):
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5) # switch threads often, to interleave the brews as much as possible
+        
+    def tearDown(self):
+        sys.setswitchinterval(self.switch_interval)
+        
+    def brew_concurrently(self, machine, threads=8, attempts=10, volume=30):
+        served, failed = [], []
+        def brew():
+            for _ in range(attempts):
+                try: served.append(machine.brew(coffee_volume=volume))
+                except RuntimeError as err: failed.append(err)
+        workers = [threading.Thread(target=brew) for _ in range(threads)]
+        for worker in workers: worker.start()
+        for worker in workers: worker.join()
+        return served, failed
+        
+    def test_no_overdraw(self):
+        """Verifies concurrent brews never overdraw the supplies - every cup either gets all it needs, or fails cleanly."""
+        class ReservoirCoffeemaker(generic.GenericCoffeemaker):
+            component_slots = dict(generic.GenericCoffeemaker.component_slots, **{const.COMP_WATER: 3, const.COMP_BEANS: 2, const.COMP_GROUNDSBIN: 2})
+            water_policy = 'balance_levels'
+            
+        for machine in (generic.GenericCoffeemaker(event_sink=NULL_SINK), ReservoirCoffeemaker(event_sink=NULL_SINK)):
+            tanks, containers = machine.installed_components[const.COMP_WATER], machine.installed_components[const.COMP_BEANS]
+            water, beans = sum(tank.contents_volume for tank in tanks), sum(container.stock for container in containers)
+            
+            served, failed = self.brew_concurrently(machine)
+            self.assertEqual(len(served) + len(failed), 80)
+            self.assertTrue(served and failed)
+            for err in failed: self.assertIsInstance(err, errors.SupplyExhausted)
+            
+            self.assertAlmostEqual(sum(tank.contents_volume for tank in tanks), water - 30 * len(served))
+            self.assertAlmostEqual(sum(container.stock for container in containers), beans - machine.default_amt * len(served))
+            bins, filters = machine.installed_components[const.COMP_GROUNDSBIN], machine.installed_components[const.COMP_FILTER]
+            self.assertAlmostEqual(sum(grounds_bin.grounds for grounds_bin in bins), machine.default_amt * len(served))
+            self.assertAlmostEqual(sum(water_filter.filtered for water_filter in filters), 30 * len(served))
+            self.assertFalse(any(component.reserved for component in tanks + containers + bins + filters))
+            if machine.water_policy: self.assertAlmostEqual(machine.water_index.total, sum(tank.contents_volume for tank in tanks))
+            
+    def test_rollback(self):
+        """Verifies a brew failing for lack of beans leaves the water untouched."""
+        machine = generic.GenericCoffeemaker(event_sink=NULL_SINK)
+        tank, container = machine.installed_components[const.COMP_WATER][0], machine.installed_components[const.COMP_BEANS][0]
+        container.contents = container.fill({machine.materials.CoffeeBeans: 50}, container=bean_supply.LotQueue())
+        
+        with self.assertRaises(errors.BeansExhausted): machine.brew()
+        self.assertEqual((tank.contents_volume, tank.available), (tank.capacity, tank.capacity))
+        self.assertEqual((container.stock, container.available), (50, 50))
+        
+    def test_rollback_async(self):
+        """Verifies an asynchronous brew failing for lack of beans leaves the water untouched too."""
+        machine = aio.AsyncGenericCoffeemaker(event_sink=NULL_SINK)
+        tank, container = machine.installed_components[const.COMP_WATER][0], machine.installed_components[const.COMP_BEANS][0]
+        container.contents = container.fill({machine.materials.CoffeeBeans: 50}, container=bean_supply.LotQueue())
+        
+        with self.assertRaises(errors.BeansExhausted): asyncio.run(machine.abrew())
+        self.assertEqual((tank.contents_volume, tank.available), (tank.capacity, tank.capacity))
+        self.assertEqual((container.stock, container.available), (50, 50))
+        
+    def test_cancel_async(self):
+        """Verifies an asynchronous brew timing out while a stage still draws in a worker thread hands nothing back twice."""
+        machine = aio.AsyncGenericCoffeemaker(event_sink=NULL_SINK)
+        tank = machine.installed_components[const.COMP_WATER][0]
+        drawing, drawn = threading.Event(), threading.Event()
+        def remove(*args, **kwargs):
+            drawing.set()
+            time.sleep(0.1) # still drawing when the order times out
+            try: return type(tank).remove(tank, *args, **kwargs)
+            finally: drawn.set()
+        tank.remove = remove
+        
+        with self.assertRaises(asyncio.TimeoutError): asyncio.run(machine.abrew(preset=presets.Americano, timeout=0.05))
+        self.assertTrue(drawing.is_set() and drawn.wait(1))
+        components = [comp for comptype in (const.COMP_WATER, const.COMP_BEANS, const.COMP_FILTER, const.COMP_GROUNDSBIN)
+                      for comp in machine.installed_components[comptype]]
+        self.assertFalse(any(component.reserved for component in components))
+        self.assertEqual(tank.available, tank.contents_volume)
+        
+    def test_maintenance_due(self):
+        """Verifies a full grounds bin or a spent filter stop the brews before they draw anything, until restocked."""
+        machine = generic.GenericCoffeemaker(event_sink=NULL_SINK)
+        tank, container = machine.installed_components[const.COMP_WATER][0], machine.installed_components[const.COMP_BEANS][0]
+        grounds_bin, water_filter = machine.installed_components[const.COMP_GROUNDSBIN][0], machine.installed_components[const.COMP_FILTER][0]
+        
+        grounds_bin.deposit(grounds_bin.capacity - 1)
+        with self.assertRaises(errors.GroundsBinFull): machine.brew()
+        self.assertEqual((tank.contents_volume, container.stock, water_filter.filtered), (tank.capacity, container.capacity, 0))
+        self.assertFalse(tank.reserved or container.reserved or water_filter.reserved)
+        
+        water_filter.filter(water_filter.capacity)
+        with self.assertRaises(errors.DescalingDue): machine.brew()
+        
+        self.assertEqual(machine.restock(), {const.COMP_WATER: 0, const.COMP_BEANS: 0, 
+                                             const.COMP_GROUNDSBIN: grounds_bin.capacity - 1, const.COMP_FILTER: water_filter.capacity})
+        self.assertTrue(machine.brew())
+        self.assertEqual(grounds_bin.grounds, machine.default_amt)
+        
+        
+class BrewPlanTest(unittest.TestCase):
+    """Tests the compiled, cached brew plans."""
+    
+    def setUp(self):
+        self.machine = generic.GenericCoffeemaker()
+        
+    def test_plan_cached(self):
+        plan = self.machine.plan(presets.Cappucino)
+        self.assertIs(generic.GenericCoffeemaker().plan(presets.Cappucino), plan) # shared by the machine class
+        self.assertEqual(plan.dose, self.machine.strength2amt[presets.Cappucino.strength])
+        self.assertEqual([extra for (extra, _) in zip(presets.Cappucino.extras, plan.handlers)], list(presets.Cappucino.extras))
+        
+        # The handlers are bound to the brewing machine, not to whichever one registered them:
+        brew = self.machine.brew(preset=presets.Cappucino)
+        self.assertEqual(brew.volume, presets.Cappucino.volume + 70)
+        
+    def test_plan_invalidated(self):
+        plan = self.machine.plan(presets.Espresso)
+        
+        class PatchedEspresso(presets.Espresso): pass
+        PatchedEspresso.volume = 10
+        self.assertIsNot(self.machine.plan(presets.Espresso), plan)
+        self.assertEqual(self.machine.plan(PatchedEspresso).volume, 10)
+        
+        plan = self.machine.plan(presets.Crema)
+        self.machine.extra_handlers['sprinkles'] = lambda brew: brew
+        try: self.assertIsNot(self.machine.plan(presets.Crema), plan)
+        finally: del self.machine.extra_handlers['sprinkles']
+        
+    def test_unsupported_extras_reported_once(self):
+        class Affogato(presets.Espresso): 
+            extras = ('ice cream',)
+        
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            for _ in range(3): self.assertTrue(self.machine.brew(preset=Affogato))
+        self.assertEqual(output.getvalue().count("'ice cream' extra not supported"), 1)
+        
+        
 def main(): return unittest.main()
         
 if __name__ == '__main__': main()
\ No newline at end of file
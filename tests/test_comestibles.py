@@ -0,0 +1,124 @@
+"""Tests to verify the behavior of the drinks and raw materials."""
+
+import unittest 
+
+from CoffeeSim import comestibles, compact_comestibles, extraction
+
+from CoffeeSim.components import grinders
+
+from CoffeeSim.helpers import NULL_SINK
+
+from CoffeeSim.models import generic
+
+from CoffeeSim.presets import generic as presets
+
+
+class DescriptorTest(unittest.TestCase):
+    """Tests the indexed and memoized state descriptors."""
+    
+    @staticmethod
+    def linear_describe(thresholds, default, value):
+        desc = default
+        for threshold, threshold_desc in thresholds:
+            if value > threshold: desc = threshold_desc
+        return desc
+    
+    def test_index_matches_linear_scan(self):
+        unsorted_thresholds = [(0, 'a'), (12.5, 'b'), (40, 'c'), (37.5, 'd'), (40, 'e'), (100, 'f')]
+        index = comestibles.ThresholdIndex(unsorted_thresholds, default='none')
+        for value in [-1, 0, 0.5, 12.5, 20, 37.5, 38, 40, 41, 100, 101]:
+            self.assertEqual(index.describe(value), self.linear_describe(unsorted_thresholds, 'none', value))
+            
+    def test_descriptors_follow_state(self):
+        coffee = comestibles.Coffee(volume=50, temperature=80, caffeine_content=100, name_override='Espresso')
+        self.assertEqual(str(coffee), "hot, medium-strength Espresso (50mL)")
+        
+        coffee.temperature = 22
+        coffee.caffeine_content = 200
+        coffee.add_extra('crema')
+        coffee.volume = 40
+        self.assertEqual(str(coffee), "lukewarm, strong Espresso (40mL) with crema")
+        self.assertEqual(coffee.description, "lukewarm strong ")
+        
+        
+class CompactComestiblesTest(unittest.TestCase):
+    """Tests whether the compact comestibles are a drop-in replacement for the regular ones."""
+    
+    def test_same_representation(self):
+        for temperature in (1, 10, 22, 30, 50, 80, 100):
+            for caffeine in (0, 10, 100, 200):
+                regular = comestibles.Coffee(volume=50, temperature=temperature, caffeine_content=caffeine, name_override='Espresso')
+                compact = compact_comestibles.Coffee(volume=50, temperature=temperature, caffeine_content=caffeine, name_override='Espresso')
+                for brew in (regular, compact): brew.add_extra('crema')
+                
+                self.assertEqual(str(compact), str(regular))
+                self.assertEqual(compact.description, regular.description)
+                
+        for (regular, compact) in ((comestibles.Water(temperature=50), compact_comestibles.Water(temperature=50)),
+                                   (comestibles.CoffeeGrounds(amount=3), compact_comestibles.CoffeeGrounds(amount=3))):
+            self.assertEqual(str(compact), str(regular))
+            
+    def test_compact_layout(self):
+        first, second = (compact_comestibles.Coffee(temperature=80, caffeine_content=100) for _ in range(2))
+        for brew in (first, second): brew.add_extra('crema')
+        
+        self.assertFalse(hasattr(first, '__dict__'))
+        self.assertIs(first.extras, second.extras)
+        self.assertIs(first.descriptors, second.descriptors)
+        
+        grind_result = compact_comestibles.CoffeeBeans(amount=10).grind(amount=4)
+        self.assertIsInstance(grind_result[compact_comestibles.const.MAT_GROUNDS], compact_comestibles.CoffeeGrounds)
+        self.assertEqual(grind_result[compact_comestibles.const.MAT_BEANS].amount, 6)
+        
+    def test_compact_coffeemaker(self):
+        class CompactCoffeemaker(generic.GenericCoffeemaker):
+            materials = compact_comestibles
+            
+        regular, compact = generic.GenericCoffeemaker(), CompactCoffeemaker()
+        for preset in (presets.Crema, presets.Cappucino, presets.Espresso):
+            compact_brew = compact.brew(preset=preset)
+            self.assertIsInstance(compact_brew, compact_comestibles.Coffee)
+            self.assertEqual(str(compact_brew), str(regular.brew(preset=preset)))
+        
+        
+class ExtractionTest(unittest.TestCase):
+
+    def test_kinetics(self):
+        medium = extraction.particle_sizes('medium')
+        self.assertAlmostEqual(sum(medium.fractions), 1)
+        self.assertAlmostEqual(medium.median, extraction.GRIND_SIZES['medium'], delta=60)
+        
+        reference = extraction.extraction_yield(medium, 80, pressure='medium', contact_time=45)
+        self.assertAlmostEqual(reference, 0.9, delta=0.02)
+        self.assertLess(extraction.extraction_yield(extraction.particle_sizes('coarse'), 80), reference)
+        self.assertLess(extraction.extraction_yield(medium, 60), reference)
+        self.assertLess(extraction.extraction_yield(medium, 80, pressure='medium', contact_time=20), reference)
+        self.assertLess(extraction.extraction_yield(medium, 80, pressure='low'), reference)
+        
+        # finer particles extract faster; the per-bin yields are cached for repeated conditions:
+        yields = extraction.bin_yields(medium, 80)
+        self.assertEqual(list(yields), sorted(yields, reverse=True))
+        self.assertIs(extraction.bin_yields(medium, 80), yields)
+        self.assertIs(extraction.particle_sizes(extraction.GRIND_SIZES['medium']), medium)
+        
+    def test_grinder_settings(self):
+        for materials in (comestibles, compact_comestibles):
+            grinder = grinders.Grinder()
+            grinder.event_sink = NULL_SINK
+            beans = materials.CoffeeBeans(amount=200)
+            grinder.grind_size = 'fine'
+            fine = grinder.grind(items={beans: 100})[beans][comestibles.const.MAT_GROUNDS]
+            grinder.grind_size = 'coarse'
+            coarse = grinder.grind(items={beans: 100})[beans][comestibles.const.MAT_GROUNDS]
+            self.assertIs(fine.particle_sizes, extraction.particle_sizes('fine'))
+            
+            self.assertGreater(fine.extract(temperature=80), coarse.extract(temperature=80))
+            # without the brewing conditions, or for whole beans, the fixed efficiencies apply:
+            remaining = fine.amount * fine.caffeine_density
+            self.assertAlmostEqual(fine.extract(), 0.9 * remaining)
+            self.assertAlmostEqual(materials.CoffeeBeans(amount=100).extract(temperature=80), 10)
+            
+        
+def main(): return unittest.main()
+        
+if __name__ == '__main__': main()
@@ -1,11 +1,14 @@
 """Tests to verify performance of the machine parts."""
 
+import datetime
 import unittest 
 
-from CoffeeSim.components import water_supply, bean_supply, grinders, heaters, interfaces
+from CoffeeSim.components import water_supply, bean_supply, grinders, heaters, filters, grounds_bins, interfaces, reservations
 
 from CoffeeSim import comestibles
 
+from CoffeeSim.helpers import NULL_SINK
+
 def handle_IO(*args): print(", ".join(map(str, args)))
 
 
@@ -33,13 +36,216 @@ class WaterSupplyTest(unittest.TestCase):
         with self.assertRaises(RuntimeWarning): tank.fill(contents_to_use)
         print("\nFilled tank behavior as expected...")
     
+class CompactWaterSupplyTest(unittest.TestCase):
+
+    def test_empty_compact_watertank(self):
+        empty_tank = water_supply.CompactTank(contents=None)
+        
+        self.assertFalse(empty_tank.contents)
+        self.assertEqual(empty_tank.contents_volume, 0)
+        with self.assertRaises(RuntimeWarning): empty_tank.remove(10)
+        
+    def test_proportional_draw(self):
+        tank = water_supply.CompactTank(contents={comestibles.Water: 300, comestibles.Liquid: 100})
+        self.assertEqual(tank.contents_volume, 400)
+        self.assertEqual(len(tank.contents), 2)
+        
+        tank.contents, removed = tank.remove(remove_volume=200)
+        removed = {type(liquid): liquid.volume for liquid in removed}
+        self.assertAlmostEqual(removed[comestibles.Water], 150)
+        self.assertAlmostEqual(removed[comestibles.Liquid], 50)
+        self.assertAlmostEqual(tank.contents_volume, 200)
+        
+        # Same-type contents get mixed into a single entry:
+        tank.fill({comestibles.Water: 100}, temperature=comestibles.const.ROOMTEMP + 30)
+        waters = [liquid for liquid in tank.contents if isinstance(liquid, comestibles.Water)]
+        self.assertEqual(len(waters), 1)
+        self.assertAlmostEqual(waters[0].volume, 250)
+        self.assertAlmostEqual(waters[0].temperature, comestibles.const.ROOMTEMP + 12)
+        
+        with self.assertRaises(RuntimeWarning): tank.fill({comestibles.Water: 500})
+        with self.assertRaises(RuntimeWarning): tank.remove(1000)
+        
+        tank.contents, removed = tank.remove(remove_volume=tank.contents_volume)
+        self.assertFalse(tank.contents)
+        self.assertAlmostEqual(sum(liquid.volume for liquid in removed), 300)
+    
+    
+class WaterSourceIndexTest(unittest.TestCase):
+    
+    def make_tanks(self, *volumes):
+        return [water_supply.Tank(contents={comestibles.Water: vol} if vol else None) for vol in volumes]
+        
+    def test_incremental_levels(self):
+        tanks = self.make_tanks(100, 300, 0)
+        index = water_supply.WaterSourceIndex(sources=tanks)
+        self.assertEqual(index.total, 400)
+        self.assertEqual(dict(index), {tanks[0]: 100, tanks[1]: 300, tanks[2]: 0})
+        
+        tanks[1].contents, _ = tanks[1].remove(remove_volume=50)
+        tanks[2].fill({comestibles.Water: 20})
+        tanks[0].remove(remove_volume=10) # drains the tank contents in place
+        self.assertEqual(index.total, 360)
+        self.assertEqual(index[tanks[2]], 20)
+        self.assertEqual(index[tanks[0]], 90)
+        
+        index.discard(tanks[1])
+        self.assertEqual(index.total, 110)
+        self.assertIsNone(tanks[1].index)
+        
+    def test_policies(self):
+        tanks = self.make_tanks(100, 300, 200)
+        
+        drain_smallest = water_supply.WaterSourceIndex(sources=tanks).allocate(250)
+        self.assertEqual(drain_smallest, {tanks[0]: 100, tanks[2]: 150})
+        
+        balanced = water_supply.WaterSourceIndex(sources=tanks, policy='balance_levels').allocate(250)
+        self.assertEqual(balanced, {tanks[1]: 250})
+        
+        big_tank = water_supply.Tank(contents={comestibles.Water: 150})
+        big_tank.capacity = 1000
+        nearest_to_empty = water_supply.WaterSourceIndex(sources=[tanks[0], big_tank], policy='nearest_to_empty').allocate(120)
+        self.assertEqual(nearest_to_empty, {big_tank: 120})
+        
+        # Allocating does not draw, so the sources stay available:
+        index = water_supply.WaterSourceIndex(sources=tanks)
+        self.assertEqual(index.allocate(50), index.allocate(50))
+    
     
 class BeanSupplyTest(unittest.TestCase):
 
     def test_container(self):
         container = bean_supply.Container()
+        self.assertEqual(container.stock, 0)
+        with self.assertRaises(RuntimeWarning): container.draw(10)
+        
+        container = bean_supply.Container(contents={comestibles.CoffeeBeans: 500})
+        self.assertEqual(container.stock, 500)
+        with self.assertRaises(RuntimeWarning): container.fill({comestibles.CoffeeBeans: container.capacity})
+        
+        beans = container.draw(200)
+        self.assertIsInstance(beans, comestibles.CoffeeBeans)
+        self.assertEqual(beans.amount, 200)
+        self.assertEqual(container.stock, 300)
+        
+    def test_lot_order(self):
+        today = datetime.date.today()
+        lots = [
+            bean_supply.BeanLot(amount=100, caffeine_density=1, roast_date=today - datetime.timedelta(days=5)),
+            bean_supply.BeanLot(amount=100, caffeine_density=3, roast_date=today - datetime.timedelta(days=20)),
+            bean_supply.BeanLot(amount=100, caffeine_density=5, roast_date=today, expires=today + datetime.timedelta(days=2)),
+        ]
+        fifo, fefo = bean_supply.Container(), bean_supply.Container(consumption='fefo')
+        for container in (fifo, fefo): container.fill_lots(bean_supply.BeanLot(amount=lot.amount, caffeine_density=lot.caffeine_density, 
+                                                                                roast_date=lot.roast_date, expires=lot.expires) 
+                                                           for lot in lots)
+        
+        # A draw spanning two lots mixes their caffeine densities:
+        self.assertAlmostEqual(fifo.draw(150).caffeine_density, (100 * 1 + 50 * 3) / 150.0)
+        self.assertEqual([lot.amount for lot in fifo.contents], [50, 100])
+        
+        self.assertAlmostEqual(fefo.draw(150).caffeine_density, (100 * 5 + 50 * 3) / 150.0)
+        self.assertEqual([lot.caffeine_density for lot in fefo.contents], [3, 1])
+        
+        expired = fefo.contents.discard_expired(on=today + datetime.timedelta(days=12))
+        self.assertEqual([lot.caffeine_density for lot in expired], [3])
+        self.assertEqual(fefo.stock, 100)
+        
+    def test_lots_without_expiry(self):
+        """Verifies lots added straight to a queue, without an expiry date, go last in FEFO order and never expire."""
+        today = datetime.date.today()
+        for order in bean_supply.LotQueue.orders:
+            lots = bean_supply.LotQueue(order=order)
+            lots.add(bean_supply.BeanLot(amount=100, caffeine_density=1))
+            lots.add(bean_supply.BeanLot(amount=100, caffeine_density=3, expires=today))
+            lots.add(bean_supply.BeanLot(amount=100, caffeine_density=5))
+            self.assertEqual([lot.caffeine_density for lot in lots], [3, 1, 5] if order == 'fefo' else [1, 3, 5])
+            
+            self.assertEqual([lot.caffeine_density for lot in lots.discard_expired(on=today + datetime.timedelta(days=1))], [3])
+            self.assertEqual(lots.stock, 200)
+            
+    def test_empty_draw(self):
+        class DecafBeans(comestibles.CoffeeBeans): pass
+        class DecafContainer(bean_supply.Container): bean_type = DecafBeans
+        self.assertIsInstance(DecafContainer().draw(0), DecafBeans)
+        
+        container = bean_supply.Container()
+        container.contents = container.fill({DecafBeans: 100}, container=bean_supply.LotQueue())
+        self.assertIsInstance(container.draw(0), DecafBeans)
     
     
+class ReservationTest(unittest.TestCase):
+
+    def test_reserve_commit_cancel(self):
+        tank = water_supply.Tank(contents={comestibles.Water: 300})
+        tank.event_sink = NULL_SINK
+        index = water_supply.WaterSourceIndex(sources=[tank])
+        
+        self.assertEqual(tank.reserve(200), 200)
+        self.assertEqual(tank.reserve(200), 0) # all or nothing
+        self.assertEqual(tank.reserve(200, partial=True), 100)
+        self.assertEqual((tank.available, tank.contents_volume, index.total), (0, 300, 0))
+        
+        drawn = tank.commit(200)
+        self.assertEqual(sum(liquid.volume for liquid in drawn), 200)
+        tank.cancel(100)
+        self.assertEqual((tank.available, tank.contents_volume, index.total), (100, 100, 100))
+        
+    def test_reservation(self):
+        tanks = [water_supply.Tank(contents={comestibles.Water: 100}) for _ in range(2)]
+        container = bean_supply.Container(contents={comestibles.CoffeeBeans: 500})
+        for tank in tanks: tank.event_sink = NULL_SINK
+        
+        with reservations.Reservation() as reservation:
+            for tank in tanks: reservation.add('water', tank, tank.reserve(80))
+            reservation.add('beans', container, container.reserve(200))
+            self.assertEqual((reservation.amount('water'), reservation.amount('beans')), (160, 200))
+            
+            drawn = reservation.commit('water', amount=100) # in the order reserved
+            self.assertEqual([sum(liquid.volume for liquid in transferred) for transferred in drawn], [80, 20])
+            self.assertEqual([tank.contents_volume for tank in tanks], [20, 80])
+            self.assertEqual(reservation.commit('beans', amount=50)[0].amount, 50)
+            
+        # the rest is handed back on leaving the block:
+        self.assertFalse(reservation)
+        self.assertEqual([tank.available for tank in tanks], [20, 80])
+        self.assertEqual((container.available, container.stock), (450, 450))
+        
+        
+class MaintenanceTest(unittest.TestCase):
+
+    def test_grounds_bin(self):
+        grounds_bin = grounds_bins.GroundsBin()
+        grounds_bin.event_sink = NULL_SINK
+        self.assertEqual(grounds_bin.reserve(grounds_bin.capacity - 100), grounds_bin.capacity - 100)
+        self.assertEqual(grounds_bin.available, 100)
+        grounds_bin.commit(grounds_bin.capacity - 100)
+        with self.assertRaises(RuntimeWarning): grounds_bin.deposit(101)
+        
+        self.assertEqual(grounds_bin.service(below=0.01), 0) # has more room than that
+        self.assertEqual(grounds_bin.service(), grounds_bin.capacity - 100)
+        self.assertEqual((grounds_bin.grounds, grounds_bin.available), (0, grounds_bin.capacity))
+        
+    def test_filter(self):
+        water_filter = filters.Filter(filtered=40000)
+        water_filter.event_sink = NULL_SINK
+        self.assertEqual(water_filter.reserve(20000), 0)
+        self.assertEqual(water_filter.filter(10000), 10000)
+        with self.assertRaises(RuntimeWarning): water_filter.filter(1)
+        self.assertEqual(water_filter.descale(), water_filter.capacity)
+        self.assertEqual(water_filter.service(), 0)
+        
+    def test_refills(self):
+        tank = water_supply.Tank(contents={comestibles.Water: 300})
+        container = bean_supply.Container(contents={comestibles.CoffeeBeans: 2000})
+        tank.event_sink = NULL_SINK
+        self.assertEqual(tank.service(below=0.5, material=comestibles.Water), 0)
+        self.assertEqual(tank.service(material=comestibles.Water), tank.capacity - 300)
+        self.assertEqual(tank.contents_volume, tank.capacity)
+        self.assertEqual(container.service(material=comestibles.CoffeeBeans), container.capacity - 2000)
+        self.assertEqual(container.service(material=comestibles.CoffeeBeans), 0)
+        
+        
 class GrinderTest(unittest.TestCase):
 
     def test_base_grinder(self):
@@ -57,6 +263,34 @@ class HeaterTest(unittest.TestCase):
         self.assertFalse(empty_run)
         print("\nHeater behavior as expected...")
         
+    def test_thermal_model(self):
+        heater = heaters.Heater()
+        heater.event_sink = NULL_SINK
+        cups = [comestibles.Water(volume=100), comestibles.Water(volume=200, temperature=50), comestibles.Water(volume=100, temperature=90)]
+        
+        # without losses, heating takes exactly the energy the liquid absorbs:
+        heater.loss_coefficient = 0
+        lossless = list(heater.heating_times([100], [25], 80))
+        self.assertAlmostEqual(lossless[0], 100 * heaters.const.WATER_HEAT_CAPACITY * 55 / heater.power)
+        
+        # with losses, it takes longer; the more so the hotter the target:
+        heater.loss_coefficient = 5
+        lossy = list(heater.heating_times([100, 100], [25, 25], 80))
+        self.assertGreater(lossy[0], lossless[0])
+        self.assertLess(heater.heating_times([100], [25], 40)[0] / 15, lossy[0] / 55)
+        with self.assertRaises(RuntimeWarning): heater.heating_times([100], [25], heater.max_temp + 1)
+        
+        duration = heater.heat_duration(items=cups, target_temp=80)
+        result = heater.heat_batch(items=cups, target_temp=80)
+        self.assertAlmostEqual(result.duration, duration)
+        self.assertAlmostEqual(result.energy, duration * heater.power)
+        self.assertEqual(list(result.durations)[2], 0)
+        self.assertAlmostEqual(sum(result.energies), result.energy)
+        self.assertEqual([result.heated[cup].temperature for cup in cups], [80, 80, 90])
+        
+        # already heated, so no more time needed:
+        self.assertEqual(heater.heat_duration(items=cups[:2], target_temp=80), 0)
+        
         
         
 def main(): return unittest.main()
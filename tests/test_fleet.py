@@ -0,0 +1,37 @@
+"""Tests to verify the multi-process fleet simulation."""
+
+import unittest 
+
+from CoffeeSim import fleet
+
+
+class FleetTest(unittest.TestCase):
+
+    def test_reproducible(self):
+        """Verifies a fleet run with plenty of stock is reproducible for a given seed."""
+        runs = [fleet.run_fleet(machines=4, orders=5, processes=2, seed=7) for _ in range(2)]
+        self.assertEqual(len(runs[0]), 20)
+        self.assertEqual(runs[0], runs[1])
+        self.assertFalse([record for record in runs[0] if record.error])
+        
+        reseeded = fleet.run_fleet(machines=4, orders=5, processes=2, seed=8)
+        self.assertNotEqual([record.drink for record in runs[0]], [record.drink for record in reseeded])
+        
+    def test_shared_stock(self):
+        """Verifies machines sharing a site cannot overdraw its stock."""
+        site = fleet.Site(water=1000, beans=100000)
+        records = fleet.run_fleet(machines=3, orders=20, sites=[site], processes=3)
+        
+        served = [record for record in records if not record.error]
+        self.assertTrue(served)
+        self.assertLess(len(served), len(records))
+        self.assertGreaterEqual(site.water.level, 0)
+        
+        # every served cup drew its volume from the water line, except for the milk foam on the Cappucinos:
+        foam = sum(70 for record in served if record.drink == fleet.const.BREWTYPE_CAPPUCINO)
+        self.assertAlmostEqual(sum(record.volume for record in served) - foam, 1000 - site.water.level)
+
+
+def main(): return unittest.main()
+        
+if __name__ == '__main__': main()
@@ -0,0 +1,50 @@
+"""Tests to verify the shared utilities."""
+
+import io
+import unittest 
+
+try: from contextlib import redirect_stdout
+except ImportError: redirect_stdout = None # Python 2
+
+from CoffeeSim import helpers
+
+from CoffeeSim.models import generic
+
+from CoffeeSim.presets import generic as presets
+
+
+class EventSinkTest(unittest.TestCase):
+
+    def test_structured_sink(self):
+        sink = helpers.StructuredSink(clock=lambda: 42)
+        machine = generic.GenericCoffeemaker(event_sink=sink)
+        machine.brew(preset=presets.Espresso)
+        
+        self.assertEqual([record.component for record in sink.records], ['Tank', 'Grinder', 'Heater'])
+        self.assertEqual(sink.records[0], helpers.EventRecord('Tank', "GLUG-GLUG-GLUG...", 42))
+        
+    def test_ring_buffer_sink(self):
+        sink = helpers.RingBufferSink(maxlen=2)
+        machine = generic.GenericCoffeemaker(event_sink=sink)
+        machine.brew()
+        self.assertEqual([record.component for record in sink.records], ['Grinder', 'Heater'])
+        
+    @unittest.skipIf(redirect_stdout is None, "requires contextlib.redirect_stdout")
+    def test_null_sink(self):
+        output = io.StringIO()
+        with redirect_stdout(output): generic.GenericCoffeemaker(event_sink=helpers.NULL_SINK).brew(preset=presets.Cappucino)
+        self.assertEqual(output.getvalue(), "")
+        
+    def test_batched_writer_sink(self):
+        output = io.StringIO()
+        sink = helpers.BatchedWriterSink(stream=output, batch_size=2)
+        machine = generic.GenericCoffeemaker(event_sink=sink)
+        for _ in range(3): machine.brew(preset=presets.Espresso)
+        
+        sink.flush()
+        self.assertEqual(output.getvalue().splitlines(), ["GLUG-GLUG-GLUG...", "WHIRRRRRRRR!", "Hissssssss..."] * 3)
+        
+        
+def main(): return unittest.main()
+        
+if __name__ == '__main__': main()
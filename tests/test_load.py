@@ -0,0 +1,57 @@
+"""Tests to verify the load testing of coffeemakers."""
+
+import random
+import unittest 
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim import errors, load
+
+from CoffeeSim.presets import generic as presets
+
+
+class LoadTest(unittest.TestCase):
+
+    def test_arrivals(self):
+        constant = list(load.arrival_times('constant', rate=60, orders=4))
+        self.assertEqual(constant, [0, 60, 120, 180])
+        
+        bursty = list(load.arrival_times('bursty', rate=60, orders=7, burst=3, rng=random.Random(1)))
+        self.assertEqual(len(bursty), 7)
+        self.assertEqual(len(set(bursty)), 3)
+        self.assertEqual(bursty, sorted(bursty))
+        
+        poisson = list(load.arrival_times('poisson', rate=60, duration=3600, rng=random.Random(1)))
+        self.assertTrue(poisson and poisson[-1] <= 3600)
+        with self.assertRaises(ValueError): next(load.arrival_times('poisson'))
+        
+    def test_mix(self):
+        self.assertEqual(load.parse_mix("espresso=3, Americano"), [(presets.Espresso, 3), (presets.Americano, 1)])
+        self.assertEqual(len(load.parse_mix()), len(presets.STANDARD_PRESETS))
+        with self.assertRaises(ValueError): load.parse_mix("mocha=1")
+        
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(load.percentile(values, 0.5), 50)
+        self.assertEqual(load.percentile(values, 0.99), 99)
+        self.assertIsNone(load.percentile([], 0.5))
+        
+    def test_report(self):
+        report = load.run_load(orders=200, arrivals='bursty', rate=120, workers=2, seed=3)
+        self.assertEqual((report['orders'], report['completed'], report['failed']), (200, 200, 0))
+        self.assertTrue(report['restocks'])
+        self.assertTrue(report['wait']['p50'] <= report['wait']['p95'] <= report['wait']['p99'])
+        self.assertEqual(len(report['utilization']), 2)
+        self.assertEqual(report, load.run_load(orders=200, arrivals='bursty', rate=120, workers=2, seed=3))
+        self.assertIn("Throughput", load.format_report(report))
+        
+        serviced = load.run_load(orders=200, arrivals='bursty', rate=120, workers=2, seed=3, maintenance='predictive')
+        self.assertEqual((serviced['completed'], serviced['restocks']), (200, 0))
+        self.assertTrue(serviced['maintenance_stops'] and serviced['downtime'] and serviced['services'])
+        self.assertLess(serviced['cups_per_hour'], report['cups_per_hour']) # pays for the servicing in downtime
+        self.assertIn("Maintenance", load.format_report(serviced))
+        
+        starved = load.run_load(orders=200, mix="americano", restock=False, seed=3)
+        self.assertTrue(starved['failed'])
+        self.assertEqual(starved['failures'], {errors.WaterExhausted.cause: starved['failed']})
@@ -0,0 +1,89 @@
+"""Tests to verify the maintenance of coffeemakers in simulated time."""
+
+import unittest
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim import errors, maintenance, simulation
+
+from CoffeeSim.models import generic
+
+from CoffeeSim.helpers import NULL_SINK
+
+from CoffeeSim.presets import generic as presets
+
+
+class MaintenanceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.machine = generic.GenericCoffeemaker(event_sink=NULL_SINK)
+
+    def test_helpers(self):
+        needs = maintenance.order_needs(self.machine, presets.Americano)
+        self.assertEqual(needs[const.COMP_WATER], presets.Americano.volume)
+        self.assertEqual(needs[const.COMP_GROUNDSBIN], self.machine.strength2amt[presets.Americano.strength])
+
+        self.assertEqual(maintenance.levels(self.machine), maintenance.capacities(self.machine))
+        self.assertEqual(set(maintenance.levels(self.machine)), set(maintenance.SERVICEABLE))
+        self.assertEqual(maintenance.fixed_by(errors.GroundsBinFull()), const.COMP_GROUNDSBIN)
+        self.assertIsNone(maintenance.fixed_by(errors.NoHeater()))
+
+        self.assertIsInstance(maintenance.make_policy('predictive'), maintenance.PredictiveMaintenance)
+        self.assertIsNone(maintenance.make_policy(None))
+        with self.assertRaises(ValueError): maintenance.make_policy('preventive')
+
+    def test_service(self):
+        self.machine.brew(preset=presets.Americano)
+        record = self.machine.service(const.COMP_WATER)
+        self.assertEqual(record, maintenance.ServiceRecord(const.COMP_WATER, presets.Americano.volume,
+                                                           self.machine.installed_components[const.COMP_WATER][0].service_time))
+        self.assertEqual(self.machine.service(const.COMP_WATER).amount, 0)
+        self.assertEqual(self.machine.service(const.COMP_GROUNDSBIN, below=0.5).amount, 0)
+
+    def test_reactive(self):
+        orders = [(presets.Americano, None)] * 10
+        starved = simulation.serve(generic.GenericCoffeemaker(event_sink=NULL_SINK), orders)
+        self.assertTrue(all(isinstance(order.error, errors.WaterExhausted) for order in starved.failed))
+
+        station = simulation.serve(self.machine, orders, maintenance='reactive')
+        self.assertEqual((len(station.completed), len(station.failed)), (10, 0))
+        self.assertTrue(station.stops)
+        self.assertEqual({record.comptype for (_, record) in station.services}, {const.COMP_WATER})
+        self.assertAlmostEqual(station.downtime, sum(station.maintenance_stop_time + record.duration for (_, record) in station.services))
+        # the orders the tank ran dry on waited out the refills mid-brew:
+        self.assertGreater(max(order.brew_time for order in station.completed), min(order.brew_time for order in station.completed))
+
+    def test_predictive(self):
+        orders = [(presets.Americano, None)] * 10
+        station = simulation.serve(self.machine, orders, maintenance='predictive')
+        self.assertEqual((len(station.completed), len(station.failed)), (10, 0))
+        # serviced before starting the orders, never in the middle of one:
+        self.assertAlmostEqual(max(order.brew_time for order in station.completed), min(order.brew_time for order in station.completed))
+
+        # with lulls between the orders, the servicing fits into them:
+        reactive = simulation.serve(generic.GenericCoffeemaker(event_sink=NULL_SINK), orders, interval=600, maintenance='reactive')
+        predictive = simulation.serve(generic.GenericCoffeemaker(event_sink=NULL_SINK), orders, interval=600, maintenance='predictive')
+        self.assertTrue(reactive.stops and predictive.stops)
+        self.assertFalse(any(order.wait_time for order in predictive.completed))
+        self.assertLess(sum(order.brew_time for order in predictive.completed), sum(order.brew_time for order in reactive.completed))
+
+    def test_maintenance_due(self):
+        """Verifies the grounds bin and the filter get serviced too, once they fill up or wear out."""
+        grounds_bin = self.machine.installed_components[const.COMP_GROUNDSBIN][0]
+        water_filter = self.machine.installed_components[const.COMP_FILTER][0]
+        grounds_bin.deposit(grounds_bin.capacity - 1)
+        water_filter.filter(water_filter.capacity - 1)
+
+        for policy in ('reactive', 'predictive'):
+            station = simulation.serve(self.machine, [(presets.Espresso, None)], maintenance=policy)
+            self.assertEqual(len(station.completed), 1)
+            self.assertEqual({record.comptype for (_, record) in station.services} & {const.COMP_GROUNDSBIN, const.COMP_FILTER},
+                             {const.COMP_GROUNDSBIN, const.COMP_FILTER})
+            grounds_bin.deposit(grounds_bin.available - 1)
+            water_filter.filter(water_filter.available - 1)
+
+
+def main(): return unittest.main()
+
+if __name__ == '__main__': main()
@@ -0,0 +1,89 @@
+"""Tests to verify the allocation and memory profiling of coffeemakers."""
+
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim import memprofile
+
+from CoffeeSim.helpers import NULL_SINK
+
+from CoffeeSim.models import generic
+
+from CoffeeSim.presets import generic as presets
+
+
+class AllocationProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.machine = generic.GenericCoffeemaker(event_sink=NULL_SINK)
+
+    def test_profile(self):
+        workload = memprofile.BrewWorkload(coffeemaker=self.machine, presets=[presets.Espresso, presets.Americano], brews=20)
+        profiler = memprofile.profile(workload, rounds=2)
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertNotIn('brew', vars(self.machine)) # uninstrumented again
+        self.assertEqual(workload.brewed, 60)
+
+        report = profiler.report(limit=5)
+        self.assertEqual([label for (label, _) in report['memory']], ['start', 0, 1, 2])
+        self.assertEqual(report['growth_bytes'], report['memory'][-1][1] - report['memory'][1][1])
+        json.dumps(report)
+
+        stages = report['machines']['GenericCoffeemaker']['stages']
+        components = report['machines']['GenericCoffeemaker']['components']
+        self.assertGreaterEqual(stages['brew']['calls'], 60)
+        self.assertEqual(stages['get_water']['calls'], 60)
+        self.assertEqual(components['{}[0].remove'.format(const.COMP_WATER)]['calls'], 60)
+        self.assertEqual(components['{}[0].deposit'.format(const.COMP_GROUNDSBIN)]['calls'], 60)
+        if stages['brew']['peak'] is not None: # stages include the components they use:
+            self.assertGreaterEqual(stages['brew']['peak'], stages['get_water']['peak'])
+            self.assertGreaterEqual(stages['get_water']['peak'], components['{}[0].remove'.format(const.COMP_WATER)]['peak'])
+
+        self.assertTrue(report['top_sites'])
+        self.assertLessEqual(len(report['top_sites']), 5)
+        self.assertTrue(memprofile.format_report(report).startswith("Memory traced: start: "))
+
+    def test_batches(self):
+        workload = memprofile.BrewWorkload(coffeemaker=self.machine, brews=40, batch=16)
+        report = memprofile.profile(workload, rounds=1, warmup=0).report()
+        stages = report['machines']['GenericCoffeemaker']['stages']
+        self.assertGreaterEqual(stages['brew_many']['calls'], 3)
+        self.assertNotIn('brew', stages)
+
+    def test_soak(self):
+        workload = memprofile.BrewWorkload(coffeemaker=self.machine, brews=20)
+        report = memprofile.soak(workload, rounds=3, warmup=1, max_growth=64 << 10)
+        self.assertLessEqual(report['growth_bytes'], 64 << 10)
+
+        leaked = []
+        def leaky():
+            workload()
+            leaked.append(bytearray(16 << 10))
+
+        with self.assertRaises(memprofile.MemoryGrowthError) as raised:
+            memprofile.soak(leaky, rounds=3, warmup=1, max_growth=32 << 10, machines=[self.machine])
+        self.assertGreaterEqual(raised.exception.report['growth_bytes'], 48 << 10)
+        self.assertTrue(any('test_memprofile.py' in site['site'] for site in raised.exception.report['growth']))
+
+    def test_CLI(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'memory.json')
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            self.assertEqual(memprofile.main(['-n', '10', '-r', '2', '-P', 'espresso', '--soak', '--json', path]), 0)
+        self.assertIn("Stages (GenericCoffeemaker):", output.getvalue())
+        with open(path) as report_file: self.assertEqual(len(json.load(report_file)['memory']), 4)
+
+
+def main(): return unittest.main()
+
+if __name__ == '__main__': main()
@@ -0,0 +1,87 @@
+"""Tests to verify the collection of brewing metrics."""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest 
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim import metrics
+
+from CoffeeSim.helpers import NULL_SINK
+
+from CoffeeSim.models import generic
+
+from CoffeeSim.presets import generic as presets
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_quantiles(self):
+        histogram = metrics.Histogram(growth=1.01)
+        for value in range(1, 1001): histogram.add(value / 1000.0)
+        
+        self.assertEqual(histogram.count, 1000)
+        for fraction in (0.5, 0.95, 0.99): 
+            self.assertAlmostEqual(histogram.quantile(fraction), fraction, delta=0.01 * fraction)
+        self.assertEqual(histogram.quantile(1), 1)
+        self.assertIsNone(metrics.Histogram().quantile(0.5))
+        
+        
+class BrewMetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        class SmallestFirstCoffeemaker(generic.GenericCoffeemaker):
+            def pick_water_sources(self, sources, needed_amt, *args, **kwargs):
+                ordered = sorted(sources.items(), key=lambda item: item[1])
+                return super(SmallestFirstCoffeemaker, self).pick_water_sources(dict(ordered), needed_amt, *args, **kwargs)
+                
+        self.metrics = metrics.BrewMetrics()
+        self.machine = self.metrics.instrument(SmallestFirstCoffeemaker(event_sink=NULL_SINK))
+        
+    def test_collection(self):
+        for preset in (presets.Americano,) * 4: 
+            try: self.machine.brew(preset=preset)
+            except RuntimeError: pass
+        
+        snapshot = self.metrics.snapshot()['SmallestFirstCoffeemaker']
+        self.assertEqual(snapshot['stages']['reserve']['calls'], 4)
+        self.assertEqual(snapshot['stages']['reserve']['failures'], {'WaterExhausted': 1})
+        self.assertEqual(snapshot['stages']['get_water']['calls'], 3)
+        self.assertEqual(snapshot['stages']['get_grounds']['calls'], 3)
+        self.assertEqual(snapshot['stages']['pick_water_sources']['calls'], 3)
+        self.assertEqual(snapshot['stages']['get_extract']['latency']['count'], 3)
+        self.assertGreater(snapshot['stages']['get_extract']['latency']['p99'], 0)
+        self.assertAlmostEqual(snapshot['volumes'][const.COMP_WATER + '[0]'], 3 * presets.Americano.volume)
+        self.assertAlmostEqual(snapshot['volumes'][const.COMP_HEATER + '[0]'], 3 * presets.Americano.volume)
+        
+        self.metrics.enabled = False
+        self.machine.brew(preset=presets.Espresso)
+        self.assertEqual(self.metrics.snapshot()['SmallestFirstCoffeemaker']['stages']['get_water']['calls'], 3)
+        
+        self.metrics.uninstrument(self.machine)
+        self.assertNotIn('get_water', vars(self.machine))
+        self.assertNotIn('remove', vars(self.machine.installed_components[const.COMP_WATER][0]))
+        
+    def test_export(self):
+        self.machine.brew()
+        export_dir = tempfile.mkdtemp()
+        try:
+            with open(self.metrics.export(os.path.join(export_dir, 'metrics.json'))) as exported:
+                self.assertEqual(json.load(exported), json.loads(self.metrics.to_json()))
+            
+            with open(self.metrics.export(os.path.join(export_dir, 'metrics.prom'))) as exported:
+                exported = exported.read()
+            self.assertIn('coffeesim_stage_calls_total{machine="SmallestFirstCoffeemaker",stage="get_water"} 1.0', exported)
+            self.assertIn('coffeesim_stage_seconds{machine="SmallestFirstCoffeemaker",stage="get_water",quantile="0.99"}', exported)
+            
+            with self.assertRaises(ValueError): self.metrics.export(os.path.join(export_dir, 'metrics.txt'), fmt='xml')
+        finally: shutil.rmtree(export_dir)
+        
+        
+def main(): return unittest.main()
+        
+if __name__ == '__main__': main()
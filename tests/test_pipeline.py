@@ -0,0 +1,94 @@
+"""Tests to verify pipelined brewing."""
+
+import unittest 
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim import simulation, pipeline
+
+from CoffeeSim.models import commercial, generic
+
+from CoffeeSim.presets import generic as presets
+
+
+class BrewingPipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        Constants.USE_SOUND_EFFECTS = False
+        
+    def tearDown(self):
+        Constants.USE_SOUND_EFFECTS = True
+        
+    def test_overlapping_stages(self):
+        orders = [(presets.Espresso, None), (presets.Cappucino, None)] * 4
+        serial = simulation.serve(generic.GenericCoffeemaker(), orders)
+        pipelined = pipeline.serve_pipelined(generic.GenericCoffeemaker(), orders)
+        
+        self.assertEqual(len(pipelined.completed), len(orders))
+        self.assertEqual([str(order.result) for order in pipelined.completed], [str(order.result) for order in serial.completed])
+        self.assertLess(pipelined.simulation.now, serial.simulation.now)
+        self.assertGreater(pipelined.cups_per_hour(), serial.cups_per_hour())
+        
+        occupancy = pipelined.occupancy()
+        self.assertEqual(pipelined.bottleneck(), 'extract')
+        self.assertAlmostEqual(occupancy['extract']['blocked'], 0)
+        self.assertGreater(occupancy['grind']['blocked'], 0) # waiting for room in front of the busier stages
+        for stage in occupancy.values(): self.assertAlmostEqual(sum(stage.values()), 1)
+        
+    def test_failures(self):
+        orders = [(presets.Americano, None)] * 5
+        pipelined = pipeline.serve_pipelined(generic.GenericCoffeemaker(), orders, queue_size=2)
+        
+        self.assertEqual(len(pipelined.completed), 3) # 500 mL tank, 150 mL each
+        self.assertEqual(len(pipelined.failed), 2)
+        for order in pipelined.failed: self.assertIsInstance(order.error, RuntimeError)
+        for stage in pipelined.stages: self.assertTrue(stage.idle and not stage.queue)
+        
+    def test_rollback(self):
+        """Verifies an order the water runs out for leaves the beans, the filter and the grounds bin untouched."""
+        machine = generic.GenericCoffeemaker()
+        tank, container = machine.installed_components[const.COMP_WATER][0], machine.installed_components[const.COMP_BEANS][0]
+        tank.remove(tank.contents_volume - 100)
+        others = [machine.installed_components[comptype][0] for comptype in (const.COMP_BEANS, const.COMP_FILTER, const.COMP_GROUNDSBIN)]
+        levels = [component.available for component in others]
+        
+        pipelined = pipeline.serve_pipelined(machine, [(presets.Americano, None)])
+        self.assertEqual(len(pipelined.failed), 1)
+        self.assertEqual([component.available for component in others], levels)
+        self.assertEqual(container.stock, container.capacity)
+        self.assertFalse(any(component.reserved for component in others + [tank]))
+
+    def test_heaters(self):
+        """Verifies each order is heated once, on the heater booked for it."""
+        machine = commercial.DualBoilerCoffeemaker()
+        heaters = machine.installed_components[const.COMP_HEATER]
+        heated = []
+        def counted(heat):
+            def heat_counted(*args, **kwargs):
+                heated.append(heat)
+                return heat(*args, **kwargs)
+            return heat_counted
+        for heater in heaters: heater.heat = counted(heater.heat)
+
+        orders = [(presets.Espresso, None)] * 3
+        pipelined = pipeline.serve_pipelined(machine, orders)
+        self.assertEqual(len(pipelined.completed), 3)
+        self.assertEqual(len(heated), 3)
+        self.assertEqual(sum(pipelined.scheduler.jobs.get(heater, 0) for heater in heaters), 3)
+        self.assertFalse(machine.unit_scheduler.jobs) # booked in simulated time only
+
+    def test_plans(self):
+        """Verifies the pipelined and simulated orders brew from the compiled plans, rather than resolving the extras each time."""
+        orders = [(presets.Cappucino, None), (presets.Crema, None)] * 2
+        for serve in (pipeline.serve_pipelined, simulation.serve):
+            machine = generic.GenericCoffeemaker()
+            for (preset, _) in orders: machine.plan(preset) # compiled once...
+            machine.resolve_extra_handlers = machine.resolve_preset = None # ...and not resolved again
+            served = serve(machine, orders)
+            self.assertEqual([str(order.result) for order in served.completed], [str(generic.GenericCoffeemaker().brew(preset)) for (preset, _) in orders])
+        
+        
+def main(): return unittest.main()
+        
+if __name__ == '__main__': main()
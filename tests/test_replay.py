@@ -0,0 +1,70 @@
+"""Tests to verify the streaming replay of order logs."""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest 
+
+from CoffeeSim import replay
+
+from CoffeeSim.presets import generic as presets
+
+
+class ReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.text_log = os.path.join(self.tmpdir, 'orders.txt')
+        with open(self.text_log, 'w') as log:
+            log.write("# preset, volume, machine\n\nEspresso\nAmericano,180\ncrema,,1\n,50,2\nCappucino\n")
+        
+    def tearDown(self): shutil.rmtree(self.tmpdir)
+        
+    def test_text_orders(self):
+        orders = list(replay.iter_orders(self.text_log))
+        self.assertEqual([order.preset for order in orders], [presets.Espresso, presets.Americano, presets.Crema, None, presets.Cappucino])
+        self.assertEqual([order.volume for order in orders], [None, 180, None, 50, None])
+        self.assertEqual([order.machine for order in orders], [0, 0, 1, 2, 0])
+        
+        self.assertEqual(list(replay.iter_orders(io.StringIO("Espresso\n"))), orders[:1])
+        with self.assertRaises(ValueError): list(replay.iter_orders(io.StringIO("Espresso\nMocha\n")))
+        
+    def test_binary_orders(self):
+        binary_log = os.path.join(self.tmpdir, 'orders.bin')
+        orders = list(replay.iter_orders(self.text_log))
+        self.assertEqual(replay.write_orders(orders, binary_log, fmt='binary'), len(orders))
+        self.assertEqual(list(replay.iter_orders(binary_log)), orders)
+        
+        empty_log = os.path.join(self.tmpdir, 'empty.txt')
+        open(empty_log, 'w').close()
+        self.assertEqual(list(replay.iter_orders(empty_log)), [])
+        
+    def test_replay(self):
+        """Verifies a long replay keeps serving by restocking the machine, and the records stream out."""
+        orders = (replay.Order(number, presets.Espresso, None, 0) for number in range(200))
+        output = io.BytesIO()
+        self.assertEqual(replay.write_records(replay.iter_brew(orders), output, fmt='binary'), 200)
+        
+        records = output.getvalue()[len(replay.RECORD_MAGIC):]
+        self.assertEqual(len(records), 200 * replay.RECORD_FORMAT.size)
+        decoded = list(replay.RECORD_FORMAT.iter_unpack(records))
+        self.assertFalse([record for record in decoded if record[-1]]) # no errors
+        
+        # Without restocking, the orders fail once the tank runs dry:
+        records = list(replay.iter_brew(self.text_log, restock=False))
+        self.assertEqual(len(records), 5)
+        
+        failed = list(replay.iter_brew((replay.Order(number, presets.Americano, None, 0) for number in range(10)), restock=False))
+        self.assertEqual(failed[-1].error, 'WaterExhausted')
+        
+        output = io.BytesIO()
+        replay.write_records(records, output)
+        lines = output.getvalue().decode('utf-8').splitlines()
+        self.assertEqual(lines[0], ",".join(replay.ReplayRecord._fields))
+        self.assertTrue(lines[2].startswith("1,0,Americano,180"))
+        
+        
+def main(): return unittest.main()
+        
+if __name__ == '__main__': main()
@@ -0,0 +1,87 @@
+"""Tests to verify the columnar storage of brewed drinks."""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest 
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim import results, comestibles
+
+from CoffeeSim.helpers import NULL_SINK
+
+from CoffeeSim.models import generic
+
+from CoffeeSim.presets import generic as presets
+
+
+class ResultStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = results.ResultStore()
+        self.machine = generic.GenericCoffeemaker(event_sink=NULL_SINK)
+        self.orders = [presets.Crema, presets.Cappucino, presets.Crema, None]
+        self.brews = [self.machine.brew(preset=preset, results=self.store) for preset in self.orders]
+        
+    def test_append(self):
+        self.assertEqual(len(self.store), len(self.orders))
+        crema, cappucino = self.store.row(0), self.store.row(1)
+        self.assertEqual(crema.preset, 'Crema')
+        self.assertEqual(crema.extras, (const.EXTRA_CREMA,))
+        self.assertEqual(cappucino.extras, (const.EXTRA_MILKFOAM,))
+        self.assertEqual(self.store.row(3).preset, results.DEFAULT_PRESET)
+        self.assertEqual([(row.volume, row.temperature, row.caffeine) for row in self.store.rows()],
+                         [(brew.volume, brew.temperature, brew.caffeine_content) for brew in self.brews])
+        
+        other = generic.GenericCoffeemaker(event_sink=NULL_SINK)
+        other.machine_id = 7
+        brews, failures = other.brew_many([(presets.Americano, None), (presets.Americano, 50)], results=self.store)
+        self.assertEqual([row.machine for row in self.store.rows()][-2:], [7, 7])
+        self.assertEqual(self.store.row(5).volume, 50)
+        
+    def test_classification(self):
+        self.assertEqual(self.store.strengths(), [comestibles.describe_strength(brew.caffeine_content) for brew in self.brews])
+        self.assertEqual(self.store.warmths(), [comestibles.describe_warmth(brew.temperature) for brew in self.brews])
+        self.assertEqual(list(results.classify([0, 5, 6, 60, 1000], comestibles.STRENGTH_INDEX)), [0, 0, 1, 2, 3])
+        
+    def test_aggregate(self):
+        by_preset = self.store.aggregate(by='preset', column='caffeine')
+        self.assertEqual(list(by_preset), ['Crema', 'Cappucino', results.DEFAULT_PRESET])
+        cremas = [brew.caffeine_content for (preset, brew) in zip(self.orders, self.brews) if preset is presets.Crema]
+        self.assertEqual(by_preset['Crema']['count'], 2)
+        self.assertAlmostEqual(by_preset['Crema']['mean'], sum(cremas) / 2)
+        self.assertAlmostEqual(by_preset['Crema']['max'], max(cremas))
+        
+        by_extras = self.store.aggregate(by='extras', column='volume', stats=('count',))
+        self.assertEqual(by_extras, {(): {'count': 1}, (const.EXTRA_CREMA,): {'count': 2}, (const.EXTRA_MILKFOAM,): {'count': 1}})
+        self.assertEqual(sum(group['count'] for group in self.store.aggregate(by='strength').values()), len(self.orders))
+        self.assertEqual(list(self.store.aggregate(by='machine', column='temperature')), [0])
+        with self.assertRaises(ValueError): self.store.aggregate(by='colour')
+        with self.assertRaises(ValueError): self.store.aggregate(stats=('median',))
+        self.assertEqual(results.ResultStore().aggregate(), {})
+        
+    def test_export(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = self.store.save(os.path.join(temp_dir, 'results.bin'))
+            loaded = results.ResultStore.load(path)
+        finally: shutil.rmtree(temp_dir)
+        self.assertEqual(list(loaded.rows()), list(self.store.rows()))
+        loaded.append(self.brews[0], preset='Crema', extras=[const.EXTRA_MILK])
+        self.assertEqual(loaded.row(len(self.orders)).extras, (const.EXTRA_MILK,))
+        with self.assertRaises(ValueError): results.ResultStore.from_bytes(b'NOPE' + bytes(16))
+        
+        output = io.StringIO()
+        self.store.write_csv(output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], "preset,volume,temperature,caffeine,extras,machine")
+        self.assertTrue(lines[1].startswith("Crema,") and ",crema," in lines[1])
+        self.assertEqual(len(lines), len(self.orders) + 1)
+        
+        
+def main(): return unittest.main()
+        
+if __name__ == '__main__': main()
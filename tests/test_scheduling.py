@@ -0,0 +1,84 @@
+"""Tests to verify the scheduling of work over several grinders and heaters."""
+
+import unittest 
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim import scheduling, simulation
+
+from CoffeeSim.helpers import NULL_SINK
+
+from CoffeeSim.models import generic, commercial
+
+from CoffeeSim.presets import generic as presets
+
+
+class UnitSchedulerTest(unittest.TestCase):
+
+    def test_least_loaded(self):
+        scheduler = scheduling.UnitScheduler()
+        units = ['first', 'second']
+        self.assertEqual(scheduler.pick(units), 'first') # ties go to the first unit
+        scheduler.book('first', 10)
+        self.assertEqual(scheduler.pick(units), 'second')
+        scheduler.book('second', 30)
+        self.assertEqual(scheduler.pick(units), 'first')
+        
+        scheduler.claim('first') # running jobs count before the booked durations
+        self.assertEqual(scheduler.pick(units), 'second')
+        scheduler.release('first')
+        self.assertEqual(scheduler.pick(units), 'first')
+        self.assertIsNone(scheduler.pick([]))
+        
+    def test_soonest_available(self):
+        clock = [0]
+        scheduler = scheduling.UnitScheduler(clock=lambda: clock[0])
+        units = ['first', 'second']
+        self.assertEqual(scheduler.book('first', 10), (0, 10))
+        self.assertEqual(scheduler.book('first', 10), (10, 20)) # waits for the previous job
+        self.assertEqual(scheduler.pick(units), 'second')
+        self.assertEqual(scheduler.book('second', 30), (0, 30))
+        self.assertEqual(scheduler.pick(units), 'first')
+        
+        clock[0] = 40
+        self.assertEqual(scheduler.utilization(units), [0.5, 0.75])
+        self.assertEqual(scheduler.book('second', 5), (40, 45))
+        
+        
+class MultiUnitBrewingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.machine = commercial.MultiGroupCoffeemaker(event_sink=NULL_SINK)
+        
+    def test_brewing_spreads_work(self):
+        for preset in (presets.Espresso, presets.Espresso, presets.Americano):
+            self.machine.brew(preset=preset)
+        scheduler = self.machine.unit_scheduler
+        for comptype in (const.COMP_GRINDER, const.COMP_HEATER):
+            self.assertEqual([scheduler.jobs.get(unit) for unit in self.machine.installed_components[comptype]], [2, 1])
+            
+        brews, failures = self.machine.brew_many([(presets.Espresso, None)] * 4)
+        self.assertFalse(failures)
+        self.assertEqual([scheduler.jobs.get(grinder) for grinder in self.machine.installed_components[const.COMP_GRINDER]], [4, 3])
+        self.assertEqual([str(brew) for brew in brews], [str(generic.GenericCoffeemaker(event_sink=NULL_SINK).brew(preset=presets.Espresso))] * 4)
+        
+    def test_simulated_throughput(self):
+        orders = [(presets.Espresso, None)] * 4
+        single = simulation.serve(generic.GenericCoffeemaker(event_sink=NULL_SINK), orders)
+        multi = simulation.serve(self.machine, orders)
+        
+        self.assertEqual(multi.concurrency, 2)
+        self.assertEqual(len(multi.completed), 4)
+        self.assertAlmostEqual(multi.simulation.now, single.simulation.now / 2)
+        self.assertEqual([order.wait_time for order in multi.completed[:2]], [0, 0]) # brewed side by side
+        
+        unit_utilization = multi.unit_utilization()
+        self.assertEqual(len(unit_utilization[const.COMP_HEATER]), 2)
+        self.assertAlmostEqual(*unit_utilization[const.COMP_HEATER])
+        self.assertAlmostEqual(unit_utilization[const.COMP_HEATER][0], single.unit_utilization()[const.COMP_HEATER][0])
+        
+        
+def main(): return unittest.main()
+        
+if __name__ == '__main__': main()
@@ -0,0 +1,74 @@
+"""Tests to verify the discrete-event simulation of coffeemakers."""
+
+import unittest 
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim import simulation
+
+from CoffeeSim.models import generic
+
+from CoffeeSim.presets import generic as presets
+
+
+class SimulationTest(unittest.TestCase):
+
+    def test_event_order(self):
+        sim = simulation.Simulation()
+        log = []
+        sim.schedule(5, log.append, 'late')
+        sim.schedule(1, log.append, 'early')
+        sim.schedule(1, log.append, 'early, but scheduled second')
+        sim.schedule(1, sim.schedule, 10, log.append, 'scheduled by an event')
+        
+        self.assertEqual(sim.run(until=4), 4)
+        self.assertEqual(log, ['early', 'early, but scheduled second'])
+        self.assertEqual(sim.pending, 2)
+        
+        sim.run()
+        self.assertEqual(log[2:], ['late', 'scheduled by an event'])
+        self.assertEqual(sim.now, 11)
+        with self.assertRaises(ValueError): sim.schedule_at(1, log.append, 'too late')
+        
+        
+class BrewingStationTest(unittest.TestCase):
+
+    def setUp(self):
+        Constants.USE_SOUND_EFFECTS = False
+        self.machine = generic.GenericCoffeemaker()
+        
+    def tearDown(self):
+        Constants.USE_SOUND_EFFECTS = True
+        
+    def test_espresso_timeline(self):
+        station = simulation.serve(self.machine, [(presets.Espresso, None)] * 2)
+        first, second = station.completed
+        
+        water_vol = presets.Espresso.volume
+        expected_time = sum((
+            water_vol / float(self.machine.installed_components[const.COMP_WATER][0].pour_rate),
+            self.machine.strength2amt[const.STRENGTH_HIGH] / float(self.machine.installed_components[const.COMP_GRINDER][0].grind_rate),
+            self.machine.installed_components[const.COMP_HEATER][0].heat_duration(items=[self.machine.materials.Water(volume=water_vol)], 
+                                                                                  target_temp=self.machine.brew_temperature),
+            self.machine.pressure2time[const.PRESSURE_HIGH],
+        ))
+        self.assertAlmostEqual(first.brew_time, expected_time)
+        self.assertAlmostEqual(second.wait_time, expected_time) # queued behind the first order
+        self.assertAlmostEqual(station.simulation.now, 2 * expected_time)
+        self.assertAlmostEqual(station.utilization(), 1)
+        self.assertEqual(str(first.result), str(generic.GenericCoffeemaker().brew(preset=presets.Espresso)))
+        
+    def test_failures_and_throughput(self):
+        orders = [(presets.Cappucino, None), (presets.Americano, None)] * 5
+        station = simulation.serve(self.machine, orders, interval=60)
+        
+        self.assertEqual(len(station.completed) + len(station.failed), len(orders))
+        self.assertTrue(station.failed) # the tank runs dry eventually
+        for order in station.failed: self.assertIsInstance(order.error, RuntimeError)
+        self.assertGreater(station.cups_per_hour(), 0)
+        
+        
+def main(): return unittest.main()
+        
+if __name__ == '__main__': main()
@@ -0,0 +1,66 @@
+"""Tests to verify parameter sweeps."""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import CoffeeSim.Constants as Constants
+const = Constants.Unlocalized
+
+from CoffeeSim import sweep
+
+from CoffeeSim.presets import generic as presets
+
+
+class SweepTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.temp_dir, 'cache.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_grid(self):
+        cells = sweep.expand_grid({'preset': ['espresso', 'americano'], 'volume': [50, 100]})
+        self.assertEqual([tuple(cell.values()) for cell in cells], [('espresso', 50), ('espresso', 100), ('americano', 50), ('americano', 100)])
+
+        with self.assertRaises(ValueError): sweep.expand_grid({'colour': ['black']})
+        with self.assertRaises(ValueError): sweep.expand_grid({'preset': ['random'], 'volume': [50]})
+        with self.assertRaises(ValueError): sweep.expand_grid({'preset': ['mochaccino']})
+
+        self.assertEqual(sweep.parse_values("volume=50, 2.5,big"), ('volume', [50, 2.5, 'big']))
+
+    def test_cells(self):
+        preset = sweep.cell_preset({'preset': 'espresso', 'volume': 80, 'extras': 'crema+milk'})
+        self.assertTrue(issubclass(preset, presets.Espresso))
+        self.assertEqual((preset.volume, preset.extras), (80, ('crema', 'milk')))
+        self.assertIs(preset, sweep.cell_preset({'preset': 'espresso', 'volume': 80, 'extras': 'crema+milk'}))
+        self.assertIs(sweep.cell_preset({'preset': 'espresso'}), presets.Espresso)
+
+        machine_type = sweep.cell_machine_type({'tanks': 2, 'preset': 'espresso'})
+        self.assertEqual(len(machine_type().installed_components[const.COMP_WATER]), 2)
+
+        result = sweep.run_cell({'preset': 'americano', 'tanks': 2}, cups=10, seed=1)
+        self.assertEqual((result.served, result.failed), (10, 0))
+        self.assertEqual(result, sweep.run_cell({'preset': 'americano', 'tanks': 2}, cups=10, seed=1))
+
+    def test_sweep(self):
+        grid = {'preset': ['espresso', 'random'], 'tanks': [1, 2]}
+        first = list(sweep.iter_sweep(grid, cups=5, processes=1, cache=self.cache_path))
+        self.assertEqual(sorted(idx for (idx, _, _, _) in first), [0, 1, 2, 3])
+        self.assertFalse(any(cached for (_, _, _, cached) in first))
+
+        second = list(sweep.iter_sweep(grid, cups=5, processes=1, cache=self.cache_path))
+        self.assertTrue(all(cached for (_, _, _, cached) in second))
+        self.assertEqual(sorted(outcome[:3] for outcome in first), sorted(outcome[:3] for outcome in second))
+
+        output = io.StringIO()
+        rows = sweep.run_sweep(grid, output=output, cups=5, processes=1, cache=self.cache_path)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0].split(',')[:4], ['preset', 'tanks', 'served', 'failed'])
+        self.assertEqual(len(lines), len(rows) + 1)
+        self.assertEqual(rows[1]['tanks'], 2)
+